@@ -0,0 +1,247 @@
+"""
+Delivery of pending UserNotifications through the registered senders.
+Used by the send_notifications command and the notifications worker.
+
+Concurrent senders (NotificationSender.concurrent) are sent from a thread
+pool: the deliveries are prepared and recorded at this thread (database)
+and the threads just transmit, one task per channel (chat) to keep the
+order of its messages. Rate limits are up to each sender.
+All the items of a channel share one instance: after a failed transmit the
+thread waits for it to be recorded and stops if finish deactivated the
+channel (e.g. telegram 403), the rest of its deliveries are left pending.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import queue
+import threading
+from django.conf import settings
+from django.db.models import Q, Exists, OuterRef
+
+from subscriptions.models import UserNotification
+from channels.models import ChannelDelivery, TelegramChannel
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_pending_notifications(limit, retry_failed=False, max_retries=3):
+    """
+    Get notifications that need delivery.
+
+    A notification needs delivery if:
+    1. User has active channels AND
+    2. Either no delivery record exists for that channel type, OR
+    3. (if retry_failed) delivery failed and retry_count < max_retries
+    """
+    # Get users with active Telegram channels
+    users_with_telegram = TelegramChannel.objects.filter(
+        is_active=True,
+        is_verified=True
+    ).values_list('user_id', flat=True)
+
+    # Base query: notifications for users with active channels
+    notifications = UserNotification.objects.filter(
+        user_id__in=users_with_telegram
+    ).select_related('user')
+
+    if retry_failed:
+        # Include notifications that have failed deliveries under retry limit
+        notifications = notifications.filter(
+            Q(deliveries__isnull=True) |  # No delivery attempted
+            Q(
+                deliveries__status=ChannelDelivery.STATUS_PENDING
+            ) |
+            Q(
+                deliveries__status=ChannelDelivery.STATUS_FAILED,
+                deliveries__retry_count__lt=max_retries
+            )
+        ).distinct()
+    else:
+        # Only notifications without successful delivery to telegram
+        has_telegram_delivery = ChannelDelivery.objects.filter(
+            notification=OuterRef('pk'),
+            channel_type='telegram',
+            status=ChannelDelivery.STATUS_SENT
+        )
+        notifications = notifications.annotate(
+            has_delivery=Exists(has_telegram_delivery)
+        ).filter(has_delivery=False)
+
+    return notifications.order_by('created_at')[:limit]
+
+
+def send_notifications(notifications, senders, report=None, workers=None):
+    """
+    Send each notification with all the senders.
+    report(notification, channel_type, delivery, error) is called for
+    each delivery (or error) if given.
+    workers: threads for concurrent senders (default NOTIFICATIONS_DELIVERY_WORKERS)
+    Returns the number of deliveries sent and failed.
+    """
+    workers = settings.NOTIFICATIONS_DELIVERY_WORKERS if workers is None else workers
+    if workers <= 1:
+        return send_serially(notifications, senders, report)
+
+    notifications = list(notifications)
+    concurrent = {k: v for k, v in senders.items() if v.concurrent}
+    others = {k: v for k, v in senders.items() if not v.concurrent}
+    sent, failed = send_concurrently(notifications, concurrent, workers, report)
+    if others:
+        others_sent, others_failed = send_serially(notifications, others, report)
+        sent += others_sent
+        failed += others_failed
+    return sent, failed
+
+
+def send_serially(notifications, senders, report=None):
+    """
+    One delivery after the other (sender.send_to_user).
+    """
+    sent = failed = 0
+    for notification in notifications:
+        for channel_type, sender in senders.items():
+            try:
+                deliveries = sender.send_to_user(notification.user, notification)
+            except Exception as e:
+                logger.exception(f"Error processing notification {notification.id}")
+                failed += 1
+                if report:
+                    report(notification, channel_type, None, e)
+                continue
+
+            for delivery in deliveries:
+                if delivery.status == ChannelDelivery.STATUS_SENT:
+                    sent += 1
+                elif delivery.status == ChannelDelivery.STATUS_FAILED:
+                    failed += 1
+                if report:
+                    report(notification, channel_type, delivery, None)
+    return sent, failed
+
+
+def send_concurrently(notifications, senders, workers, report=None):
+    """
+    Transmit from a thread pool, the database work stays at this thread.
+    """
+    by_channel, failed = group_by_channel(notifications, senders, report)
+    results = queue.Queue()
+    # set if this thread stops recording, the threads must not wait for it
+    aborted = threading.Event()
+    pending = sum(len(items) for items in by_channel.values())
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delivery') as pool:
+        for items in by_channel.values():
+            pool.submit(transmit_items, items, results, aborted)
+        try:
+            sent, record_failed = record_results(results, pending, report)
+        finally:
+            aborted.set()
+    return sent, failed + record_failed
+
+
+def group_by_channel(notifications, senders, report=None):
+    """
+    Prepare the deliveries not sent yet grouped by channel, each channel
+    keeps the order of its notifications and one shared instance.
+    Returns {(channel_type, channel id): [item]} and the number of errors,
+    item is (channel_type, sender, channel, notification, delivery, payload).
+    """
+    failed = 0
+    by_channel = defaultdict(list)
+    # (channel_type, channel id) -> the channel instance shared by its items
+    channels = {}
+    for notification in notifications:
+        for channel_type, sender in senders.items():
+            try:
+                for channel in sender.get_active_channels(notification.user):
+                    channel = channels.setdefault((channel_type, channel.id), channel)
+                    delivery = sender.get_delivery(channel, notification)
+                    if delivery.status == ChannelDelivery.STATUS_SENT:
+                        continue
+                    payload = sender.prepare(channel, notification)
+                    by_channel[(channel_type, channel.id)].append(
+                        (channel_type, sender, channel, notification, delivery, payload)
+                    )
+            except Exception as e:
+                logger.exception(f"Error processing notification {notification.id}")
+                failed += 1
+                if report:
+                    report(notification, channel_type, None, e)
+    return by_channel, failed
+
+
+def transmit_items(items, results, aborted, wait_timeout=1):
+    """
+    Transmit the items of one channel (delivery thread), each result is put
+    at results as (items, result, error, recorded).
+    """
+    for n, item in enumerate(items):
+        _, sender, channel, _, _, payload = item
+        if aborted.is_set():
+            return
+        if not channel.is_active:
+            # deactivated at finish, skip the rest of this channel
+            results.put((items[n:], None, None, None))
+            return
+        try:
+            result = sender.transmit(channel, payload)
+            success = result.get('success')
+        except Exception as e:
+            results.put(([item], None, e, None))
+            continue
+        if success:
+            results.put(([item], result, None, None))
+        else:
+            # wait for finish, it can deactivate the channel
+            recorded = threading.Event()
+            results.put(([item], result, None, recorded))
+            while not recorded.wait(wait_timeout) and not aborted.is_set():
+                pass
+
+
+def record_results(results, pending, report=None):
+    """
+    finish and record each result as soon as it arrives (this thread),
+    until the pending items are done. Returns the number sent and failed.
+    """
+    sent = failed = 0
+    while pending:
+        items, result, error, recorded = results.get()
+        pending -= len(items)
+        if result is None and error is None:
+            # skipped, the deliveries stay pending
+            continue
+        channel_type, _, _, notification, _, _ = items[0]
+        try:
+            delivery = record_result(items[0], result, error)
+        except Exception as e:
+            logger.exception(f"Error recording notification {notification.id}")
+            delivery, error = None, e
+        finally:
+            if recorded is not None:
+                recorded.set()
+
+        if delivery is not None and delivery.status == ChannelDelivery.STATUS_SENT:
+            sent += 1
+        else:
+            failed += 1
+        if report:
+            try:
+                report(notification, channel_type, delivery, None if delivery else error)
+            except Exception:
+                logger.exception(f"Error reporting notification {notification.id}")
+    return sent, failed
+
+
+def record_result(item, result, error):
+    """
+    sender.finish (if transmitted) and sender.record_delivery of an item.
+    """
+    _, sender, channel, notification, delivery, payload = item
+    if error is None:
+        try:
+            sender.finish(channel, notification, payload, result)
+        except Exception:
+            # it was sent anyway
+            logger.exception(f"Error after sending notification {notification.id}")
+    return sender.record_delivery(delivery, channel, notification, result=result, error=error)
@@ -0,0 +1,206 @@
+"""
+Benchmark the notifications delivery against a local fake Telegram Bot API.
+
+Creates users with Telegram channels and pending notifications, sends them
+with each --workers value (1 = one by one) and reports messages per second,
+HTTP connections opened (keep-alive) and the rates seen by the fake server.
+The benchmark data is deleted at the end.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from channels.delivery import send_notifications
+from channels.models import ChannelDelivery, TelegramChannel, TelegramMessage
+from channels.services.telegram import TelegramSender
+from subscriptions.models import UserNotification
+
+
+USERNAME_PREFIX = 'bench-tg-'
+CHAT_ID_BASE = 9 * 10 ** 12
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # default 5, the first connections of many workers would be retried (1s late)
+    request_queue_size = 256
+
+
+class FakeBotAPI:
+    """ Answers sendMessage after some latency.
+        Every flood_every messages answers 429 with retry_after """
+
+    def __init__(self, latency=0.05, flood_every=0, retry_after=1):
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.messages = []  # (time, chat_id)
+        self.connections = 0
+        self.floods = 0
+        self.lock = threading.Lock()
+        self.server = FakeServer(('127.0.0.1', 0), self.handler_class())
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/bot'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with api.lock:
+                    api.connections += 1
+
+            def do_POST(self):
+                received = time.monotonic()
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                time.sleep(api.latency)
+                with api.lock:
+                    flood = api.flood_every and (len(api.messages) + api.floods + 1) % api.flood_every == 0
+                    if flood:
+                        api.floods += 1
+                    else:
+                        api.messages.append((received, payload.get('chat_id')))
+                    message_id = len(api.messages)
+
+                if flood:
+                    status = 429
+                    data = {
+                        'ok': False,
+                        'error_code': 429,
+                        'description': f'Too Many Requests: retry after {api.retry_after}',
+                        'parameters': {'retry_after': api.retry_after},
+                    }
+                else:
+                    status = 200
+                    data = {'ok': True, 'result': {'message_id': message_id}}
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def max_per_second(self):
+        """ Max messages received in one second """
+        times = sorted(t for t, _ in self.messages)
+        best = start = 0
+        for end, t in enumerate(times):
+            while t - times[start] >= 1:
+                start += 1
+            best = max(best, end - start + 1)
+        return best
+
+    def min_chat_interval(self):
+        """ Min seconds between two messages to the same chat """
+        by_chat = {}
+        for t, chat_id in self.messages:
+            by_chat.setdefault(chat_id, []).append(t)
+        intervals = [
+            b - a
+            for times in by_chat.values()
+            for a, b in zip(sorted(times), sorted(times)[1:])
+        ]
+        return min(intervals) if intervals else None
+
+
+class Command(BaseCommand):
+    help = 'Measure the Telegram notifications delivery against a local fake Bot API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notifications', nargs='?', type=int, default=1000)
+        parser.add_argument('--chats', nargs='?', type=int, default=250)
+        parser.add_argument('--workers', nargs='?', type=str, default='1,16', help='Comma separated list, one run for each')
+        parser.add_argument('--latency', nargs='?', type=float, default=0.05, help='Seconds the fake API takes to answer')
+        parser.add_argument('--rate', nargs='?', type=float, default=None, help='Messages per second (default TELEGRAM_RATE_LIMIT)')
+        parser.add_argument('--chat-rate', nargs='?', type=float, default=None, help='Messages per second to a chat (default TELEGRAM_CHAT_RATE_LIMIT)')
+        parser.add_argument('--flood-every', nargs='?', type=int, default=0, help='Answer 429 to one of each N messages (0 = never)')
+        parser.add_argument('--retry-after', nargs='?', type=int, default=1, help='retry_after for the 429 answers')
+
+    def handle(self, *args, **options):
+        rate = options['rate'] or settings.TELEGRAM_RATE_LIMIT
+        chat_rate = options['chat_rate'] or settings.TELEGRAM_CHAT_RATE_LIMIT
+        self.cleanup()
+        notifications = self.create_data(options['notifications'], options['chats'])
+        self.stdout.write(
+            f"{len(notifications)} notifications to {options['chats']} chats, "
+            f"{rate} msg/s ({chat_rate} per chat), API latency {options['latency'] * 1000:.0f}ms"
+        )
+        try:
+            for workers in [int(w) for w in options['workers'].split(',') if w.strip()]:
+                ChannelDelivery.objects.filter(notification__in=notifications).delete()
+                TelegramMessage.objects.filter(chat_id__gte=CHAT_ID_BASE).delete()
+                self.run(notifications, workers, rate, chat_rate, options)
+        finally:
+            self.cleanup()
+
+    def run(self, notifications, workers, rate, chat_rate, options):
+        api = FakeBotAPI(options['latency'], options['flood_every'], options['retry_after'])
+        api.start()
+        sender = TelegramSender(rate=rate, chat_rate=chat_rate, pool_size=workers)
+        try:
+            with override_settings(TELEGRAM_API_BASE=api.url, TELEGRAM_BOT_TOKEN='benchmark'):
+                started = time.perf_counter()
+                sent, failed = send_notifications(notifications, {'telegram': sender}, workers=workers)
+                elapsed = time.perf_counter() - started
+        finally:
+            api.stop()
+
+        min_interval = api.min_chat_interval()
+        self.stdout.write(self.style.SUCCESS(
+            f"workers {workers}: {sent} sent, {failed} failed in {elapsed:.1f}s = {sent / elapsed:.1f} msg/s, "
+            f"{api.connections} connections, {api.floods} answered 429\n"
+            f"  max {api.max_per_second()} msg in a second, "
+            f"min interval to a chat {'-' if min_interval is None else f'{min_interval:.2f}s'}"
+        ))
+
+    def create_data(self, notifications, chats):
+        users = User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}{n}', is_active=True) for n in range(chats)
+        ])
+        # bulk_create returns ids just in some databases
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id'))
+        TelegramChannel.objects.bulk_create([
+            TelegramChannel(user=user, chat_id=CHAT_ID_BASE + n, is_active=True, is_verified=True)
+            for n, user in enumerate(users)
+        ])
+        UserNotification.objects.bulk_create([
+            UserNotification(
+                user=users[n % len(users)],
+                title=f'Benchmark notification {n}',
+                event_data={'description': f'El dominio bench{n}.com.ar cayó y está disponible'},
+            )
+            for n in range(notifications)
+        ])
+        return list(
+            UserNotification.objects.filter(user__username__startswith=USERNAME_PREFIX)
+            .select_related('user').order_by('id')
+        )
+
+    def cleanup(self):
+        """ Remove the benchmark data """
+        TelegramMessage.objects.filter(chat_id__gte=CHAT_ID_BASE).delete()
+        # notifications, deliveries and channels are deleted in cascade
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
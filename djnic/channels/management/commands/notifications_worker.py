@@ -0,0 +1,75 @@
+"""
+Long running process for the notifications: process the new events and
+send the pending notifications in a loop (see channels.worker).
+Replaces the process_events and send_notifications cron jobs, run it
+with supervisor (server/supervidor/nic.conf).
+
+SIGTERM / SIGINT finish the current loop and exit.
+"""
+import logging
+import signal
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from channels.worker import Worker
+# Import to register the sender
+from channels.services.telegram import telegram_sender  # noqa
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Process events and send notifications in a loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events-limit', type=int, default=1000, help='Events processed in each loop (default: 1000)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Events processed together (default: 500)')
+        parser.add_argument('--limit', type=int, default=100, help='Notifications sent in each loop (default: 100)')
+        parser.add_argument('--max-retries', type=int, default=3, help='Maximum retry attempts for failed deliveries (default: 3)')
+        parser.add_argument('--workers', type=int, default=None, help='Threads sending messages (default: settings.NOTIFICATIONS_DELIVERY_WORKERS)')
+        parser.add_argument('--min-wait', type=float, default=1, help='Seconds to wait when idle, doubled up to --max-wait')
+        parser.add_argument('--max-wait', type=float, default=30, help='Max seconds between loops when idle')
+        parser.add_argument('--no-listen', action='store_true', help="Don't use LISTEN/NOTIFY (PostgreSQL), just poll")
+        parser.add_argument('--max-loops', type=int, default=0, help='Stop after N loops (0 = run until stopped)')
+        parser.add_argument('--wait-lock', action='store_true', help='Wait for another instance to finish instead of exiting')
+        parser.add_argument('--quiet', action='store_true', help='Just report loops with some work')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            events_limit=options['events_limit'],
+            batch_size=options['batch_size'],
+            notifications_limit=options['limit'],
+            max_retries=options['max_retries'],
+            min_wait=options['min_wait'],
+            max_wait=options['max_wait'],
+            listen=not options['no_listen'],
+            workers=options['workers'],
+        )
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        self.quiet = options['quiet']
+
+        started = time.monotonic()
+        while not worker.run(max_loops=options['max_loops'], report=self.report):
+            if not options['wait_lock']:
+                raise CommandError('Another notifications worker (or process_events / send_notifications) is running')
+            worker.stopped.wait(worker.backoff.max_wait)
+            if worker.stopped.is_set():
+                break
+
+        totals = worker.totals
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{worker.loops} loops in {elapsed:.0f}s: {totals['events']} events, "
+            f"{totals['notifications']} notifications, {totals['sent']} sent, "
+            f"{totals['failed']} failed, {totals['errors']} errors"
+        ))
+
+    def report(self, metrics):
+        if self.quiet and not (metrics['events'] or metrics['sent'] or metrics['failed']):
+            return
+        self.stdout.write(
+            'Loop {loop}: {events} events ({notifications} notifications) in {fanout_time:.2f}s, '
+            '{sent} sent {failed} failed in {delivery_time:.2f}s, waited {waited:.1f}s'.format(**metrics)
+        )
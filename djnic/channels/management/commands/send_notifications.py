@@ -7,13 +7,14 @@ This command:
 3. Creates ChannelDelivery records to track status
 
 Run via cron, e.g.: */1 * * * * cd /path/to/project && python manage.py send_notifications
+or keep the notifications_worker command running (both can't run at the same time).
 """
 import logging
 from django.core.management.base import BaseCommand
-from django.db.models import Q, Exists, OuterRef
 
-from subscriptions.models import UserNotification
-from channels.models import ChannelDelivery, TelegramChannel
+from core.locks import InstanceLock, LockHeld
+from channels.delivery import get_pending_notifications, send_notifications
+from channels.models import ChannelDelivery
 from channels.services import NotificationRegistry
 # Import to register the sender
 from channels.services.telegram import telegram_sender  # noqa
@@ -54,8 +55,26 @@ class Command(BaseCommand):
             default=3,
             help='Maximum retry attempts for failed deliveries (default: 3)'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Threads sending messages (default: settings.NOTIFICATIONS_DELIVERY_WORKERS, 1 = one by one)'
+        )
 
     def handle(self, *args, **options):
+        if options['dry_run']:
+            self.send(**options)
+            return
+
+        try:
+            # the notifications worker (or another run) could be sending the same notifications
+            with InstanceLock('send_notifications'):
+                self.send(**options)
+        except LockHeld as e:
+            self.stdout.write(self.style.WARNING(str(e)))
+
+    def send(self, **options):
         limit = options['limit']
         channel_filter = options['channel']
         dry_run = options['dry_run']
@@ -66,7 +85,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('DRY RUN - No notifications will be sent'))
 
         # Get notifications that need delivery
-        notifications = self.get_pending_notifications(
+        notifications = get_pending_notifications(
             limit=limit,
             retry_failed=retry_failed,
             max_retries=max_retries
@@ -78,51 +97,23 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Processing {len(notifications)} notifications...')
 
-        sent_count = 0
-        failed_count = 0
-
         senders = NotificationRegistry.get_all_senders()
         if channel_filter:
             senders = {k: v for k, v in senders.items() if k == channel_filter}
 
-        for notification in notifications:
-            for channel_type, sender in senders.items():
-                try:
-                    if dry_run:
-                        channels = sender.get_active_channels(notification.user)
-                        for channel in channels:
-                            self.stdout.write(
-                                f"  Would send notification {notification.id} "
-                                f"to {channel_type} channel {channel.id}"
-                            )
-                    else:
-                        deliveries = sender.send_to_user(notification.user, notification)
-                        for delivery in deliveries:
-                            if delivery.status == ChannelDelivery.STATUS_SENT:
-                                sent_count += 1
-                                self.stdout.write(
-                                    self.style.SUCCESS(
-                                        f"Sent notification {notification.id} "
-                                        f"via {channel_type}"
-                                    )
-                                )
-                            elif delivery.status == ChannelDelivery.STATUS_FAILED:
-                                failed_count += 1
-                                self.stdout.write(
-                                    self.style.ERROR(
-                                        f"Failed notification {notification.id} "
-                                        f"via {channel_type}: {delivery.error_message}"
-                                    )
-                                )
-
-                except Exception as e:
-                    logger.exception(f"Error processing notification {notification.id}")
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f"Error processing notification {notification.id}: {e}"
+        if dry_run:
+            for notification in notifications:
+                for channel_type, sender in senders.items():
+                    for channel in sender.get_active_channels(notification.user):
+                        self.stdout.write(
+                            f"  Would send notification {notification.id} "
+                            f"to {channel_type} channel {channel.id}"
                         )
-                    )
-                    failed_count += 1
+            return
+
+        sent_count, failed_count = send_notifications(
+            notifications, senders, report=self.report, workers=options['workers']
+        )
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -130,47 +121,24 @@ class Command(BaseCommand):
             )
         )
 
-    def get_pending_notifications(self, limit, retry_failed, max_retries):
-        """
-        Get notifications that need delivery.
-
-        A notification needs delivery if:
-        1. User has active channels AND
-        2. Either no delivery record exists for that channel type, OR
-        3. (if retry_failed) delivery failed and retry_count < max_retries
-        """
-        # Get users with active Telegram channels
-        users_with_telegram = TelegramChannel.objects.filter(
-            is_active=True,
-            is_verified=True
-        ).values_list('user_id', flat=True)
-
-        # Base query: notifications for users with active channels
-        notifications = UserNotification.objects.filter(
-            user_id__in=users_with_telegram
-        )
-
-        if retry_failed:
-            # Include notifications that have failed deliveries under retry limit
-            notifications = notifications.filter(
-                Q(deliveries__isnull=True) |  # No delivery attempted
-                Q(
-                    deliveries__status=ChannelDelivery.STATUS_PENDING
-                ) |
-                Q(
-                    deliveries__status=ChannelDelivery.STATUS_FAILED,
-                    deliveries__retry_count__lt=max_retries
+    def report(self, notification, channel_type, delivery, error):
+        if error is not None:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"Error processing notification {notification.id}: {error}"
+                )
+            )
+        elif delivery.status == ChannelDelivery.STATUS_SENT:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Sent notification {notification.id} "
+                    f"via {channel_type}"
+                )
+            )
+        elif delivery.status == ChannelDelivery.STATUS_FAILED:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"Failed notification {notification.id} "
+                    f"via {channel_type}: {delivery.error_message}"
                 )
-            ).distinct()
-        else:
-            # Only notifications without successful delivery to telegram
-            has_telegram_delivery = ChannelDelivery.objects.filter(
-                notification=OuterRef('pk'),
-                channel_type='telegram',
-                status=ChannelDelivery.STATUS_SENT
             )
-            notifications = notifications.annotate(
-                has_delivery=Exists(has_telegram_delivery)
-            ).filter(has_delivery=False)
-
-        return notifications.order_by('created_at')[:limit]
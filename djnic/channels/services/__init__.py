@@ -8,6 +8,7 @@ import logging
 from abc import ABC, abstractmethod
 from typing import Optional, Dict, Any, List
 
+from django.db.models import F
 from django.utils import timezone
 
 from subscriptions.models import UserNotification
@@ -24,6 +25,9 @@ class NotificationSender(ABC):
     """
 
     channel_type: str = None  # Must be set by subclass
+    # prepare / transmit / finish implemented, transmit can run at
+    # the delivery threads (see channels.delivery)
+    concurrent: bool = False
 
     @abstractmethod
     def send(self, channel, notification: UserNotification) -> Dict[str, Any]:
@@ -55,6 +59,25 @@ class NotificationSender(ABC):
         """
         pass
 
+    def prepare(self, channel, notification: UserNotification) -> Any:
+        """
+        Data needed by transmit (read the database here, not at transmit).
+        """
+        return notification
+
+    def transmit(self, channel, payload) -> Dict[str, Any]:
+        """
+        Send the prepared data, same result than send.
+        Thread safe and without database access (concurrent senders).
+        """
+        raise NotImplementedError("Subclass must implement transmit to be concurrent")
+
+    def finish(self, channel, notification: UserNotification, payload, result: Dict[str, Any]):
+        """
+        Database updates after transmit.
+        """
+        pass
+
     def get_active_channels(self, user):
         """
         Get all active channels of this type for a user.
@@ -81,54 +104,71 @@ class NotificationSender(ABC):
         """
         Send to a single channel and record the delivery.
         """
-        # Check if delivery already exists
-        delivery, created = ChannelDelivery.objects.get_or_create(
-            notification=notification,
-            channel_type=self.channel_type,
-            channel_id=channel.id,
-            defaults={'status': ChannelDelivery.STATUS_PENDING}
-        )
+        delivery = self.get_delivery(channel, notification)
 
-        if not created and delivery.status == ChannelDelivery.STATUS_SENT:
+        if delivery.status == ChannelDelivery.STATUS_SENT:
             # Already sent successfully
             return delivery
 
         try:
             result = self.send(channel, notification)
+        except Exception as e:
+            return self.record_delivery(delivery, channel, notification, error=e)
+        return self.record_delivery(delivery, channel, notification, result=result)
 
-            if result.get('success'):
-                delivery.status = ChannelDelivery.STATUS_SENT
-                delivery.sent_at = timezone.now()
-                delivery.external_id = result.get('external_id', '')
-                delivery.error_message = ''
-
-                # Update channel stats
-                channel.last_sent_at = timezone.now()
-                channel.error_count = 0
-                channel.save(update_fields=['last_sent_at', 'error_count'])
-            else:
-                delivery.status = ChannelDelivery.STATUS_FAILED
-                delivery.error_message = result.get('error', 'Unknown error')
-                delivery.retry_count += 1
-
-                # Update channel error stats
-                channel.last_error_at = timezone.now()
-                channel.last_error_message = delivery.error_message
-                channel.error_count += 1
-                channel.save(update_fields=['last_error_at', 'last_error_message', 'error_count'])
-
-                logger.error(
-                    f"Failed to send notification {notification.id} "
-                    f"to {self.channel_type} channel {channel.id}: {delivery.error_message}"
-                )
+    def get_delivery(self, channel, notification: UserNotification) -> ChannelDelivery:
+        """
+        The delivery record for a channel (created as pending).
+        """
+        delivery, created = ChannelDelivery.objects.get_or_create(
+            notification=notification,
+            channel_type=self.channel_type,
+            channel_id=channel.id,
+            defaults={'status': ChannelDelivery.STATUS_PENDING}
+        )
+        return delivery
 
-        except Exception as e:
+    def record_delivery(self, delivery, channel, notification: UserNotification, result=None, error=None) -> ChannelDelivery:
+        """
+        Save the result of a send (or the exception raised) at the delivery
+        and the channel stats.
+        """
+        if error is not None:
             delivery.status = ChannelDelivery.STATUS_FAILED
-            delivery.error_message = str(e)
+            delivery.error_message = str(error)
             delivery.retry_count += 1
-            logger.exception(
+            logger.error(
                 f"Exception sending notification {notification.id} "
-                f"to {self.channel_type} channel {channel.id}"
+                f"to {self.channel_type} channel {channel.id}",
+                exc_info=error
+            )
+
+        elif result.get('success'):
+            delivery.status = ChannelDelivery.STATUS_SENT
+            delivery.sent_at = timezone.now()
+            delivery.external_id = result.get('external_id', '')
+            delivery.error_message = ''
+
+            # Update channel stats
+            channel.last_sent_at = timezone.now()
+            channel.error_count = 0
+            channel.save(update_fields=['last_sent_at', 'error_count'])
+        else:
+            delivery.status = ChannelDelivery.STATUS_FAILED
+            delivery.error_message = result.get('error', 'Unknown error')
+            delivery.retry_count += 1
+
+            # Update channel error stats
+            channel.last_error_at = timezone.now()
+            channel.last_error_message = delivery.error_message
+            # F() so failures recorded from other instances add up
+            channel.error_count = F('error_count') + 1
+            channel.save(update_fields=['last_error_at', 'last_error_message', 'error_count'])
+            channel.refresh_from_db(fields=['error_count'])
+
+            logger.error(
+                f"Failed to send notification {notification.id} "
+                f"to {self.channel_type} channel {channel.id}: {delivery.error_message}"
             )
 
         delivery.save()
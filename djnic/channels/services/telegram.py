@@ -2,9 +2,13 @@
 Telegram notification sender service.
 """
 import logging
+import threading
+import time
 from typing import Dict, Any
 from django.conf import settings
 import requests
+from requests.adapters import HTTPAdapter
+from core.ratelimit import TokenBucket
 from subscriptions.models import UserNotification
 from channels.models import TelegramChannel, TelegramMessage, NotificationChannel
 from channels.services import NotificationSender, NotificationRegistry
@@ -19,10 +23,78 @@ class TelegramSender(NotificationSender):
     """
 
     channel_type = NotificationChannel.CHANNEL_TYPE_TELEGRAM
+    concurrent = True
+
+    def __init__(self, rate=None, chat_rate=None, pool_size=None, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        # capacity 1: evenly spaced, never more than rate + 1 in a second
+        self.rate_limiter = TokenBucket(rate or settings.TELEGRAM_RATE_LIMIT, capacity=1, clock=clock, sleep=sleep)
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE_LIMIT
+        # chat_id: time when the next message can be sent
+        self.chat_ready = {}
+        self.pool_size = pool_size or max(32, settings.NOTIFICATIONS_DELIVERY_WORKERS)
+        self.lock = threading.Lock()
+        self._session = None
+
+    @property
+    def bot_token(self):
+        # at call time, local_settings / override_settings
+        return settings.TELEGRAM_BOT_TOKEN
+
+    @property
+    def api_base(self):
+        return settings.TELEGRAM_API_BASE
+
+    @property
+    def session(self):
+        """ Keep-alive HTTP session shared by the delivery threads """
+        with self.lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def wait_for_chat(self, chat_id):
+        with self.lock:
+            wait = self.chat_ready.get(chat_id, 0) - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+
+    def delay_chat(self, chat_id, seconds):
+        """ Next message to the chat not before these seconds """
+        with self.lock:
+            self.chat_ready[chat_id] = max(self.chat_ready.get(chat_id, 0), self.clock() + seconds)
+
+    def call(self, method, payload, chat_id=None, attempts=None):
+        """
+        POST to the Bot API within the global (and per chat) rate limits.
+        When Telegram answers 429 wait retry_after seconds and try again.
+        Returns the response data.
+        """
+        attempts = attempts or settings.TELEGRAM_MAX_ATTEMPTS
+        url = f"{self.api_base}{self.bot_token}/{method}"
+        for attempt in range(attempts):
+            # wait for the chat before taking a global token (they are used right away)
+            if chat_id is not None:
+                self.wait_for_chat(chat_id)
+            self.rate_limiter.acquire()
+            if chat_id is not None:
+                self.delay_chat(chat_id, 1 / self.chat_rate)
+            response = self.session.post(url, json=payload, timeout=10)
+            data = response.json()
+            if data.get('error_code') != 429:
+                return data
 
-    def __init__(self):
-        self.bot_token = settings.TELEGRAM_BOT_TOKEN
-        self.api_base = 'https://api.telegram.org/bot'
+            retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+            logger.warning(f"Telegram flood control (chat {chat_id}), retry after {retry_after}s")
+            self.rate_limiter.pause(retry_after)
+            if chat_id is not None:
+                self.delay_chat(chat_id, retry_after)
+        return data
 
     def get_active_channels(self, user):
         """Get all active Telegram channels for a user."""
@@ -72,9 +144,21 @@ class TelegramSender(NotificationSender):
 
         return ''.join(parts)
 
-    def send(self, channel: TelegramChannel, notification: UserNotification) -> Dict[str, Any]:
+    def prepare(self, channel: TelegramChannel, notification: UserNotification) -> Dict[str, Any]:
         """
-        Send notification to a Telegram channel.
+        sendMessage payload for a notification.
+        """
+        return {
+            'chat_id': channel.chat_id,
+            'text': self.format_message(notification),
+            'parse_mode': channel.parse_mode,
+            'disable_web_page_preview': channel.disable_preview,
+        }
+
+    def transmit(self, channel: TelegramChannel, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a prepared message. Just the HTTP request (no database),
+        called from the delivery threads.
         """
         if not self.bot_token:
             return {
@@ -82,49 +166,8 @@ class TelegramSender(NotificationSender):
                 'error': 'TELEGRAM_BOT_TOKEN not configured'
             }
 
-        message = self.format_message(notification)
-        url = f"{self.api_base}{self.bot_token}/sendMessage"
-
-        payload = {
-            'chat_id': channel.chat_id,
-            'text': message,
-            'parse_mode': channel.parse_mode,
-            'disable_web_page_preview': channel.disable_preview,
-        }
-
         try:
-            response = requests.post(url, json=payload, timeout=10)
-            data = response.json()
-
-            if data.get('ok'):
-                message_id = data.get('result', {}).get('message_id', '')
-                logger.info(
-                    f"Sent Telegram notification to chat {channel.chat_id}, "
-                    f"message_id: {message_id}"
-                )
-                self._save_outgoing_message(channel.chat_id, message, message_id, channel)
-                return {
-                    'success': True,
-                    'external_id': str(message_id)
-                }
-            else:
-                error_desc = data.get('description', 'Unknown Telegram API error')
-                error_code = data.get('error_code', '')
-
-                # Handle specific errors
-                if error_code == 403:
-                    # User blocked the bot - deactivate channel
-                    channel.is_active = False
-                    channel.save(update_fields=['is_active'])
-                    logger.warning(
-                        f"User blocked bot, deactivating channel {channel.id}"
-                    )
-
-                return {
-                    'success': False,
-                    'error': f"Telegram API error {error_code}: {error_desc}"
-                }
-
+            data = self.call('sendMessage', payload, chat_id=payload['chat_id'])
         except requests.exceptions.Timeout:
             return {
                 'success': False,
@@ -136,6 +179,50 @@ class TelegramSender(NotificationSender):
                 'error': f'Request error: {str(e)}'
             }
 
+        if data.get('ok'):
+            message_id = data.get('result', {}).get('message_id', '')
+            return {
+                'success': True,
+                'external_id': str(message_id)
+            }
+
+        error_desc = data.get('description', 'Unknown Telegram API error')
+        error_code = data.get('error_code', '')
+        return {
+            'success': False,
+            'error': f"Telegram API error {error_code}: {error_desc}",
+            'error_code': error_code,
+        }
+
+    def finish(self, channel: TelegramChannel, notification: UserNotification, payload: Dict[str, Any], result: Dict[str, Any]):
+        """
+        Database updates after sending a message.
+        """
+        if result.get('success'):
+            logger.info(
+                f"Sent Telegram notification to chat {channel.chat_id}, "
+                f"message_id: {result['external_id']}"
+            )
+            self._save_outgoing_message(channel.chat_id, payload['text'], result['external_id'], channel)
+
+        # Handle specific errors
+        elif result.get('error_code') == 403:
+            # User blocked the bot - deactivate channel
+            channel.is_active = False
+            channel.save(update_fields=['is_active'])
+            logger.warning(
+                f"User blocked bot, deactivating channel {channel.id}"
+            )
+
+    def send(self, channel: TelegramChannel, notification: UserNotification) -> Dict[str, Any]:
+        """
+        Send notification to a Telegram channel.
+        """
+        payload = self.prepare(channel, notification)
+        result = self.transmit(channel, payload)
+        self.finish(channel, notification, payload, result)
+        return result
+
     def send_raw_message(self, chat_id: int, text: str, parse_mode: str = 'HTML') -> Dict[str, Any]:
         """
         Send a raw message to a chat (for bot commands, not notifications).
@@ -143,9 +230,6 @@ class TelegramSender(NotificationSender):
         if not self.bot_token:
             return {'success': False, 'error': 'TELEGRAM_BOT_TOKEN not configured'}
 
-        import requests
-
-        url = f"{self.api_base}{self.bot_token}/sendMessage"
         payload = {
             'chat_id': chat_id,
             'text': text,
@@ -153,8 +237,8 @@ class TelegramSender(NotificationSender):
         }
 
         try:
-            response = requests.post(url, json=payload, timeout=10)
-            data = response.json()
+            # a reply to the user, don't wait for retry_after (global rate limit only)
+            data = self.call('sendMessage', payload, attempts=1)
 
             if data.get('ok'):
                 message_id = data['result']['message_id']
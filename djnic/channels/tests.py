@@ -2,19 +2,35 @@
 Tests for the channels app.
 """
 import json
+import queue
+import tempfile
+import threading
+import time
+from io import StringIO
 from unittest.mock import patch, MagicMock
 from datetime import timedelta
 
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.utils import timezone
 
 from channels.models import (
     TelegramChannel, TelegramLinkToken, NotificationChannel,
     TelegramMessage
 )
+from channels.delivery import send_notifications, transmit_items
+from channels.models import ChannelDelivery
 from channels.services.telegram import TelegramSender
-from subscriptions.models import UserNotification
+from channels.worker import Backoff, Worker
+from core.locks import InstanceLock
+from dominios.models import Dominio
+from subscriptions.models import (
+    Event, SubscriptionTarget, UserNotification, UserSubscription, EVENT_DROPPED
+)
+from zonas.models import Zona
 
 
 class TelegramChannelModelTest(TestCase):
@@ -128,7 +144,7 @@ class TelegramSenderTest(TestCase):
         self.assertIn('example.com', message)
         self.assertIn('dropped', message)
 
-    @patch('channels.services.telegram.requests.post')
+    @patch('channels.services.telegram.requests.Session.post')
     @override_settings(TELEGRAM_BOT_TOKEN='test-token')
     def test_send_success(self, mock_post):
         mock_response = MagicMock()
@@ -149,7 +165,7 @@ class TelegramSenderTest(TestCase):
         self.assertTrue(result['success'])
         self.assertEqual(result['external_id'], '12345')
 
-    @patch('channels.services.telegram.requests.post')
+    @patch('channels.services.telegram.requests.Session.post')
     @override_settings(TELEGRAM_BOT_TOKEN='test-token')
     def test_send_blocked_user(self, mock_post):
         mock_response = MagicMock()
@@ -620,7 +636,7 @@ class MessageLoggingTest(TestCase):
         self.assertIsNotNone(incoming)
         self.assertIsNone(incoming.channel)  # No channel for unlinked user
 
-    @patch('channels.services.telegram.requests.post')
+    @patch('channels.services.telegram.requests.Session.post')
     @override_settings(TELEGRAM_BOT_TOKEN='test-token')
     def test_outgoing_notification_logged(self, mock_post):
         """Outgoing notifications should be saved to database."""
@@ -649,7 +665,7 @@ class MessageLoggingTest(TestCase):
         self.assertEqual(outgoing.channel, self.channel)
         self.assertIn('Test Notification', outgoing.text)
 
-    @patch('channels.services.telegram.requests.post')
+    @patch('channels.services.telegram.requests.Session.post')
     @override_settings(TELEGRAM_BOT_TOKEN='test-token')
     def test_outgoing_raw_message_logged(self, mock_post):
         """Outgoing raw messages should be saved to database."""
@@ -671,7 +687,7 @@ class MessageLoggingTest(TestCase):
         self.assertIsNotNone(outgoing)
         self.assertEqual(outgoing.telegram_message_id, 54321)
 
-    @patch('channels.services.telegram.requests.post')
+    @patch('channels.services.telegram.requests.Session.post')
     @override_settings(TELEGRAM_BOT_TOKEN='test-token')
     def test_failed_send_not_logged(self, mock_post):
         """Failed sends should not create message records."""
@@ -1156,3 +1172,329 @@ class TelegramBotCommandsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         # No channel should be created for group chats
         self.assertFalse(TelegramChannel.objects.exists())
+
+
+class NotificationsWorkerTest(TestCase):
+    """Tests for the long running notifications worker."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(LOCKS_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user(username='worker', email='w@example.com', password='testpass123')
+        TelegramChannel.objects.create(user=self.user, chat_id=123456789, is_active=True, is_verified=True)
+        zona = Zona.objects.create(nombre='ar')
+        self.dominio = Dominio.objects.create(nombre='example', zona=zona)
+        self.ct = ContentType.objects.get_for_model(Dominio)
+        target = SubscriptionTarget.objects.create(content_type=self.ct, object_id=self.dominio.id)
+        UserSubscription.objects.create(user=self.user, target=target, event_types=[EVENT_DROPPED])
+
+    def create_event(self):
+        return Event.objects.create(
+            event_type=EVENT_DROPPED, content_type=self.ct, object_id=self.dominio.id,
+            event_data={'description': 'example.ar cayó'}
+        )
+
+    def test_backoff(self):
+        backoff = Backoff(min_wait=1, max_wait=5)
+        self.assertEqual([backoff.next() for _ in range(5)], [1, 2, 4, 5, 5])
+        backoff.reset()
+        self.assertEqual(backoff.next(), 1)
+
+    @patch('channels.services.telegram.TelegramSender.transmit')
+    def test_loop(self, mock_send):
+        mock_send.return_value = {'success': True, 'external_id': '1'}
+        event = self.create_event()
+        reports = []
+        worker = Worker(min_wait=0.01, max_wait=0.01)
+        self.assertTrue(worker.run(max_loops=2, report=reports.append))
+
+        event.refresh_from_db()
+        self.assertTrue(event.processed)
+        notification = UserNotification.objects.get(user=self.user)
+        self.assertEqual(notification.deliveries.get().status, ChannelDelivery.STATUS_SENT)
+        self.assertEqual(mock_send.call_count, 1)
+        self.assertEqual([(r['events'], r['notifications'], r['sent']) for r in reports], [(1, 1, 1), (0, 0, 0)])
+        self.assertEqual(worker.totals, {'events': 1, 'notifications': 1, 'sent': 1, 'failed': 0, 'errors': 0})
+        # the locks are released
+        lock = InstanceLock('process_events')
+        self.assertTrue(lock.acquire())
+        lock.release()
+
+    @patch('channels.services.telegram.TelegramSender.transmit')
+    def test_bounded_retries(self, mock_send):
+        mock_send.return_value = {'success': False, 'error': 'down'}
+        self.create_event()
+        worker = Worker(min_wait=0.01, max_wait=0.01, max_retries=2)
+        worker.run(max_loops=4)
+        delivery = ChannelDelivery.objects.get()
+        self.assertEqual(delivery.status, ChannelDelivery.STATUS_FAILED)
+        self.assertEqual(delivery.retry_count, 2)
+        self.assertEqual(worker.totals['failed'], 2)
+
+    def test_single_instance(self):
+        with InstanceLock('send_notifications'):
+            self.assertFalse(Worker().run(max_loops=1))
+            # the first lock was released
+            lock = InstanceLock('process_events')
+            self.assertTrue(lock.acquire())
+            lock.release()
+            out = StringIO()
+            with self.assertRaises(CommandError):
+                call_command('notifications_worker', '--max-loops', '1', stdout=out)
+            call_command('send_notifications', stdout=out)
+            self.assertIn('send_notifications is already running', out.getvalue())
+
+        # cron commands skip the run while the worker has the locks
+        self.create_event()
+        with InstanceLock('process_events'):
+            call_command('process_events', stdout=out)
+        self.assertIn('process_events is already running', out.getvalue())
+        self.assertFalse(Event.objects.filter(processed=True).exists())
+
+    def test_stop(self):
+        worker = Worker(min_wait=10, max_wait=10)
+        worker.stop()
+        started = time.monotonic()
+        self.assertFalse(worker.wait(10))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertTrue(worker.run())
+        self.assertEqual(worker.loops, 0)
+
+    def test_command(self):
+        self.create_event()
+        out = StringIO()
+        call_command('notifications_worker', '--max-loops', '1', '--no-listen', stdout=out)
+        self.assertIn('Loop 1: 1 events (1 notifications)', out.getvalue())
+        self.assertIn('1 loops in', out.getvalue())
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def bot_api_response(data):
+    response = MagicMock()
+    response.json.return_value = data
+    return response
+
+
+FLOOD = {
+    'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 5',
+    'parameters': {'retry_after': 5},
+}
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='test-token')
+class TelegramRateLimitTest(TestCase):
+    """Tests for the Telegram rate limits and retry_after."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sender = TelegramSender(rate=10, chat_rate=1, clock=self.clock, sleep=self.clock.sleep)
+        user = User.objects.create_user(username='limits', email='l@example.com', password='testpass123')
+        self.channel = TelegramChannel.objects.create(user=user, chat_id=111, is_active=True, is_verified=True)
+
+    def payload(self, chat_id=111):
+        return {'chat_id': chat_id, 'text': 'hi', 'parse_mode': 'HTML', 'disable_web_page_preview': True}
+
+    @patch('channels.services.telegram.requests.Session.post')
+    def test_retry_after(self, mock_post):
+        mock_post.side_effect = [bot_api_response(FLOOD), bot_api_response({'ok': True, 'result': {'message_id': 7}})]
+        result = self.sender.transmit(self.channel, self.payload())
+        self.assertEqual(result, {'success': True, 'external_id': '7'})
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertGreaterEqual(self.clock.now, 5)
+
+    @patch('channels.services.telegram.requests.Session.post')
+    @override_settings(TELEGRAM_MAX_ATTEMPTS=2)
+    def test_retry_after_gives_up(self, mock_post):
+        mock_post.return_value = bot_api_response(FLOOD)
+        result = self.sender.transmit(self.channel, self.payload())
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error_code'], 429)
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('channels.services.telegram.requests.Session.post')
+    def test_chat_pacing(self, mock_post):
+        mock_post.return_value = bot_api_response({'ok': True, 'result': {'message_id': 1}})
+        self.sender.transmit(self.channel, self.payload())
+        self.assertEqual(self.clock.now, 0)
+        self.sender.transmit(self.channel, self.payload())
+        self.assertAlmostEqual(self.clock.now, 1)
+        # other chats just wait for the global rate (10 per second)
+        self.sender.transmit(self.channel, self.payload(chat_id=222))
+        self.assertAlmostEqual(self.clock.now, 1.1)
+
+    @patch('channels.services.telegram.requests.Session.post')
+    @override_settings(TELEGRAM_API_BASE='http://127.0.0.1:9999/bot')
+    def test_shared_session(self, mock_post):
+        mock_post.return_value = bot_api_response({'ok': True, 'result': {'message_id': 1}})
+        self.assertIs(self.sender.session, self.sender.session)
+        self.sender.send_raw_message(111, 'hi')
+        self.assertEqual(mock_post.call_args[0][0], 'http://127.0.0.1:9999/bottest-token/sendMessage')
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='test-token')
+class ConcurrentDeliveryTest(TestCase):
+    """Tests for the concurrent delivery engine."""
+
+    def setUp(self):
+        self.users = []
+        for n in range(3):
+            user = User.objects.create_user(username=f'chat{n}', email=f'c{n}@example.com', password='testpass123')
+            TelegramChannel.objects.create(user=user, chat_id=1000 + n, is_active=True, is_verified=True)
+            self.users.append(user)
+        self.notifications = [
+            UserNotification.objects.create(
+                user=self.users[n % 3], title=f'Notification {n}', event_data={'description': f'event {n}'}
+            )
+            for n in range(12)
+        ]
+        self.sender = TelegramSender(rate=1000, chat_rate=1000)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def fake_post(self, url, json=None, timeout=None):
+        with self.lock:
+            self.calls.append((json['chat_id'], json['text']))
+            message_id = len(self.calls)
+        return bot_api_response({'ok': True, 'result': {'message_id': message_id}})
+
+    def test_concurrent(self):
+        with patch('channels.services.telegram.requests.Session.post', side_effect=self.fake_post):
+            self.assertEqual(send_notifications(self.notifications, {'telegram': self.sender}, workers=4), (12, 0))
+            # already sent
+            self.assertEqual(send_notifications(self.notifications, {'telegram': self.sender}, workers=4), (0, 0))
+
+        self.assertEqual(len(self.calls), 12)
+        self.assertEqual(ChannelDelivery.objects.filter(status=ChannelDelivery.STATUS_SENT).count(), 12)
+        self.assertEqual(TelegramMessage.objects.filter(direction=TelegramMessage.DIRECTION_OUT).count(), 12)
+        # same order for each chat
+        for n in range(3):
+            titles = [text.split('</b>')[0][3:] for chat_id, text in self.calls if chat_id == 1000 + n]
+            self.assertEqual(titles, [f'Notification {m}' for m in range(n, 12, 3)])
+
+    def test_transmit_error(self):
+        def transmit(channel, payload):
+            if payload['chat_id'] == 1000:
+                raise ValueError('boom')
+            return {'success': True, 'external_id': '1'}
+
+        reports = []
+        with patch.object(self.sender, 'transmit', side_effect=transmit):
+            sent, failed = send_notifications(
+                self.notifications, {'telegram': self.sender}, workers=4,
+                report=lambda *args: reports.append(args)
+            )
+        self.assertEqual((sent, failed), (8, 4))
+        self.assertEqual(len(reports), 12)
+        errors = ChannelDelivery.objects.filter(status=ChannelDelivery.STATUS_FAILED)
+        self.assertEqual(set(errors.values_list('error_message', flat=True)), {'boom'})
+
+    def test_failures_add_up(self):
+        def transmit(channel, payload):
+            if payload['chat_id'] == 1000:
+                return {'success': False, 'error': 'Telegram API error 400: bad'}
+            return {'success': True, 'external_id': '1'}
+
+        with patch.object(self.sender, 'transmit', side_effect=transmit):
+            self.assertEqual(send_notifications(self.notifications, {'telegram': self.sender}, workers=4), (8, 4))
+        self.assertEqual(TelegramChannel.objects.get(chat_id=1000).error_count, 4)
+
+    def test_stop_after_deactivation(self):
+        transmitted = []
+
+        def transmit(channel, payload):
+            transmitted.append(payload['chat_id'])
+            if payload['chat_id'] == 1000:
+                return {'success': False, 'error': 'Telegram API error 403: blocked', 'error_code': 403}
+            return {'success': True, 'external_id': '1'}
+
+        with patch.object(self.sender, 'transmit', side_effect=transmit):
+            self.assertEqual(send_notifications(self.notifications, {'telegram': self.sender}, workers=4), (8, 1))
+        self.assertEqual(transmitted.count(1000), 1)
+        channel = TelegramChannel.objects.get(chat_id=1000)
+        self.assertFalse(channel.is_active)
+        self.assertEqual(channel.error_count, 1)
+        deliveries = ChannelDelivery.objects.filter(channel_id=channel.id)
+        self.assertEqual(deliveries.filter(status=ChannelDelivery.STATUS_PENDING).count(), 3)
+
+    def test_record_error(self):
+        def transmit(channel, payload):
+            if payload['chat_id'] == 1000:
+                return {'success': False, 'error': 'Telegram API error 400: bad'}
+            return {'success': True, 'external_id': '1'}
+
+        record_delivery = self.sender.record_delivery
+
+        def record(delivery, channel, notification, **kwargs):
+            if channel.chat_id == 1001:
+                raise RuntimeError('database is gone')
+            return record_delivery(delivery, channel, notification, **kwargs)
+
+        reports = []
+        with patch.object(self.sender, 'transmit', side_effect=transmit), \
+                patch.object(self.sender, 'record_delivery', side_effect=record):
+            sent, failed = send_notifications(
+                self.notifications, {'telegram': self.sender}, workers=4,
+                report=lambda *args: reports.append(args)
+            )
+        self.assertEqual((sent, failed), (4, 8))
+        self.assertEqual(len(reports), 12)
+        self.assertEqual(sum(1 for report in reports if isinstance(report[3], RuntimeError)), 4)
+        self.assertEqual(TelegramChannel.objects.get(chat_id=1000).error_count, 4)
+        self.assertEqual(ChannelDelivery.objects.filter(status=ChannelDelivery.STATUS_SENT).count(), 4)
+
+    def test_transmit_aborted(self):
+        """A thread waiting for a failed result stops if nobody records it"""
+        channel = TelegramChannel.objects.get(chat_id=1000)
+        items = [('telegram', self.sender, channel, n, None, {'chat_id': 1000}) for n in range(3)]
+        results = queue.Queue()
+        aborted = threading.Event()
+        aborted.set()
+        with patch.object(self.sender, 'transmit', return_value={'success': False, 'error': 'bad'}) as transmit:
+            transmit_items(items, results, aborted, wait_timeout=0.01)
+        self.assertEqual(transmit.call_count, 0)
+
+        aborted.clear()
+        thread = threading.Thread(target=transmit_items, args=(items, results, aborted, 0.01))
+        with patch.object(self.sender, 'transmit', return_value={'success': False, 'error': 'bad'}) as transmit:
+            thread.start()
+            results.get(timeout=5)
+            aborted.set()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(transmit.call_count, 1)
+
+    def test_one_by_one(self):
+        with patch('channels.services.telegram.requests.Session.post', side_effect=self.fake_post):
+            self.assertEqual(send_notifications(self.notifications, {'telegram': self.sender}, workers=1), (12, 0))
+        self.assertEqual([text for _, text in self.calls], [self.sender.format_message(n) for n in self.notifications])
+
+
+class BenchmarkTelegramTest(TestCase):
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command(
+            'benchmark_telegram', '--notifications', '30', '--chats', '10', '--workers', '1,4',
+            '--latency', '0', '--rate', '1000', '--chat-rate', '1000', '--flood-every', '20', '--retry-after', '0',
+            stdout=out
+        )
+        output = out.getvalue()
+        self.assertIn('workers 1: 30 sent, 0 failed', output)
+        self.assertIn('workers 4: 30 sent, 0 failed', output)
+        self.assertIn('answered 429', output)
+        self.assertFalse(User.objects.filter(username__startswith='bench-tg-').exists())
@@ -0,0 +1,208 @@
+"""
+Long running worker for the notifications pipeline. Each loop fans out the
+new events (subscriptions.fanout) and delivers the pending notifications
+(channels.delivery).
+
+When there is nothing to do it waits with an adaptive backoff. On
+PostgreSQL it also LISTENs to WAKEUP_CHANNEL: a trigger NOTIFYs it on new
+Event and UserNotification rows (subscriptions migration 0003), so new
+work is handled right away.
+"""
+import logging
+import select
+import threading
+import time
+from django.db import connection as default_connection
+
+from core.locks import InstanceLock
+from channels.delivery import get_pending_notifications, send_notifications
+from channels.services import NotificationRegistry
+from subscriptions.fanout import process_pending_events
+
+
+logger = logging.getLogger(__name__)
+
+WAKEUP_CHANNEL = 'djnic_worker'
+# the stop flag is checked at least this often while waiting
+WAIT_SLICE = 1.0
+
+
+class Backoff:
+    """ Seconds to wait: min_wait after some work, then growing up to max_wait """
+
+    def __init__(self, min_wait=1, max_wait=30, factor=2):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.factor = factor
+        self.current = min_wait
+
+    def reset(self):
+        self.current = self.min_wait
+
+    def next(self):
+        wait = self.current
+        self.current = min(self.max_wait, self.current * self.factor)
+        return wait
+
+
+class Listener:
+    """ LISTEN / NOTIFY wake ups (just PostgreSQL) """
+
+    def __init__(self, connection=None, channel=WAKEUP_CHANNEL):
+        self.connection = connection or default_connection
+        self.channel = channel
+
+    @property
+    def supported(self):
+        return self.connection.vendor == 'postgresql'
+
+    def listen(self):
+        """ Call it again after a reconnection """
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+
+    def wait(self, timeout):
+        """ True if notified before the timeout """
+        raw = self.connection.connection
+        if not select.select([raw], [], [], timeout)[0]:
+            return False
+        raw.poll()
+        notified = bool(raw.notifies)
+        raw.notifies.clear()
+        return notified
+
+
+class Worker:
+
+    def __init__(
+        self, events_limit=1000, batch_size=500, notifications_limit=100, max_retries=3,
+        min_wait=1, max_wait=30, listen=True, workers=None, connection=None
+    ):
+        self.events_limit = events_limit
+        self.batch_size = batch_size
+        self.notifications_limit = notifications_limit
+        self.max_retries = max_retries
+        self.workers = workers
+        self.backoff = Backoff(min_wait, max_wait)
+        self.connection = connection or default_connection
+        self.listener = Listener(self.connection) if listen else None
+        # same locks than the process_events and send_notifications commands
+        self.locks = [
+            InstanceLock('process_events', self.connection),
+            InstanceLock('send_notifications', self.connection),
+        ]
+        self.stopped = threading.Event()
+        self.loops = 0
+        self.totals = {'events': 0, 'notifications': 0, 'sent': 0, 'failed': 0, 'errors': 0}
+
+    def stop(self, *args):
+        """ Finish the current loop and exit (signal handler) """
+        self.stopped.set()
+
+    def setup(self):
+        """ Take the locks and LISTEN. Returns False if another instance is running """
+        for lock in self.locks:
+            if not lock.acquire():
+                logger.warning(f'{lock.name} is already running')
+                self.release()
+                return False
+        if self.listener and self.listener.supported:
+            self.listener.listen()
+        return True
+
+    def release(self):
+        for lock in self.locks:
+            try:
+                lock.release()
+            except Exception:
+                # the connection could be gone
+                logger.exception(f'Error releasing {lock.name}')
+
+    def run_once(self):
+        """ One loop. Returns its metrics """
+        started = time.monotonic()
+        events, notifications = process_pending_events(self.events_limit, self.batch_size)
+        fanout_time = time.monotonic() - started
+
+        started = time.monotonic()
+        # bounded retries, otherwise a failed delivery is sent again at every loop
+        pending = get_pending_notifications(
+            self.notifications_limit, retry_failed=True, max_retries=self.max_retries
+        )
+        sent, failed = send_notifications(pending, NotificationRegistry.get_all_senders(), workers=self.workers)
+        delivery_time = time.monotonic() - started
+
+        self.loops += 1
+        self.totals['events'] += events
+        self.totals['notifications'] += notifications
+        self.totals['sent'] += sent
+        self.totals['failed'] += failed
+        return {
+            'loop': self.loops,
+            'events': events,
+            'notifications': notifications,
+            'fanout_time': fanout_time,
+            'sent': sent,
+            'failed': failed,
+            'delivery_time': delivery_time,
+        }
+
+    def wait(self, seconds):
+        """ Wait until the timeout, a NOTIFY or stop(). Returns True if notified """
+        deadline = time.monotonic() + seconds
+        while not self.stopped.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            timeout = min(remaining, WAIT_SLICE)
+            if self.listener and self.listener.supported:
+                if self.listener.wait(timeout):
+                    return True
+            else:
+                self.stopped.wait(timeout)
+        return False
+
+    def run(self, max_loops=0, report=None):
+        """ Loop until stop() (or max_loops). report(metrics) after each loop """
+        if not self.setup():
+            return False
+        try:
+            while not self.stopped.is_set():
+                try:
+                    metrics = self.run_once()
+                except Exception:
+                    logger.exception('Error at the notifications worker loop')
+                    self.totals['errors'] += 1
+                    # start again with a new connection
+                    self.connection.close()
+                    self.stopped.wait(self.backoff.next())
+                    if self.stopped.is_set() or not self.setup():
+                        break
+                    continue
+
+                # only failed deliveries is not progress, keep the backoff growing
+                if metrics['events'] or metrics['sent']:
+                    self.backoff.reset()
+                    metrics['waited'] = 0
+                    metrics['woken'] = False
+                elif max_loops and self.loops >= max_loops:
+                    metrics['waited'] = 0
+                    metrics['woken'] = False
+                else:
+                    started = time.monotonic()
+                    metrics['woken'] = self.wait(self.backoff.next())
+                    metrics['waited'] = time.monotonic() - started
+                    if metrics['woken']:
+                        self.backoff.reset()
+
+                logger.debug(
+                    'Loop {loop}: {events} events ({notifications} notifications) in {fanout_time:.2f}s, '
+                    '{sent} sent {failed} failed in {delivery_time:.2f}s, waited {waited:.1f}s'.format(**metrics)
+                )
+                if report:
+                    report(metrics)
+                if max_loops and self.loops >= max_loops:
+                    break
+        finally:
+            self.release()
+        return True
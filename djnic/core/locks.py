@@ -0,0 +1,68 @@
+""" Locks to run just one instance of a process at a time.
+    PostgreSQL session advisory locks (they work across hosts and are released
+    when the connection is closed), a file lock for other databases """
+import fcntl
+import os
+import zlib
+from django.conf import settings
+from django.db import connection as default_connection
+
+
+class LockHeld(Exception):
+    pass
+
+
+class InstanceLock:
+
+    def __init__(self, name, connection=None):
+        self.name = name
+        # advisory locks use a bigint key
+        self.key = zlib.crc32(f'djnic-{name}'.encode('utf-8'))
+        self.connection = connection or default_connection
+        self.file = None
+        self.locked = False
+
+    @property
+    def path(self):
+        return os.path.join(settings.LOCKS_DIR, f'djnic-{self.name}.lock')
+
+    def acquire(self):
+        """ Try to get the lock without waiting. Returns True if we have it.
+            With PostgreSQL call it again after a reconnection """
+        if self.connection.vendor == 'postgresql':
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', [self.key])
+                self.locked = cursor.fetchone()[0]
+            return self.locked
+
+        if self.file is None:
+            f = open(self.path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            self.file = f
+        self.locked = True
+        return True
+
+    def release(self):
+        if not self.locked:
+            return
+        self.locked = False
+        if self.connection.vendor == 'postgresql':
+            if self.connection.connection is not None:
+                with self.connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [self.key])
+            return
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LockHeld(f'{self.name} is already running')
+        return self
+
+    def __exit__(self, *args):
+        self.release()
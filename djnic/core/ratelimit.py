@@ -0,0 +1,64 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """ Thread safe token bucket rate limiter.
+        rate: tokens per second
+        capacity: max tokens stored (allowed burst) """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def _wait_time(self, tokens):
+        """ Take the tokens if available. Returns the seconds to wait (0 if taken) """
+        now = self.clock()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        # rounding: (now - updated) * rate can be a hair less than expected
+        if self.tokens >= tokens - 1e-9:
+            self.tokens = max(0, self.tokens - tokens)
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+    def try_acquire(self, tokens=1):
+        """ Take the tokens without waiting. Returns True if taken """
+        with self.lock:
+            return self._wait_time(tokens) == 0
+
+    def acquire(self, tokens=1):
+        """ Wait until we get the tokens. Returns the seconds waited """
+        waited = 0
+        while True:
+            with self.lock:
+                wait = self._wait_time(tokens)
+            if wait == 0:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill(self.clock())
+            self.rate = rate
+
+    def pause(self, seconds):
+        """ Don't give any token for some seconds (e.g. the server asked us to wait) """
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            # start to refill after the pause
+            self.tokens = 0
+            self.updated = self.paused_until
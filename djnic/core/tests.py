@@ -1,3 +1,75 @@
-from django.test import TestCase
+import tempfile
+from django.test import SimpleTestCase, override_settings
+from core.locks import InstanceLock, LockHeld
+from core.ratelimit import TokenBucket
 
-# Create your tests here.
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTest(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(rate=2, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst_then_rate(self):
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertTrue(self.bucket.try_acquire())
+        self.assertFalse(self.bucket.try_acquire())
+        # 2 tokens per second
+        self.assertAlmostEqual(self.bucket.acquire(), 0.5)
+        self.assertAlmostEqual(self.clock.now, 0.5)
+
+    def test_pause(self):
+        self.bucket.pause(10)
+        self.assertFalse(self.bucket.try_acquire())
+        self.assertAlmostEqual(self.bucket.acquire(), 10.5)
+        # no tokens saved while paused
+        self.assertFalse(self.bucket.try_acquire())
+
+    def test_rounding(self):
+        # 0.1 seconds at 10 per second is not exactly 1 token at t=5.1
+        bucket = TokenBucket(rate=10, capacity=1, clock=self.clock, sleep=self.clock.sleep)
+        bucket.pause(5)
+        self.assertAlmostEqual(bucket.acquire(), 5.1)
+        self.assertAlmostEqual(bucket.acquire(), 0.1)
+
+
+class InstanceLockTest(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(LOCKS_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_one_instance(self):
+        first = InstanceLock('test')
+        second = InstanceLock('test')
+        self.assertTrue(first.acquire())
+        # again is fine
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertTrue(InstanceLock('other').acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+    def test_context_manager(self):
+        with InstanceLock('test'):
+            with self.assertRaises(LockHeld):
+                with InstanceLock('test'):
+                    pass
+        with InstanceLock('test') as lock:
+            self.assertTrue(lock.locked)
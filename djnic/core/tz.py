@@ -0,0 +1,8 @@
+from functools import lru_cache
+import pytz
+
+
+@lru_cache(maxsize=None)
+def get_tz(name):
+    """ pytz timezone objects are immutable, build each one just once """
+    return pytz.timezone(name)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -72,6 +73,13 @@ TELEGRAM_BOT_TOKEN = None  # Set in local_settings.py: 'your-bot-token'
 TELEGRAM_BOT_NAME = 'ArDomNewsBot'  # Your bot's username
 TELEGRAM_WEBHOOK_URL = f'{SITE_BASE_URL}/channels/telegram/webhook/'
 TELEGRAM_WEBHOOK_SECRET = 'Change-me-01234'  # Set in local_settings.py: random string (1-256 chars, A-Za-z0-9_-)
+TELEGRAM_API_BASE = 'https://api.telegram.org/bot'
+# Bot API limits: about 30 messages per second in total and 1 per second to the same chat
+TELEGRAM_RATE_LIMIT = 25  # messages per second, all chats
+TELEGRAM_CHAT_RATE_LIMIT = 1  # messages per second to each chat
+TELEGRAM_MAX_ATTEMPTS = 3  # tries for a message when Telegram answers 429 (retry_after)
+# Threads sending notifications (channels.delivery), 1 = one by one
+NOTIFICATIONS_DELIVERY_WORKERS = 8
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -256,6 +264,34 @@ OLD_DB_NAME = ''
 
 GENERAL_CACHE_SECONDS = 60 * 60 * 12
 
+# Max whoare results accepted by the update_from_whoare_bulk endpoint
+WHOARE_BULK_MAX_ITEMS = 500
+# update_from_whoare(_bulk) just validate and queue the results (202 Accepted)
+# and the drain_whoare_inbox command ingest them
+WHOARE_INGEST_ASYNC = False
+# Max size of an uncompressed (gzip) whoare request body
+WHOARE_WIRE_MAX_BYTES = 50 * 1024 * 1024
+# Share of the whoare payloads written to the log (0 = none)
+WHOARE_PAYLOAD_LOG_SAMPLE_RATE = 0
+# Domains handed out to whoare nodes (next-priority/lease) are reserved for
+DOMAIN_LEASE_SECONDS = 60 * 15
+DOMAIN_LEASE_MAX_ITEMS = 200
+# Share of priority calculations, picks and whoare updates saved as DominioPriorityLog
+PRIORITY_LOG_SAMPLE_RATE = 0.01
+# Zona objects (zonas.registry) and their priority rules are cached in memory, reloaded after these seconds
+ZONES_CACHE_SECONDS = 300
+# Save the (compressed) whois data of each read with changes, see reparse_whois
+WHOIS_ARCHIVE_ENABLED = True
+# Registrante objects cached in memory (registrantes.resolver)
+REGISTRANTES_CACHE_SECONDS = 300
+# Events nobody follows (subscriptions.interest): 'keep' them as any other event,
+# save them already 'processed' (for analytics) or 'skip' them
+UNWATCHED_EVENTS = 'processed'
+# The index of followed objects is reloaded after these seconds (changes from other processes)
+SUBSCRIPTIONS_INTEREST_CACHE_SECONDS = 60
+# Lock files for single instance commands (core.locks) when the database is not PostgreSQL
+LOCKS_DIR = tempfile.gettempdir()
+
 # Login buttons goes directly to Google
 # If False, a new step is required to login
 SOCIALACCOUNT_LOGIN_ON_GET = True
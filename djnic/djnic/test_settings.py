@@ -4,6 +4,13 @@ from .settings import *
 # Disable Telegram webhook secret for tests (specific tests override this)
 TELEGRAM_WEBHOOK_SECRET = None
 
+# Sampled logs make query counts random (specific tests override this)
+PRIORITY_LOG_SAMPLE_RATE = 0
+# Test transactions are rolled back, don't cache objects between tests
+ZONES_CACHE_SECONDS = 0
+REGISTRANTES_CACHE_SECONDS = 0
+SUBSCRIPTIONS_INTEREST_CACHE_SECONDS = 0
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -78,8 +78,32 @@ class DNS(models.Model):
     def get_absolute_url(self):
         return reverse('dns', kwargs={'uid': self.uid})
 
-    def assign_empresa(self):
-        for rgs in EmpresaRegexDomain.objects.all():
+    @classmethod
+    def get_or_create_many(cls, names):
+        """ Get (or create the missing ones) a list of DNSs in bulk
+            Returns a dict name -> DNS object """
+        names = set(names)
+        if not names:
+            return {}
+
+        dnss = {dns.dominio: dns for dns in cls.objects.filter(dominio__in=names)}
+        missing = names - set(dnss.keys())
+        if missing:
+            # bulk_create skips save(), assign the empresa here (with just one query for all regexs)
+            regexs = list(EmpresaRegexDomain.objects.all())
+            news = []
+            for name in sorted(missing):
+                dns = cls(dominio=name)
+                dns.assign_empresa(regexs=regexs)
+                news.append(dns)
+            cls.objects.bulk_create(news, ignore_conflicts=True)
+            dnss.update({dns.dominio: dns for dns in cls.objects.filter(dominio__in=missing)})
+        return dnss
+
+    def assign_empresa(self, regexs=None):
+        if regexs is None:
+            regexs = EmpresaRegexDomain.objects.all()
+        for rgs in regexs:
             logger.info(f'Check {rgs.regex_dns} to assign {self.dominio}')
             if re.search(rgs.regex_dns, self.dominio) is not None:
                 logger.info(f'DNS {self.dominio} empresa_regex={rgs.regex_dns}')
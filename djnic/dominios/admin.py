@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Dominio, PreDominio
+from .models import Dominio, DominioPriorityLog, PreDominio, WhoareInbox, WhoisArchive
 
 
 @admin.register(Dominio)
@@ -41,3 +41,41 @@ class PreDominioAdmin(admin.ModelAdmin):
     list_filter = ['priority']
     # 25 records per page
     list_per_page = 25
+
+
+@admin.register(DominioPriorityLog)
+class DominioPriorityLogAdmin(admin.ModelAdmin):
+
+    list_display = [
+        'dominio', 'source', 'momento', 'priority', 'next_update_priority',
+        'expired_since', 'readed_since', 'updated_since'
+    ]
+    list_select_related = ('dominio__zona', )
+    list_filter = ['source']
+    search_fields = ['dominio__nombre']
+    raw_id_fields = ['dominio']
+    list_per_page = 25
+
+
+@admin.register(WhoareInbox)
+class WhoareInboxAdmin(admin.ModelAdmin):
+
+    list_display = ['id', 'domain', 'status', 'received', 'processed', 'attempts', 'error']
+    list_filter = ['status']
+    search_fields = ['domain']
+    list_per_page = 25
+
+
+@admin.register(WhoisArchive)
+class WhoisArchiveAdmin(admin.ModelAdmin):
+
+    def size(self, obj):
+        return len(obj.data)
+
+    list_display = ['dominio', 'momento', 'kind', 'size']
+    list_select_related = ('dominio__zona', )
+    list_filter = ['kind']
+    search_fields = ['dominio__nombre']
+    raw_id_fields = ['dominio']
+    exclude = ['data']
+    list_per_page = 25
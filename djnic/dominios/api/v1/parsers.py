@@ -0,0 +1,36 @@
+import io
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from dominios.wire import NDJSON_CONTENT_TYPE, WireFormatError, decode_body, decode_ndjson
+
+
+def read_body(stream, parser_context):
+    """ Request body, uncompressed if needed (Content-Encoding: gzip) """
+    encoding = parser_context['request'].META.get('HTTP_CONTENT_ENCODING')
+    try:
+        return decode_body(stream.read(), encoding, max_size=settings.WHOARE_WIRE_MAX_BYTES)
+    except WireFormatError as e:
+        raise ParseError(str(e))
+
+
+class GzipJSONParser(JSONParser):
+    """ JSON, optionally gzip compressed """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if parser_context['request'].META.get('HTTP_CONTENT_ENCODING'):
+            stream = io.BytesIO(read_body(stream, parser_context))
+        return super().parse(stream, media_type, parser_context)
+
+
+class NDJSONParser(BaseParser):
+    """ One whoare dict per line, optionally gzip compressed.
+        Parsed as {"domains": [...]} """
+    media_type = NDJSON_CONTENT_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        body = read_body(stream, parser_context)
+        try:
+            return {'domains': decode_ndjson(body)}
+        except UnicodeDecodeError as e:
+            raise ParseError(f'NDJSON parse error - {e}')
@@ -25,6 +25,17 @@ class FlatDominioSerializer(serializers.ModelSerializer):
                   'registered', 'changed', 'expire', 'priority_to_update',
                   'next_update_priority']
 
+
+class LeasedDominioSerializer(serializers.ModelSerializer):
+    domain = serializers.CharField(read_only=True, source='full_domain')
+
+    class Meta:
+        model = Dominio
+        fields = ['id', 'domain', 'data_updated', 'data_readed', 'estado',
+                  'registered', 'changed', 'expire', 'priority_to_update',
+                  'next_update_priority', 'leased_until']
+
+
 class FlatPreDominioSerializer(serializers.ModelSerializer):
     domain = serializers.CharField(read_only=True, source='dominio')
 
@@ -3,7 +3,6 @@ import logging
 import random
 from cache_memoize import cache_memoize
 from django.conf import settings
-from whoare.whoare import WhoAre
 from django.utils import timezone
 from rest_framework import viewsets
 from rest_framework.permissions import DjangoModelPermissions
@@ -16,16 +15,28 @@ from django.db.models import F, Q
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import never_cache
 from rest_framework.decorators import action
-from dominios.models import Dominio, STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE, PreDominio
-from zonas.models import Zona
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
+from dominios.models import Dominio, DominioPriorityLog, STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE, PreDominio
+from dominios.exceptions import WhoareIngestError
+from dominios.ingest import load_whoare_payload, ingest_whoare_batch, ingest_whoare_object, enqueue_whoare_payloads
+from zonas.registry import zones
 from cambios.models import CampoCambio
+from .parsers import GzipJSONParser, NDJSONParser
 from .serializer import (DominioSerializer, CambiosDominioSerializer,
                          FlatDominioSerializer, FlatPreDominioSerializer,
-                         PreDominioSerializer)
+                         PreDominioSerializer, LeasedDominioSerializer)
 
 logger = logging.getLogger(__name__)
 
 
+def log_payload(name, data):
+    """ Payloads are big, log just a sample of them (opt-in) """
+    rate = settings.WHOARE_PAYLOAD_LOG_SAMPLE_RATE
+    if rate > 0 and random.random() < rate:
+        logger.info(f'{name}: {data}')
+
+
 class NoThrottle(BaseThrottle):
     """Throttle class that allows all requests"""
     def allow_request(self, request, view):
@@ -44,25 +55,25 @@ class DominioViewSet(viewsets.ModelViewSet):
     ordering_fields = '__all__'
     ordering = ['nombre']
 
-    @action(methods=['post'], detail=False)
+    @action(methods=['post'], detail=False, parser_classes=[GzipJSONParser, FormParser, MultiPartParser])
     def update_from_whoare(self, request):
         data = request.data  # require to be parsed
-        logger.info(f'update_from_whoare: {data}')
+        log_payload('update_from_whoare', data)
 
+        # a JSON string (from whoare push) or a dict
         real_data_str = data['domain']
-        logger.info(f'real data: {real_data_str}')
-
-        # final_data = ast.literal_eval(real_data_str)
-        final_data = json.loads(real_data_str)
-
-        if final_data.get('whoare_version', None) is None:
-            return JsonResponse({'ok': False, 'error': 'Missing WhoAre version'}, status=400)
 
-        if final_data['whoare_version'] < '0.1.40':
-            return JsonResponse({'ok': False, 'error': 'Unexpected WhoAre version'}, status=400)
+        if settings.WHOARE_INGEST_ASYNC:
+            # just validate and queue it, see the drain_whoare_inbox command
+            res = enqueue_whoare_payloads([real_data_str])[0]
+            if not res['ok']:
+                return JsonResponse({'ok': False, 'error': res['error']}, status=400)
+            return JsonResponse(res, status=202)
 
-        wa = WhoAre()
-        wa.from_dict(final_data)
+        try:
+            wa = load_whoare_payload(real_data_str)
+        except WhoareIngestError as e:
+            return JsonResponse({'ok': False, 'error': str(e)}, status=400)
 
         # if exists at pre-domains, remove it: we are done with this domain
         pres = PreDominio.objects.filter(dominio=wa.domain.full_name())
@@ -70,35 +81,64 @@ class DominioViewSet(viewsets.ModelViewSet):
             pre = pres[0]
             pre.delete()
 
-        # skipp not-real domains when it come from pre-domains
         if wa.domain.is_free:
+            # just updates, don't create the zone of a domain we don't have
+            zona = zones.get(wa.domain.zone)
+        else:
+            zona = zones.get_or_create(wa.domain.zone)
+        dominio = None
+        if zona is not None:
+            dominio = Dominio.objects.filter(nombre=wa.domain.base_name, zona=zona).first()
+        dominio, res = ingest_whoare_object(wa, zona=zona, dominio=dominio)
+        if not res['ok']:
+            return JsonResponse({'ok': False, 'error': res['error']}, status=400)
 
-            # Si ya existe entonces es un update, si no entonces no lo necesitamos
-            dominio = Dominio.get_from_full_domain(wa.domain.full_name())
-            if dominio is None:
-                return JsonResponse({'ok': False, 'error': 'We expect a REGISTERED domain'}, status=400)
-
-        zona, _ = Zona.objects.get_or_create(nombre=wa.domain.zone)
-        dominio, dominio_created = Dominio.objects.get_or_create(
-            nombre=wa.domain.base_name,
-            zona=zona
-            )
-
-        data = {
-            'update_from_whoare': {
-                'now': timezone.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
+        res = {
+            'ok': True,
+            'created': res['created'],
+            'cambios': res['cambios']
         }
-        dominio.update_extras(data, save=False)
-        dominio.save()
+        return JsonResponse(res)
 
-        cambios = dominio.update_from_wa_object(wa, just_created=dominio_created)
+    @action(
+        methods=['post'], detail=False,
+        parser_classes=[GzipJSONParser, NDJSONParser, FormParser, MultiPartParser]
+    )
+    def update_from_whoare_bulk(self, request):
+        """ Same as update_from_whoare for a list of whoare results.
+            Expects {"domains": [whoare_dict, ...]} (dicts or JSON strings)
+            or NDJSON (one whoare dict per line, see dominios.wire).
+            Both could be gzip compressed (Content-Encoding: gzip).
+            A "raw_data" string (the whois response) is archived to be parsed again (reparse_whois) """
+        domains = request.data.get('domains', None)
+        log_payload('update_from_whoare_bulk', domains)
+        if isinstance(domains, str):
+            try:
+                domains = json.loads(domains)
+            except ValueError:
+                return JsonResponse({'ok': False, 'error': 'Bad JSON at "domains"'}, status=400)
+
+        if not isinstance(domains, list) or len(domains) == 0:
+            return JsonResponse({'ok': False, 'error': 'Expected a list of domains'}, status=400)
+
+        max_items = settings.WHOARE_BULK_MAX_ITEMS
+        if len(domains) > max_items:
+            return JsonResponse({'ok': False, 'error': f'Too many domains, max {max_items}'}, status=400)
+
+        logger.info(f'update_from_whoare_bulk: {len(domains)} domains')
+        if settings.WHOARE_INGEST_ASYNC:
+            results = enqueue_whoare_payloads(domains)
+            status = 202
+        else:
+            results = ingest_whoare_batch(domains)
+            status = 200
         res = {
             'ok': True,
-            'created': dominio_created,
-            'cambios': cambios
+            'total': len(results),
+            'errors': len([r for r in results if not r['ok']]),
+            'results': results
         }
-        return JsonResponse(res)
+        return JsonResponse(res, status=status)
 
 
 class PreDominioViewSet(viewsets.ModelViewSet):
@@ -122,6 +162,10 @@ class NextPriorityDomainViewSet(viewsets.ModelViewSet):
     throttle_classes = [NoThrottle]
 
     def get_queryset(self):
+        if self.action == 'lease':
+            # just for permissions, the lease action don't use it
+            return Dominio.objects.all()
+
         # definir si mando uno de los posibles nuevos o de la base comun
         nuevos = PreDominio.objects.filter(priority__gt=0)
         pick = random.randint(1, 100)
@@ -135,47 +179,47 @@ class NextPriorityDomainViewSet(viewsets.ModelViewSet):
             res = self.get_from_predomain()
             return res
 
+    @action(methods=['post'], detail=False)
+    def lease(self, request):
+        """ Hand out the next N domains to update, each one leased to this caller.
+            Allow many whoare nodes to work in parallel without duplicated whois queries """
+        try:
+            limit = int(request.data.get('limit', 10))
+        except (TypeError, ValueError):
+            return JsonResponse({'ok': False, 'error': 'Bad limit'}, status=400)
+
+        limit = max(1, min(limit, settings.DOMAIN_LEASE_MAX_ITEMS))
+        dominios = Dominio.lease_for_update(limit=limit, lease_seconds=settings.DOMAIN_LEASE_SECONDS)
+        serializer = LeasedDominioSerializer(dominios, many=True)
+        return Response({'ok': True, 'results': serializer.data})
+
     def get_from_domain(self):
-        # This is a really heavy query with Django because we have 1.5 million
-        # records in the domains table
-
-        from django.db import connection
-        with connection.cursor() as cursor:
-            # Get a random ID from top 200 priority domains
-            cursor.execute("""
-                SELECT id FROM (
-                    SELECT id FROM dominios_dominio
-                    ORDER BY priority_to_update DESC
-                    LIMIT 200
-                ) AS top_domains
-                ORDER BY RANDOM()
-                LIMIT 1
-            """)
-            result = cursor.fetchone()
-            if result:
-                random_id = result[0]
-            else:
-                # Fallback if no domains found
-                cursor.execute("SELECT id FROM dominios_dominio ORDER BY RANDOM() LIMIT 1")
-                random_id = cursor.fetchone()[0]
-
-        random_item = Dominio.objects.get(id=random_id)
-
-        # remove priority
-        data = {
-            'picked_for_update': {
-                'now': timezone.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'old_priority': random_item.priority_to_update,
-                'old_new_next_update': random_item.next_update_priority.strftime("%Y-%m-%d %H:%M:%S"),
-            }
-        }
-        random_item.update_extras(data, save=False)
+        # We have 1.5 million records in the domains table.
+        # The top by priority is read from the priority index: no full sort of the table.
+        # Leased domains are already being updated by some other node.
+        available = Q(leased_until__isnull=True) | Q(leased_until__lt=timezone.now())
+        top_ids = Dominio.objects.filter(available).order_by('-priority_to_update')
+        top_ids = list(top_ids.values_list('id', flat=True)[:200])
+        if not top_ids:
+            self.serializer_class = FlatDominioSerializer
+            return Dominio.objects.none()
+
+        # Get a random ID from top 200 priority domains
+        random_id = random.choice(top_ids)
+        if DominioPriorityLog.sampled():
+            priority, next_update = Dominio.objects.values_list(
+                'priority_to_update', 'next_update_priority'
+            ).get(id=random_id)
+            DominioPriorityLog.objects.create(
+                dominio_id=random_id,
+                source=DominioPriorityLog.SOURCE_PICKED,
+                priority=priority,
+                next_update_priority=next_update,
+            )
         # Vemos casos que van a cero y despues no se leen realmente
-        # random_item.priority_to_update = 0
-        # random_item.next_update_priority = timezone.now() + timedelta(days=5)
-        random_item.save()
+        # No cambiamos la prioridad aca
         self.serializer_class = FlatDominioSerializer
-        res = Dominio.objects.filter(pk=random_item.id)
+        res = Dominio.objects.filter(pk=random_id)
         return res
 
     def get_from_predomain(self):
@@ -190,13 +234,9 @@ class NextPriorityDomainViewSet(viewsets.ModelViewSet):
             nuevos = nuevos[:200]
         random_item = random.choice(nuevos)
 
-        # si ya existe en dominios, omitir
-        wa = WhoAre()
-        domain_name, zone = wa.detect_zone(random_item.dominio)
-        zona = Zona.objects.get(nombre=zone)
-
-        dominios = Dominio.objects.filter(nombre=domain_name, zona=zona)
-        if dominios.count() > 0:
+        # si ya existe en dominios (o la zona ya no existe), omitir
+        domain_name, zona = zones.detect(random_item.dominio)
+        if zona is None or Dominio.objects.filter(nombre=domain_name, zona=zona).exists():
             random_item.priority = 0
             random_item.save()
             return self.get_from_domain()
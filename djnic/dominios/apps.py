@@ -3,3 +3,16 @@ from django.apps import AppConfig
 
 class DominiosConfig(AppConfig):
     name = 'dominios'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from dominios.priority import registry
+        from zonas.models import Zona, ZonaEnGrupo
+
+        def invalidate_priority_rules(sender, **kwargs):
+            registry.invalidate()
+
+        for model in (Zona, ZonaEnGrupo):
+            name = model.__name__
+            post_save.connect(invalidate_priority_rules, sender=model, dispatch_uid=f'priority_rules_save_{name}')
+            post_delete.connect(invalidate_priority_rules, sender=model, dispatch_uid=f'priority_rules_delete_{name}')
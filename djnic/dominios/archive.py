@@ -0,0 +1,46 @@
+""" Compressed whois data for the WhoisArchive model.
+    The raw whois response when we have it, the whoare dict if not
+    (results from whoare-serve nodes) """
+import json
+import zlib
+from whoare.base import Domain
+from whoare.whoare import WhoAre
+
+
+KIND_RAW = 'raw'
+KIND_WHOARE = 'whoare'
+COMPRESSION_LEVEL = 9
+
+
+def whoare_payload(wa):
+    """ Best data we have to rebuild a WhoAre object: (kind, text) """
+    if wa.raw_data:
+        return KIND_RAW, wa.raw_data
+    return KIND_WHOARE, json.dumps(wa.as_dict(), separators=(',', ':'))
+
+
+def compress(text):
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(bytes(data)).decode('utf-8')
+
+
+def whoare_from_raw(domain, raw):
+    """ Parse a whois response without network access (same as WhoAre.load) """
+    wa = WhoAre()
+    domain_name, zone = wa.detect_zone(domain)
+    wa.child = wa.detect_subclass(zone)()
+    wa.domain = Domain(domain_name, zone)
+    wa.load_from_raw(raw)
+    wa.raw_data = raw
+    return wa
+
+
+def whoare_from_payload(domain, kind, text):
+    if kind == KIND_RAW:
+        return whoare_from_raw(domain, text)
+    wa = WhoAre()
+    wa.from_dict(json.loads(text))
+    return wa
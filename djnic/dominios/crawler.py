@@ -0,0 +1,178 @@
+""" Concurrent whois crawler.
+    Whois queries run at a pool of threads (rate limited by whois server)
+    while the main thread writes the results to the database """
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+from whoare.whoare import WhoAre
+from whoare.exceptions import TooManyQueriesError
+from core.ratelimit import TokenBucket
+from dominios.models import STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE
+
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 300
+
+
+def count_cambios(stats, cambios):
+    """ Classify the changes from a whois read """
+    if cambios == []:
+        stats['sin_cambios'] += 1
+    elif 'estado' in [c['campo'] for c in cambios]:
+        for cambio in cambios:
+            if cambio['campo'] == 'estado':
+                if cambio['anterior'] == STATUS_DISPONIBLE:
+                    stats['nuevos'] += 1
+                elif cambio['anterior'] == STATUS_NO_DISPONIBLE:
+                    stats['caidos'] += 1
+    elif 'dominio_expire' in [c['campo'] for c in cambios]:
+        stats['renovados'] += 1
+
+
+class ServerLimiter:
+    """ Rate limit for a whois server.
+        Halve the rate and pause (exponential backoff) when the server
+        complains, recover slowly with each success """
+
+    def __init__(self, rate, burst=1, min_rate=None, backoff=15):
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.backoff = backoff
+        self.failures = 0
+        self.bucket = TokenBucket(rate, capacity=burst)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        return self.bucket.acquire()
+
+    def too_many_queries(self):
+        with self.lock:
+            self.failures += 1
+            pause = min(MAX_BACKOFF_SECONDS, self.backoff * 2 ** (self.failures - 1))
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+        self.bucket.pause(pause)
+        return pause
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            if self.bucket.rate < self.max_rate:
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.max_rate / 10))
+
+
+class WhoisCrawler:
+
+    def __init__(self, workers=4, rate=0.5, burst=1, backoff=15, max_retries=3, mock_from_txt_file=None):
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.backoff = backoff
+        self.max_retries = max_retries
+        self.mock_from_txt_file = mock_from_txt_file
+        self.limiters = {}
+        self.servers = {}  # zone -> whois server key
+        self.lock = threading.Lock()
+        self.stats = {
+            'processed': 0, 'errors': 0, 'retries': 0, 'too_many_queries': 0,
+            'sin_cambios': 0, 'caidos': 0, 'nuevos': 0, 'renovados': 0,
+            'waited': 0.0, 'elapsed': 0.0,
+        }
+
+    def server_for(self, zone):
+        """ All the zones parsed by the same whoare class use the same whois server """
+        if zone not in self.servers:
+            try:
+                self.servers[zone] = WhoAre().detect_subclass(zone).__name__
+            except Exception:
+                self.servers[zone] = zone
+        return self.servers[zone]
+
+    def limiter_for(self, server):
+        with self.lock:
+            if server not in self.limiters:
+                self.limiters[server] = ServerLimiter(self.rate, burst=self.burst, backoff=self.backoff)
+            return self.limiters[server]
+
+    def fetch(self, domain, server):
+        """ Runs at the worker threads, no database access here.
+            Returns (WhoAre object, error, retry) """
+        limiter = self.limiter_for(server)
+        waited = limiter.acquire()
+        with self.lock:
+            self.stats['waited'] += waited
+
+        wa = WhoAre()
+        try:
+            wa.load(domain, mock_from_txt_file=self.mock_from_txt_file)
+        except TooManyQueriesError:
+            pause = limiter.too_many_queries()
+            logger.warning(f'Too many queries at {server}, pause {pause}s')
+            return None, 'Too many queries', True
+        except Exception as e:
+            return None, str(e), False
+
+        limiter.success()
+        return wa, None, False
+
+    def run(self, dominios, on_result=None):
+        """ Read and update all the domains.
+            on_result(dominio, cambios, error) is called from the main thread """
+        started = time.monotonic()
+        queue = deque((dominio, 0) for dominio in dominios)
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while queue or pending:
+                # keep the workers busy without reading all the whois at once
+                while queue and len(pending) < self.workers * 2:
+                    dominio, attempt = queue.popleft()
+                    server = self.server_for(dominio.zona.nombre)
+                    future = executor.submit(self.fetch, dominio.full_domain(), server)
+                    pending[future] = (dominio, attempt)
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dominio, attempt = pending.pop(future)
+                    wa, error, retry = future.result()
+                    if retry:
+                        self.stats['too_many_queries'] += 1
+                        if attempt < self.max_retries:
+                            self.stats['retries'] += 1
+                            queue.append((dominio, attempt + 1))
+                            continue
+                    self.save(dominio, wa, error, on_result)
+
+        self.stats['elapsed'] = time.monotonic() - started
+        return self.stats
+
+    def save(self, dominio, wa, error, on_result):
+        """ Database writes, always at the main thread """
+        self.stats['processed'] += 1
+        cambios = None
+        if error is None:
+            try:
+                cambios = dominio.update_from_wa_object(wa, just_created=False)
+            except Exception as e:
+                logger.exception(f'Error updating {dominio}')
+                error = str(e)
+
+        if error is None:
+            count_cambios(self.stats, cambios)
+        else:
+            self.stats['errors'] += 1
+        if on_result is not None:
+            on_result(dominio, cambios, error)
+
+    def summary(self):
+        stats = self.stats
+        rate = stats['processed'] / stats['elapsed'] if stats['elapsed'] else 0
+        return (
+            f"{stats['processed']} processed in {stats['elapsed']:.1f}s ({rate:.2f} domains/s). "
+            f"errors {stats['errors']} too_many_queries {stats['too_many_queries']} retries {stats['retries']} "
+            f"rate limit wait {stats['waited']:.1f}s\n"
+            f"sin_cambios {stats['sin_cambios']} caidos {stats['caidos']} "
+            f"nuevos {stats['nuevos']} renovados {stats['renovados']}"
+        )
@@ -0,0 +1,78 @@
+""" Differences between a stored domain and a new WhoAre read """
+from django.utils import timezone
+from core.tz import get_tz
+from dominios.models import STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE
+
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def wall_clock(value, tz=None):
+    """ Local naive datetime, to the second, as we show it at the changes.
+        Stored values (UTC) are moved to the zone tz,
+        whois values are already at the zone tz """
+    if value is None:
+        return None
+    if tz is not None:
+        value = timezone.localtime(value, tz)
+    return value.replace(tzinfo=None, microsecond=0)
+
+
+def as_text(value):
+    return '' if value is None else value.strftime(DATE_FORMAT)
+
+
+def diff_dates(cambios, campo, stored, readed, tz):
+    """ Compare datetimes and format just if they changed """
+    r_val = wall_clock(stored, tz)
+    w_val = wall_clock(readed)
+    if r_val != w_val:
+        cambios.append({"campo": campo, "anterior": as_text(r_val), "nuevo": as_text(w_val)})
+
+
+def diff_whoare(dominio, wa):
+    """ List of changes between a domain and its new WhoAre version
+        [{"campo": ..., "anterior": ..., "nuevo": ...}] """
+    cambios = []
+    if dominio.estado == STATUS_NO_DISPONIBLE and wa.domain.is_free:
+        cambios.append({"campo": "estado", "anterior": STATUS_NO_DISPONIBLE, "nuevo": STATUS_DISPONIBLE})
+    elif dominio.estado == STATUS_DISPONIBLE and not wa.domain.is_free:
+        cambios.append({"campo": "estado", "anterior": STATUS_DISPONIBLE, "nuevo": STATUS_NO_DISPONIBLE})
+
+    tz = get_tz(dominio.zona.tz)
+    diff_dates(cambios, 'dominio_registered', dominio.registered, wa.domain.registered, tz)
+    diff_dates(cambios, 'dominio_changed', dominio.changed, wa.domain.changed, tz)
+    diff_dates(cambios, 'dominio_expire', dominio.expire, wa.domain.expire, tz)
+
+    registrante = dominio.registrante
+    r_name = '' if registrante is None else registrante.name
+    r_legal_uid = '' if registrante is None else registrante.legal_uid
+    w_name = '' if wa.registrant is None else wa.registrant.name
+    w_legal_uid = '' if wa.registrant is None else wa.registrant.legal_uid
+
+    if r_name.lower() != w_name.lower():
+        cambios.append({"campo": "registrant_name", "anterior": r_name, "nuevo": w_name})
+
+    if r_legal_uid != w_legal_uid:
+        cambios.append({"campo": "registrant_legal_uid", "anterior": r_legal_uid, "nuevo": w_legal_uid})
+
+    # missing registrant dates are compared as empty values
+    r_created = None if registrante is None else registrante.created
+    r_changed = None if registrante is None else registrante.changed
+    w_created = None if wa.registrant is None else wa.registrant.created
+    w_changed = None if wa.registrant is None else wa.registrant.changed
+    diff_dates(cambios, 'registrant_created', r_created, w_created, tz)
+    diff_dates(cambios, 'registrant_changed', r_changed, w_changed, tz)
+
+    r_dnss = [d.dns.dominio for d in dominio.get_dnss_rows()]
+    w_dnss = [d.name for d in wa.dnss]
+
+    max_len = max(len(r_dnss), len(w_dnss))
+    for n in range(max_len):
+        r_val = '' if (n+1) > len(r_dnss) else r_dnss[n]
+        w_val = '' if (n+1) > len(w_dnss) else w_dnss[n]
+
+        if r_val != w_val:
+            cambios.append({"campo": f"DNS{n+1}", "anterior": r_val, "nuevo": w_val})
+
+    return cambios
@@ -0,0 +1,3 @@
+class WhoareIngestError(Exception):
+    """ A whoare payload can't be used to update a domain """
+    pass
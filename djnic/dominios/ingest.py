@@ -0,0 +1,215 @@
+""" Ingest whoare results (sent by whoare-serve nodes) into the database """
+import json
+import logging
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from whoare.whoare import WhoAre
+from dominios.exceptions import WhoareIngestError
+from dominios.models import Dominio, DominioPriorityLog, PreDominio, WhoareInbox
+from registrantes.resolver import resolver
+from zonas.registry import zones
+
+
+logger = logging.getLogger(__name__)
+MIN_WHOARE_VERSION = '0.1.40'
+# inbox items failing as a whole batch are retried this number of times
+INBOX_MAX_ATTEMPTS = 3
+
+
+def load_whoare_payload(payload):
+    """ Validate a whoare dict (or its JSON string) and build the WhoAre object
+        Raises WhoareIngestError if the payload is not usable """
+
+    if isinstance(payload, (str, bytes)):
+        try:
+            payload = json.loads(payload)
+        except ValueError as e:
+            raise WhoareIngestError(f'Bad JSON: {e}')
+
+    if not isinstance(payload, dict):
+        raise WhoareIngestError('Expected a whoare dict')
+
+    if payload.get('whoare_version', None) is None:
+        raise WhoareIngestError('Missing WhoAre version')
+
+    if payload['whoare_version'] < MIN_WHOARE_VERSION:
+        raise WhoareIngestError('Unexpected WhoAre version')
+
+    wa = WhoAre()
+    try:
+        wa.from_dict(payload)
+    except (KeyError, TypeError, ValueError) as e:
+        raise WhoareIngestError(f'Bad whoare data: {e}')
+    # optional whois response, archived to be parsed again (see reparse_whois)
+    if isinstance(payload.get('raw_data'), str) and payload['raw_data']:
+        wa.raw_data = payload['raw_data']
+    return wa
+
+
+def ingest_whoare_batch(payloads):
+    """ Update a list of domains from whoare payloads in one transaction.
+        Zones, pre-domains and existing domains are resolved with set-based queries.
+        Each item runs in its own savepoint so one bad item does not fail the batch.
+        Returns a list of results (one per payload, same order) """
+
+    results = [None] * len(payloads)
+    items = []  # (position, WhoAre object)
+    for n, payload in enumerate(payloads):
+        try:
+            wa = load_whoare_payload(payload)
+        except WhoareIngestError as e:
+            results[n] = {'domain': None, 'ok': False, 'error': str(e)}
+            continue
+        items.append((n, wa))
+
+    if not items:
+        return results
+
+    with transaction.atomic():
+        # we are done with this domains at pre-domains
+        full_names = {wa.domain.full_name() for _, wa in items}
+        PreDominio.objects.filter(dominio__in=full_names).delete()
+
+        zone_names = {wa.domain.zone for _, wa in items}
+        # free domains are just updates, they don't create zones
+        registered_zones = {wa.domain.zone for _, wa in items if not wa.domain.is_free}
+        zonas = {
+            zone_name: zones.get_or_create(zone_name) if zone_name in registered_zones else zones.get(zone_name)
+            for zone_name in zone_names
+        }
+
+        query = Q()
+        for zone_name in zone_names:
+            if zonas[zone_name] is None:
+                continue
+            names = {wa.domain.base_name for _, wa in items if wa.domain.zone == zone_name}
+            query |= Q(zona=zonas[zone_name], nombre__in=names)
+        dominios = Dominio.objects.filter(query).select_related('zona', 'registrante') if query else []
+        dominios = {(dominio.nombre, dominio.zona_id): dominio for dominio in dominios}
+
+        # one query for all the registrants in the batch
+        resolver.prefetch({wa.registrant.legal_uid for _, wa in items if wa.registrant is not None})
+
+        for n, wa in items:
+            zona = zonas[wa.domain.zone]
+            if zona is None:
+                results[n] = {'domain': wa.domain.full_name(), 'ok': False, 'error': 'We expect a REGISTERED domain'}
+                continue
+            key = (wa.domain.base_name, zona.id)
+            dominio = dominios.get(key)
+            try:
+                with transaction.atomic():
+                    dominio, results[n] = ingest_whoare_object(wa, zona=zona, dominio=dominio)
+            except Exception as e:
+                logger.exception(f'Error ingesting {wa.domain.full_name()}')
+                results[n] = {'domain': wa.domain.full_name(), 'ok': False, 'error': str(e)}
+                # the in-memory object could be dirty after the rollback
+                dominio = Dominio.objects.filter(nombre=wa.domain.base_name, zona=zona).first()
+
+            if dominio is not None:
+                dominios[key] = dominio
+
+    return results
+
+
+def ingest_whoare_object(wa, zona, dominio=None):
+    """ Update (or create) a single domain from an already validated WhoAre object.
+        dominio is the already loaded domain (None if it's not at the database)
+        Returns the domain object (None if not created) and the result dict """
+
+    # skipp not-real domains when it come from pre-domains
+    if wa.domain.is_free and dominio is None:
+        return None, {'domain': wa.domain.full_name(), 'ok': False, 'error': 'We expect a REGISTERED domain'}
+
+    dominio_created = dominio is None
+    if dominio_created:
+        dominio = Dominio.objects.create(nombre=wa.domain.base_name, zona=zona)
+
+    cambios = dominio.update_from_wa_object(wa, just_created=dominio_created)
+    if DominioPriorityLog.sampled():
+        DominioPriorityLog.objects.create(
+            dominio=dominio,
+            source=DominioPriorityLog.SOURCE_WHOARE,
+            priority=dominio.priority_to_update,
+            next_update_priority=dominio.next_update_priority,
+        )
+    return dominio, {
+        'domain': wa.domain.full_name(),
+        'ok': True,
+        'created': dominio_created,
+        'cambios': cambios,
+    }
+
+
+def enqueue_whoare_payloads(payloads):
+    """ Async mode: validate the payloads and append them to the inbox.
+        Returns a list of results (one per payload, same order) """
+
+    results = [None] * len(payloads)
+    items = []  # (position, inbox object)
+    for n, payload in enumerate(payloads):
+        if isinstance(payload, (str, bytes)):
+            try:
+                payload = json.loads(payload)
+            except ValueError as e:
+                results[n] = {'domain': None, 'ok': False, 'error': f'Bad JSON: {e}'}
+                continue
+        try:
+            wa = load_whoare_payload(payload)
+        except WhoareIngestError as e:
+            results[n] = {'domain': None, 'ok': False, 'error': str(e)}
+            continue
+        items.append((n, WhoareInbox(domain=wa.domain.full_name(), payload=payload)))
+
+    # ids are required at the response (PG return them, others don't)
+    if items:
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                WhoareInbox.objects.bulk_create([inbox for _, inbox in items])
+            else:
+                for _, inbox in items:
+                    inbox.save()
+
+    for n, inbox in items:
+        results[n] = {'domain': inbox.domain, 'ok': True, 'queued': inbox.id}
+    return results
+
+
+def drain_whoare_inbox(batch_size=100):
+    """ Ingest the next batch of pending inbox items (in arrival order).
+        Returns the number of processed items and errors """
+
+    inbox = WhoareInbox.claim(batch_size)
+    if not inbox:
+        return 0, 0
+
+    try:
+        results = ingest_whoare_batch([item.payload for item in inbox])
+    except Exception as e:
+        # the whole batch failed (e.g. database problems), try again later
+        logger.exception('Error draining the whoare inbox')
+        for item in inbox:
+            if item.attempts < INBOX_MAX_ATTEMPTS:
+                item.status = WhoareInbox.STATUS_PENDING
+            else:
+                item.status = WhoareInbox.STATUS_ERROR
+                item.processed = timezone.now()
+            item.error = str(e)
+        WhoareInbox.objects.bulk_update(inbox, ['status', 'processed', 'error'])
+        return 0, len(inbox)
+
+    now = timezone.now()
+    errors = 0
+    for item, result in zip(inbox, results):
+        item.processed = now
+        if result['ok']:
+            item.status = WhoareInbox.STATUS_DONE
+            item.error = None
+            item.result = {'created': result['created'], 'cambios': len(result['cambios'])}
+        else:
+            errors += 1
+            item.status = WhoareInbox.STATUS_ERROR
+            item.error = result['error']
+    WhoareInbox.objects.bulk_update(inbox, ['status', 'processed', 'error', 'result'])
+    return len(inbox), errors
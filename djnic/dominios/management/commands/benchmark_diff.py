@@ -0,0 +1,127 @@
+import logging
+import time
+import pytz
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from whoare.whoare import WhoAre
+from dominios.diff import diff_whoare
+from dominios.models import Dominio, STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE
+from registrantes.models import Registrante
+from zonas.models import Zona
+
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_diff(dominio, wa):
+    """ The diff from apply_new_version before dominios.diff, to compare """
+    def zoned(value):
+        logger.info(f'Transforming date {value} {dominio.zona.tz}')
+        return timezone.localtime(value, pytz.timezone(dominio.zona.tz))
+
+    cambios = []
+    if dominio.estado == STATUS_NO_DISPONIBLE and wa.domain.is_free:
+        cambios.append({"campo": "estado", "anterior": STATUS_NO_DISPONIBLE, "nuevo": STATUS_DISPONIBLE})
+    elif dominio.estado == STATUS_DISPONIBLE and not wa.domain.is_free:
+        cambios.append({"campo": "estado", "anterior": STATUS_DISPONIBLE, "nuevo": STATUS_NO_DISPONIBLE})
+
+    for campo, r_date, w_date in [
+        ('dominio_registered', dominio.registered, wa.domain.registered),
+        ('dominio_changed', dominio.changed, wa.domain.changed),
+        ('dominio_expire', dominio.expire, wa.domain.expire),
+    ]:
+        r_val = '' if r_date is None else zoned(r_date).strftime("%Y-%m-%d %H:%M:%S")
+        w_val = '' if w_date is None else w_date.strftime("%Y-%m-%d %H:%M:%S")
+        if r_val != w_val:
+            cambios.append({"campo": campo, "anterior": r_val, "nuevo": w_val})
+
+    if dominio.registrante is not None:
+        r_name = dominio.registrante.name
+        r_legal_uid = dominio.registrante.legal_uid
+        r_created = timezone.localtime(
+            dominio.registrante.created, pytz.timezone(dominio.zona.tz)
+        ).strftime("%Y-%m-%d %H:%M:%S")
+        r_changed = timezone.localtime(
+            dominio.registrante.changed, pytz.timezone(dominio.zona.tz)
+        ).strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        r_name, r_legal_uid, r_created, r_changed = ('', '', '', '')
+
+    if wa.registrant is not None:
+        w_name = wa.registrant.name
+        w_legal_uid = wa.registrant.legal_uid
+        w_created = wa.registrant.created.strftime("%Y-%m-%d %H:%M:%S")
+        w_changed = wa.registrant.changed.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        w_name, w_legal_uid, w_created, w_changed = ('', '', '', '')
+
+    if r_name.lower() != w_name.lower():
+        cambios.append({"campo": "registrant_name", "anterior": r_name, "nuevo": w_name})
+    if r_legal_uid != w_legal_uid:
+        cambios.append({"campo": "registrant_legal_uid", "anterior": r_legal_uid, "nuevo": w_legal_uid})
+    if r_created != w_created:
+        cambios.append({"campo": "registrant_created", "anterior": r_created, "nuevo": w_created})
+    if r_changed != w_changed:
+        cambios.append({"campo": "registrant_changed", "anterior": r_changed, "nuevo": w_changed})
+
+    r_dnss = [d.dns.dominio for d in dominio.get_dnss_rows()]
+    w_dnss = [d.name for d in wa.dnss]
+    for n in range(max(len(r_dnss), len(w_dnss))):
+        r_val = '' if (n+1) > len(r_dnss) else r_dnss[n]
+        w_val = '' if (n+1) > len(w_dnss) else w_dnss[n]
+        if r_val != w_val:
+            cambios.append({"campo": f"DNS{n+1}", "anterior": r_val, "nuevo": w_val})
+
+    return cambios
+
+
+def build_stored_domain(wa):
+    """ Unsaved domain (no queries) with the data from a WhoAre object """
+    zona = Zona(nombre=wa.domain.zone, tz='America/Argentina/Cordoba')
+    dominio = Dominio(
+        nombre=wa.domain.base_name, zona=zona,
+        estado=STATUS_DISPONIBLE if wa.domain.is_free else STATUS_NO_DISPONIBLE,
+        registered=wa.domain.registered, changed=wa.domain.changed, expire=wa.domain.expire,
+    )
+    if wa.registrant is not None:
+        dominio.registrante = Registrante(
+            name=wa.registrant.name, legal_uid=wa.registrant.legal_uid,
+            created=wa.registrant.created, changed=wa.registrant.changed,
+        )
+    # DNSs are not part of this benchmark
+    dominio._dnss_rows = []
+    return dominio
+
+
+class Command(BaseCommand):
+    help = 'Compare the cost of the legacy and the new whois diff (no database writes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', nargs='?', type=int, default=20000)
+        parser.add_argument('--stored', nargs='?', type=str, default='djnic/whosamples/sample_fernet.txt', help='whois sample for the stored domain')
+        parser.add_argument('--readed', nargs='?', type=str, default='djnic/whosamples/sample_fernet_updated.txt', help='whois sample for the new read')
+
+    def handle(self, *args, **options):
+        stored = WhoAre()
+        stored.load('fernet.com.ar', mock_from_txt_file=options['stored'])
+        readed = WhoAre()
+        readed.load('fernet.com.ar', mock_from_txt_file=options['readed'])
+        dominio = build_stored_domain(stored)
+        iterations = options['iterations']
+
+        legacy = legacy_diff(dominio, readed)
+        new = diff_whoare(dominio, readed)
+        if legacy != new:
+            self.stdout.write(self.style.ERROR(f'Different results\n{legacy}\n{new}'))
+            return
+
+        results = {}
+        for name, func in [('legacy', legacy_diff), ('new', diff_whoare)]:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                func(dominio, readed)
+            elapsed = time.perf_counter() - started
+            results[name] = elapsed / iterations * 1_000_000
+            self.stdout.write(f'{name}: {results[name]:.1f} µs per read ({len(new)} changes)')
+
+        self.stdout.write(self.style.SUCCESS(f"Speedup x{results['legacy'] / results['new']:.1f}"))
@@ -0,0 +1,290 @@
+from datetime import datetime, timedelta
+import glob
+import json
+import logging
+import os
+import random
+import re
+import resource
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from dominios.archive import whoare_from_raw
+from dominios.ingest import drain_whoare_inbox, ingest_whoare_batch
+from dominios.models import DNSDominio, Dominio, WhoareInbox
+from dominios.wire import encode_whoare_batch
+from dnss.models import DNS
+from registrantes.models import Registrante
+from subscriptions.models import Event
+from zonas.models import Zona
+
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f %z'
+SAMPLES = os.path.join(settings.BASE_DIR, 'djnic', 'whosamples', '*.txt')
+SINGLE_EP = '/api/v1/dominios/dominio/update_from_whoare/'
+BULK_EP = '/api/v1/dominios/dominio/update_from_whoare_bulk/'
+MODES = ['single', 'bulk', 'async', 'direct']
+
+
+def load_templates(pattern=SAMPLES):
+    """ whoare dicts of the registered domains at the whois samples """
+    templates = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            raw = f.read()
+        domain = re.search(r'^domain:\s*(\S+)', raw, re.MULTILINE)
+        if domain is None:
+            continue
+        try:
+            wa = whoare_from_raw(domain.group(1), raw)
+        except Exception as e:
+            logger.error(f'Bad whois sample {path}: {e}')
+            continue
+        if not wa.domain.is_free:
+            templates.append(wa.as_dict())
+    return templates
+
+
+def registrant_prefix(zone):
+    return f'bench-{zone}-'
+
+
+def shift_date(value, days):
+    return (datetime.strptime(value, DATE_FORMAT) + timedelta(days=days)).strftime(DATE_FORMAT)
+
+
+class PayloadGenerator:
+    """ Synthetic whoare payloads: a first read for each domain and then
+        rounds of reads with random drops, renewals, transfers and DNS changes """
+
+    def __init__(self, templates, domains, zone, rnd, drop=0.02, renew=0.1, transfer=0.03, dns=0.05):
+        self.rnd = rnd
+        self.uid_prefix = registrant_prefix(zone)
+        self.rates = [('drop', drop), ('renew', renew), ('transfer', transfer), ('dns', dns)]
+        self.payloads = []
+        for n in range(domains):
+            payload = json.loads(json.dumps(rnd.choice(templates)))
+            payload['whoare_version'] = '0.2.4'
+            payload['domain']['base_name'] = f'bench{n}'
+            payload['domain']['zone'] = zone
+            payload['registrant']['legal_uid'] = f'{self.uid_prefix}{rnd.randint(1, max(1, domains // 5))}'
+            self.payloads.append(payload)
+        self.mutations = {name: 0 for name, _ in self.rates}
+
+    def mutate(self, payload):
+        if payload['domain']['is_free']:
+            return payload
+        pick = self.rnd.random()
+        for name, rate in self.rates:
+            if pick < rate:
+                self.mutations[name] += 1
+                return getattr(self, f'mutate_{name}')(payload)
+            pick -= rate
+        return payload
+
+    def mutate_drop(self, payload):
+        return {
+            'whoare_version': payload['whoare_version'],
+            'domain': {'base_name': payload['domain']['base_name'], 'zone': payload['domain']['zone'], 'is_free': True},
+        }
+
+    def mutate_renew(self, payload):
+        payload = json.loads(json.dumps(payload))
+        payload['domain']['expire'] = shift_date(payload['domain']['expire'], 365)
+        payload['domain']['changed'] = shift_date(payload['domain']['changed'], 1)
+        return payload
+
+    def mutate_transfer(self, payload):
+        payload = json.loads(json.dumps(payload))
+        uid = f'{self.uid_prefix}t{self.rnd.randint(1, 10 ** 9)}'
+        payload['registrant'] = dict(payload['registrant'], legal_uid=uid, name=f'Registrant {uid}')
+        payload['domain']['changed'] = shift_date(payload['domain']['changed'], 1)
+        return payload
+
+    def mutate_dns(self, payload):
+        payload = json.loads(json.dumps(payload))
+        n = self.rnd.randint(1, 50)
+        payload['dnss'] = [f'ns1.hosting{n}.com', f'ns2.hosting{n}.com']
+        return payload
+
+    def rounds(self, rounds):
+        """ List of reads for each round (the first one creates the domains) """
+        yield list(self.payloads)
+        for _ in range(rounds):
+            self.payloads = [self.mutate(payload) for payload in self.payloads]
+            yield list(self.payloads)
+
+
+class QueryCounter:
+    """ Count queries without DEBUG (connection.execute_wrapper) """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Measure the whoare ingestion (API, bulk, async and direct) with synthetic payloads and a local database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domains', nargs='?', type=int, default=500)
+        parser.add_argument('--rounds', nargs='?', type=int, default=3, help='Reads of each domain after the first one')
+        parser.add_argument('--modes', nargs='?', type=str, default='single,bulk,async,direct', help=f'Comma separated {MODES}')
+        parser.add_argument('--batch-size', nargs='?', type=int, default=100, help='Domains per request for bulk and async')
+        parser.add_argument('--drop', nargs='?', type=float, default=0.02, help='Share of domains dropped each round')
+        parser.add_argument('--renew', nargs='?', type=float, default=0.1, help='Share of domains renewed each round')
+        parser.add_argument('--transfer', nargs='?', type=float, default=0.03, help='Share of domains transferred each round')
+        parser.add_argument('--dns', nargs='?', type=float, default=0.05, help='Share of domains changing DNS each round')
+        parser.add_argument('--seed', nargs='?', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark domains at the database')
+        parser.add_argument(
+            '--i-know-this-writes', action='store_true',
+            help='Run with DEBUG=False: it writes (and deletes) data at the configured database'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['i_know_this_writes']:
+            raise CommandError(
+                f"This writes to the {connection.settings_dict['NAME']} database, "
+                "use it with DEBUG=True or --i-know-this-writes"
+            )
+
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        for mode in modes:
+            if mode not in MODES:
+                self.stdout.write(self.style.ERROR(f'Unknown mode {mode}'))
+                return
+
+        templates = load_templates()
+        self.stdout.write(f'{len(templates)} templates, {options["domains"]} domains, {options["rounds"]} rounds')
+        self.client = APIClient()
+        self.client.force_authenticate(User(username='benchmark', is_active=True, is_superuser=True))
+
+        for mode in modes:
+            zone = f'{mode}.bench.ar'
+            self.cleanup(zone)
+            # DNS rows created from here are from the benchmark
+            self.last_dns_id = DNS.objects.aggregate(last=Max('id'))['last'] or 0
+            generator = PayloadGenerator(
+                templates, options['domains'], zone, random.Random(options['seed']),
+                drop=options['drop'], renew=options['renew'], transfer=options['transfer'], dns=options['dns'],
+            )
+            with override_settings(ALLOWED_HOSTS=['*'], WHOARE_PAYLOAD_LOG_SAMPLE_RATE=0):
+                report = self.run_mode(mode, generator.rounds(options['rounds']), options['batch_size'])
+            report['mutations'] = generator.mutations
+            self.report(mode, report)
+            if not options['keep']:
+                self.cleanup(zone)
+
+    def run_mode(self, mode, rounds, batch_size):
+        counter = QueryCounter()
+        latencies = []  # seconds per call
+        domains = errors = 0
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            for payloads in rounds:
+                if mode == 'single':
+                    calls = [[payload] for payload in payloads]
+                else:
+                    calls = [payloads[n:n + batch_size] for n in range(0, len(payloads), batch_size)]
+                for call in calls:
+                    call_started = time.perf_counter()
+                    errors += self.send(mode, call)
+                    latencies.append(time.perf_counter() - call_started)
+                    domains += len(call)
+
+            if mode == 'async':
+                # the work is done when the inbox is empty
+                while True:
+                    processed, drain_errors = drain_whoare_inbox(batch_size=batch_size)
+                    if processed == 0 and drain_errors == 0:
+                        break
+                    errors += drain_errors
+
+        elapsed = time.perf_counter() - started
+        return {
+            'domains': domains,
+            'errors': errors,
+            'elapsed': elapsed,
+            'queries': counter.count,
+            'latencies': latencies,
+        }
+
+    def send(self, mode, payloads):
+        """ Ingest a call, returns the number of errors """
+        if mode == 'direct':
+            return len([r for r in ingest_whoare_batch(payloads) if not r['ok']])
+
+        if mode == 'single':
+            # same as whoare push: a JSON string in a form
+            resp = self.client.post(SINGLE_EP, {'domain': json.dumps(payloads[0])})
+            # free domains not at the database are errors too
+            return 0 if resp.status_code == 200 else 1
+
+        body, headers = encode_whoare_batch(payloads)
+        with override_settings(WHOARE_INGEST_ASYNC=mode == 'async'):
+            resp = self.client.generic(
+                'POST', BULK_EP, body, content_type=headers['Content-Type'],
+                HTTP_CONTENT_ENCODING=headers['Content-Encoding']
+            )
+        if resp.status_code not in (200, 202):
+            return len(payloads)
+        return resp.json()['errors']
+
+    def report(self, mode, report):
+        domains = report['domains']
+        latencies = [latency * 1000 for latency in report['latencies']]
+        # ru_maxrss is KB on Linux. It's the high-water mark of the process, not of this mode
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        mutations = ' '.join(f'{k} {v}' for k, v in report['mutations'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{mode}: {domains} domains in {report['elapsed']:.1f}s = {domains / report['elapsed']:.1f} domains/s, "
+            f"{report['queries'] / domains:.1f} queries/domain, errors {report['errors']}\n"
+            f"  latency per call ({len(latencies)} calls) p50 {percentile(latencies, 50):.1f}ms "
+            f"p99 {percentile(latencies, 99):.1f}ms. Process peak RSS (this and previous modes) {peak_rss:.0f}MB\n"
+            f"  mutations: {mutations}"
+        ))
+
+    def cleanup(self, zone):
+        """ Remove the benchmark data of a zone """
+        zona = Zona.objects.filter(nombre=zone).first()
+        if zona is None:
+            return
+        dominios = Dominio.objects.filter(zona=zona)
+        dominio_ids = list(dominios.values_list('id', flat=True))
+        registrante_ids = list(
+            Registrante.objects.filter(legal_uid__startswith=registrant_prefix(zone)).values_list('id', flat=True)
+        )
+        Event.objects.filter(
+            content_type=ContentType.objects.get_for_model(Dominio), object_id__in=dominio_ids
+        ).delete()
+        Event.objects.filter(
+            content_type=ContentType.objects.get_for_model(Registrante), object_id__in=registrante_ids
+        ).delete()
+        WhoareInbox.objects.filter(domain__endswith=f'.{zone}').delete()
+        DNSDominio.objects.filter(dominio_id__in=dominio_ids).delete()
+        # nameservers created by the benchmark and not used by real domains
+        last_dns_id = getattr(self, 'last_dns_id', None)
+        if last_dns_id is not None:
+            DNS.objects.filter(id__gt=last_dns_id, dominios__isnull=True).delete()
+        dominios.delete()
+        Registrante.objects.filter(id__in=registrante_ids).delete()
+        zona.delete()
@@ -0,0 +1,71 @@
+import logging
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from dominios.ingest import drain_whoare_inbox, INBOX_MAX_ATTEMPTS
+from dominios.models import WhoareInbox
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Ingest the whoare results queued by the API (async mode)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', nargs='?', type=int, default=100, help='Items ingested in each transaction')
+        parser.add_argument('--max-batches', nargs='?', type=int, default=0, help='Stop after N batches (0 = until empty)')
+        # --loop to keep waiting for new items
+        parser.add_argument('--loop', action='store_true', help='Wait for new items when the inbox is empty')
+        parser.add_argument('--sleep-time', nargs='?', type=float, default=2.0, help='Seconds to wait for new items (--loop)')
+        parser.add_argument('--max-sleep-time', nargs='?', type=float, default=120.0, help='Max seconds to wait after failed batches (--loop)')
+        parser.add_argument('--requeue-after', nargs='?', type=int, default=600, help='Retry items claimed N seconds ago and not finished')
+        parser.add_argument('--purge-days', nargs='?', type=int, default=7, help='Delete done items older than N days (0 = never)')
+
+    def handle(self, *args, **options):
+        requeued, failed = WhoareInbox.requeue_stale(options['requeue_after'], INBOX_MAX_ATTEMPTS)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'{requeued} stale items queued again'))
+        if failed:
+            self.stdout.write(self.style.ERROR(f'{failed} stale items failed (max attempts)'))
+
+        started = time.monotonic()
+        batches = processed = errors = 0
+        failures = 0  # whole batches failed in a row
+        while True:
+            items, batch_errors = drain_whoare_inbox(batch_size=options['batch_size'])
+            if items == 0 and batch_errors == 0:
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep_time'])
+                continue
+
+            batches += 1
+            processed += items
+            errors += batch_errors
+            if items == 0:
+                # the whole batch failed (e.g. database down)
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'Batch {batches} failed: {batch_errors} items'))
+            else:
+                failures = 0
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'Batch {batches}: {items} items, {batch_errors} errors. {processed / elapsed:.1f} items/s')
+            if options['max_batches'] and batches >= options['max_batches']:
+                break
+
+            if failures:
+                # retrying right away would use all the item attempts in seconds
+                if not options['loop']:
+                    break
+                time.sleep(min(options['sleep_time'] * 2 ** (failures - 1), options['max_sleep_time']))
+
+        if options['purge_days']:
+            limit = timezone.now() - timedelta(days=options['purge_days'])
+            deleted, _ = WhoareInbox.objects.filter(status=WhoareInbox.STATUS_DONE, processed__lt=limit).delete()
+            if deleted:
+                self.stdout.write(f'{deleted} old items deleted')
+
+        pending = WhoareInbox.objects.filter(status=WhoareInbox.STATUS_PENDING).count()
+        self.stdout.write(self.style.SUCCESS(f'{processed} processed, {errors} errors, {pending} pending'))
@@ -0,0 +1,146 @@
+from collections import Counter
+from datetime import datetime
+import logging
+import multiprocessing
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from dominios.archive import KIND_WHOARE
+from dominios.models import Dominio, WhoisArchive, whoare_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+def reparse_archives(archive_ids, dry_run=False):
+    """ Parse the archived whois data again and update the domains if the
+        result is different. No network access.
+        The events are saved as processed: nobody is notified for old data.
+        Runs at the worker processes, returns a Counter """
+    stats = Counter()
+    archives = WhoisArchive.objects.filter(id__in=archive_ids).select_related('dominio__zona', 'dominio__registrante')
+    for archive in archives:
+        dominio = archive.dominio
+        stats['processed'] += 1
+        if archive.fingerprint != dominio.whois_fingerprint:
+            # the domain was updated later without archiving this data
+            stats['outdated'] += 1
+            continue
+        if archive.kind == KIND_WHOARE:
+            # already parsed data (e.g. pushed to the API without raw_data), nothing to parse again
+            stats['not_raw'] += 1
+            continue
+
+        try:
+            wa = archive.get_whoare()
+        except Exception as e:
+            logger.error(f'Error parsing the archive {archive.id} {dominio}: {e}')
+            stats['errors'] += 1
+            continue
+
+        fingerprint = whoare_fingerprint(wa)
+        if fingerprint == archive.fingerprint:
+            stats['sin_cambios'] += 1
+            continue
+
+        stats['changed'] += 1
+        if dry_run:
+            continue
+        try:
+            with transaction.atomic():
+                # don't archive the same data again
+                cambios = dominio.update_from_wa_object(wa, just_created=False, archive=False, notify=False)
+                archive.fingerprint = fingerprint
+                archive.save(update_fields=['fingerprint'])
+        except Exception:
+            logger.exception(f'Error updating {dominio} from the archive {archive.id}')
+            stats['errors'] += 1
+            continue
+        stats['cambios'] += len(cambios)
+
+    return stats
+
+
+def _reparse_chunk(args):
+    return reparse_archives(*args)
+
+
+def _close_connections():
+    # each process needs its own database connection
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Parse the archived whois data again (e.g. after a whoare fix) without querying whois. '
+        'Just raw whois responses can be parsed again, whoare dicts (pushed without raw_data) are counted as not_raw. '
+        'The changes do not notify subscribers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domain', nargs='*', type=str, default=None, help='Just these full domains')
+        parser.add_argument('--zone', nargs='?', type=str, default=None, help='Just domains in this zone')
+        parser.add_argument('--since', nargs='?', type=str, default=None, help='Just archives since YYYY-MM-DD')
+        parser.add_argument('--kind', nargs='?', type=str, default=None, choices=['raw', 'whoare'], help='Just this archive kind')
+        parser.add_argument('--limit', nargs='?', type=int, default=0, help='Max domains (0 = all)')
+        parser.add_argument('--chunk-size', nargs='?', type=int, default=200, help='Archives processed by a worker at once')
+        parser.add_argument('--workers', nargs='?', type=int, default=4, help='Worker processes (0 = this process)')
+        parser.add_argument('--dry-run', action='store_true', help='Count the changes without saving them')
+
+    def get_archive_ids(self, options):
+        """ The last archive of each selected domain """
+        archives = WhoisArchive.objects.filter(dominio=OuterRef('pk'))
+        if options['since']:
+            since = timezone.make_aware(datetime.strptime(options['since'], '%Y-%m-%d'))
+            archives = archives.filter(momento__gte=since)
+        if options['kind']:
+            archives = archives.filter(kind=options['kind'])
+        last = archives.order_by('-momento', '-id').values('id')[:1]
+
+        dominios = Dominio.objects.all()
+        if options['zone']:
+            dominios = dominios.filter(zona__nombre=options['zone'])
+        if options['domain']:
+            dominios = [Dominio.get_from_full_domain(domain) for domain in options['domain']]
+            dominios = Dominio.objects.filter(id__in=[dominio.id for dominio in dominios if dominio is not None])
+
+        ids = dominios.annotate(archive_id=Subquery(last)).filter(archive_id__isnull=False)
+        ids = ids.order_by('id').values_list('archive_id', flat=True)
+        if options['limit']:
+            ids = ids[:options['limit']]
+        return list(ids)
+
+    def handle(self, *args, **options):
+        archive_ids = self.get_archive_ids(options)
+        chunk_size = options['chunk_size']
+        chunks = [
+            (archive_ids[n:n + chunk_size], options['dry_run'])
+            for n in range(0, len(archive_ids), chunk_size)
+        ]
+        self.stdout.write(f'{len(archive_ids)} archives in {len(chunks)} chunks')
+
+        started = time.monotonic()
+        stats = Counter()
+        if options['workers'] == 0:
+            results = map(_reparse_chunk, chunks)
+            self.report(results, stats, started)
+        else:
+            # don't share the connection with the child processes
+            connections.close_all()
+            with multiprocessing.Pool(options['workers'], initializer=_close_connections) as pool:
+                self.report(pool.imap_unordered(_reparse_chunk, chunks), stats, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['processed']} processed. changed {stats['changed']} cambios {stats['cambios']} "
+            f"sin_cambios {stats['sin_cambios']} outdated {stats['outdated']} not_raw {stats['not_raw']} "
+            f"errors {stats['errors']}"
+            f"{' (dry run)' if options['dry_run'] else ''}"
+        ))
+
+    def report(self, results, stats, started):
+        for result in results:
+            stats.update(result)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{stats['processed']} processed ({stats['processed'] / elapsed:.1f} domains/s)")
@@ -0,0 +1,94 @@
+from datetime import datetime
+import logging
+import multiprocessing
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from dominios.models import ReplayCheckpoint, WhoisArchive
+from dominios.replay import close_connections, replay_chunk
+
+
+logger = logging.getLogger(__name__)
+
+
+def _replay_chunk(args):
+    return replay_chunk(*args)
+
+
+def parse_date(value):
+    return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the change history of a period from the archived whois reads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=str, required=True, help='YYYY-MM-DD')
+        parser.add_argument('--until', nargs='?', type=str, default=None, help='YYYY-MM-DD (default now)')
+        parser.add_argument('--name', nargs='?', type=str, default=None, help='Checkpoint name, to resume a previous run')
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved progress for this name')
+        parser.add_argument('--zone', nargs='?', type=str, default=None, help='Just domains in this zone')
+        parser.add_argument('--chunk-size', nargs='?', type=int, default=200, help='Domains processed by a worker at once')
+        parser.add_argument('--workers', nargs='?', type=int, default=4, help='Worker processes (0 = this process)')
+
+    def handle(self, *args, **options):
+        since = parse_date(options['since'])
+        until = timezone.now() if options['until'] is None else parse_date(options['until'])
+        name = options['name'] or f"replay-{options['since']}-{options['until'] or 'now'}"
+
+        checkpoint, created = ReplayCheckpoint.objects.get_or_create(name=name, defaults={'since': since, 'until': until})
+        if options['restart'] or checkpoint.finished is not None:
+            checkpoint.last_dominio_id = checkpoint.dominios = checkpoint.cambios = 0
+            checkpoint.started = timezone.now()
+            checkpoint.finished = None
+            checkpoint.since = since
+            checkpoint.until = until
+        elif not created:
+            # resume the same period
+            since, until = checkpoint.since, checkpoint.until
+            self.stdout.write(f'Resuming {name} after domain {checkpoint.last_dominio_id}')
+        checkpoint.save()
+
+        archives = WhoisArchive.objects.filter(momento__gte=since, momento__lt=until, dominio_id__gt=checkpoint.last_dominio_id)
+        if options['zone']:
+            archives = archives.filter(dominio__zona__nombre=options['zone'])
+        dominio_ids = list(archives.order_by('dominio_id').values_list('dominio_id', flat=True).distinct())
+
+        chunk_size = options['chunk_size']
+        chunks = [
+            (dominio_ids[n:n + chunk_size], since, until)
+            for n in range(0, len(dominio_ids), chunk_size)
+        ]
+        self.stdout.write(f'{len(dominio_ids)} domains in {len(chunks)} chunks from {since} to {until}')
+
+        started = time.monotonic()
+        if options['workers'] == 0:
+            self.save_progress(checkpoint, chunks, map(_replay_chunk, chunks), started)
+        else:
+            # don't share the connection with the child processes
+            connections.close_all()
+            with multiprocessing.Pool(options['workers'], initializer=close_connections) as pool:
+                # imap keeps the order, the checkpoint just moves forward
+                self.save_progress(checkpoint, chunks, pool.imap(_replay_chunk, chunks), started)
+
+        checkpoint.finished = timezone.now()
+        checkpoint.save()
+        self.stdout.write(self.style.SUCCESS(
+            f'{checkpoint.dominios} domains, {checkpoint.cambios} changes rebuilt ({name})'
+        ))
+
+    def save_progress(self, checkpoint, chunks, results, started):
+        processed = errors = 0
+        for (dominio_ids, _, _), (domains, cambios, chunk_errors) in zip(chunks, results):
+            processed += domains
+            errors += chunk_errors
+            checkpoint.last_dominio_id = dominio_ids[-1]
+            checkpoint.dominios += domains
+            checkpoint.cambios += cambios
+            checkpoint.save()
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{processed} domains ({processed / elapsed:.1f} domains/s) '
+                f'last id {checkpoint.last_dominio_id} errors {errors}'
+            )
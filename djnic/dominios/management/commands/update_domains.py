@@ -1,8 +1,8 @@
 import logging
 from time import sleep
 from django.core.management.base import BaseCommand
-from dominios.models import Dominio, STATUS_NO_DISPONIBLE, STATUS_DISPONIBLE
-from whoare.exceptions import TooManyQueriesError
+from dominios.crawler import WhoisCrawler, count_cambios
+from dominios.models import Dominio
 
 
 logger = logging.getLogger(__name__)
@@ -14,46 +14,68 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--limit', nargs='?', type=int, default=10000)
         parser.add_argument('--sleep', nargs='?', type=int, default=21)
+        # --workers N to use the concurrent crawler (0 = one by one)
+        parser.add_argument('--workers', nargs='?', type=int, default=0, help='Concurrent whois queries')
+        parser.add_argument('--rate', nargs='?', type=float, default=0.5, help='Max queries per second to each whois server')
+        parser.add_argument('--burst', nargs='?', type=int, default=1, help='Max queries at once to each whois server')
+        parser.add_argument('--backoff', nargs='?', type=float, default=15, help='First pause (seconds) when the server complains')
+        parser.add_argument('--max-retries', nargs='?', type=int, default=3, help='Retries for each domain after too many queries')
+        parser.add_argument('--mock-from-txt-file', nargs='?', type=str, default=None, help='Use this whois result for all domains')
 
     def handle(self, *args, **options):
         limit = options['limit']
-        dominios = Dominio.objects.all().order_by('-priority_to_update')[:limit]
-        print(dominios)
-        c = 0
-        errors = 0
+        dominios = Dominio.objects.select_related('zona').order_by('-priority_to_update')[:limit]
+
+        if options['workers']:
+            self.crawl(dominios, options)
+            return
 
-        sin_cambios = 0
-        caidos = 0
-        nuevos = 0
-        renovados = 0
+        c = 0
+        stats = {'errors': 0, 'sin_cambios': 0, 'caidos': 0, 'nuevos': 0, 'renovados': 0}
 
         for dominio in dominios:
             c += 1
-            log_cambios = f'sin_cambios {sin_cambios} caidos {caidos} nuevos {nuevos} renovados {renovados}'
+            log_cambios = ' '.join(f'{k} {v}' for k, v in stats.items() if k != 'errors')
             self.stdout.write(
-                self.style.SUCCESS(f"{c} {errors} {log_cambios} {dominio} expire:{dominio.expire} readed: {dominio.data_readed}")
+                self.style.SUCCESS(f"{c} {stats['errors']} {log_cambios} {dominio} expire:{dominio.expire} readed: {dominio.data_readed}")
+            )
+            res, error, cambios = Dominio.add_from_whois(
+                domain=dominio.full_domain(), mock_from_txt_file=options['mock_from_txt_file']
             )
-            try:
-                cambios = Dominio.add_from_whois(domain=dominio.full_domain())
-            except TooManyQueriesError:
+            if error == 'Too many queries':
                 self.stdout.write(self.style.SUCCESS("WHOIS TooManyQueriesError"))
-                errors += 1
+                stats['errors'] += 1
                 sleep(15)
-
-            if cambios == []:
-                sin_cambios += 1
-            elif 'estado' in [c['campo'] for c in cambios]:
-                for cambio in cambios:
-                    if cambio['campo'] == 'estado':
-                        if cambio['anterior'] == STATUS_DISPONIBLE:
-                            nuevos += 1
-                        elif cambio['anterior'] == STATUS_NO_DISPONIBLE:
-                            caidos += 1
-            elif 'dominio_expire' in [c['campo'] for c in cambios]:
-                renovados += 1
+            elif not res:
+                self.stdout.write(self.style.ERROR(f" - Error {error}"))
+                stats['errors'] += 1
+            else:
+                count_cambios(stats, cambios)
 
             sleep(options['sleep'])
 
             self.stdout.write(self.style.SUCCESS(f" - {dominio.priority_to_update} {dominio.next_update_priority}"))
 
         self.stdout.write(self.style.SUCCESS(f"{c} processed"))
+
+    def crawl(self, dominios, options):
+        crawler = WhoisCrawler(
+            workers=options['workers'],
+            rate=options['rate'],
+            burst=options['burst'],
+            backoff=options['backoff'],
+            max_retries=options['max_retries'],
+            mock_from_txt_file=options['mock_from_txt_file'],
+        )
+
+        def on_result(dominio, cambios, error):
+            processed = crawler.stats['processed']
+            if error is None:
+                self.stdout.write(self.style.SUCCESS(f"{processed} {dominio} {len(cambios)} cambios"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{processed} {dominio} Error {error}"))
+            if processed % 100 == 0:
+                self.stdout.write(crawler.summary())
+
+        crawler.run(dominios, on_result=on_result)
+        self.stdout.write(self.style.SUCCESS(crawler.summary()))
@@ -1,8 +1,12 @@
 import logging
 import time
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Q
 from django.utils import timezone
 from dominios.models import Dominio
+from dominios.priority import registry
+from dominios.priority.bulk import recalculate_priorities
+from dominios.priority.sql import update_priorities_sql
 from core.models import News
 from dominios.models import STATUS_NO_DISPONIBLE
 
@@ -10,6 +14,30 @@ from dominios.models import STATUS_NO_DISPONIBLE
 logger = logging.getLogger(__name__)
 
 
+TRANSITIONS = ['from_0_to_any', '0->5', '0->7', '0->10', '5->7', '5->10', '7->10']
+
+
+def count_transition(stats, old_ptu, new_ptu):
+    """ Count domains moving to a higher priority level """
+    if old_ptu == 0 and new_ptu > 0:
+        stats['from_0_to_any'] += 1
+    if old_ptu < 5_000_000:
+        if new_ptu >= 10_000_000:
+            stats['0->10'] += 1
+        elif new_ptu >= 7_000_000:
+            stats['0->7'] += 1
+        elif new_ptu >= 5_000_000:
+            stats['0->5'] += 1
+    elif old_ptu < 7_000_000:
+        if new_ptu >= 10_000_000:
+            stats['5->10'] += 1
+        elif new_ptu >= 7_000_000:
+            stats['5->7'] += 1
+    elif old_ptu < 10_000_000:
+        if new_ptu >= 10_000_000:
+            stats['7->10'] += 1
+
+
 class Command(BaseCommand):
     help = 'Actualizar prioridad en los dominios'
 
@@ -17,6 +45,11 @@ class Command(BaseCommand):
         parser.add_argument('--limit', nargs='?', type=int, default=25000)
         # --all to review ALL domains
         parser.add_argument('--all', action='store_true', help='Review ALL domains')
+        # --transitions to review just the domains crossing a priority rule edge
+        parser.add_argument(
+            '--transitions', action='store_true',
+            help='Review domains with a passed priority transition'
+        )
         parser.add_argument('--chunk-size', nargs='?', type=int, default=500, help='Chunk size for pagination')
         parser.add_argument('--sleep-interval', nargs='?', type=int, default=2300, help='Sleep every N records')
         parser.add_argument('--sleep-time', nargs='?', type=float, default=4.0, help='Sleep duration in seconds')
@@ -24,6 +57,12 @@ class Command(BaseCommand):
         parser.add_argument('--order-by', nargs='?', type=str, default='next_update_priority', help='Field to order by')
         # only non available flag
         parser.add_argument('--non-available', action='store_true', help='Only process non-available domains')
+        # columnar reads just the needed columns and writes one UPDATE per chunk
+        # sql calculates everything inside the database with a single UPDATE
+        parser.add_argument(
+            '--engine', type=str, default='python', choices=['python', 'columnar', 'sql'],
+            help='Calculation engine'
+        )
 
     def handle(self, *args, **options):
 
@@ -32,11 +71,20 @@ class Command(BaseCommand):
         sleep_interval = options['sleep_interval']
         sleep_time = options['sleep_time']
         bulk_size = options['bulk_size']
-        order_by = options['order_by']  
+        order_by = options['order_by']
         non_available = options['non_available']
 
+        if options['transitions'] and options['engine'] == 'sql':
+            # the SQL engine doesn't calculate the transitions, they would be picked again and again
+            raise CommandError('--transitions is not supported by the sql engine')
+
         if all:
             dominios = Dominio.objects.all()
+        elif options['transitions']:
+            # domains without a transition are not calculated yet (TRANSITION_NEVER if there is no next one)
+            dominios = Dominio.objects.filter(
+                Q(priority_transition_at__lte=timezone.now()) | Q(priority_transition_at__isnull=True)
+            )
         else:
             dominios = Dominio.objects.filter(next_update_priority__lt=timezone.now())
 
@@ -48,17 +96,40 @@ class Command(BaseCommand):
         if limit:
             dominios = dominios[:limit]
 
-        c = 0
-        from_0_to_any = 0
-        from_low_to_5M = 0
-        from_low_to_7M = 0
-        from_low_to_10M = 0
-        from_5_to_7M = 0
-        from_7_to_10M = 0
-        from_5_to_10M = 0
+        if options['engine'] == 'sql':
+            self.run_sql(dominios)
+            return
 
+        if options['engine'] == 'columnar':
+            c, stats, old_nup = self.run_columnar(dominios, chunk_size, sleep_interval, sleep_time)
+        else:
+            c, stats, old_nup = self.run_python(dominios, chunk_size, sleep_interval, sleep_time, bulk_size)
+
+        # move old_nup tofull datetime to YYY-MM-DD HH:MM:SS
+        if old_nup:
+            old_nup = old_nup.strftime('%Y-%m-%d %H:%M:%S')
+
+        report = (
+            f"{c} processed, "
+            f"{stats['from_0_to_any']} from 0 to any. Latest NPU: {old_nup}\n"
+            f"0->5:{stats['0->5']} "
+            f"0->7:{stats['0->7']} "
+            f"0->10:{stats['0->10']} "
+            f"5->7:{stats['5->7']} "
+            f"5->10:{stats['5->10']} "
+            f"7->10:{stats['7->10']}"
+        )
+        self.stdout.write(self.style.SUCCESS(report))
+        News.objects.create(title='Update priority', description=report)
+
+    def run_python(self, dominios, chunk_size, sleep_interval, sleep_time, bulk_size):
+        """ Calculate one Dominio object at a time """
+        c = 0
+        stats = dict.fromkeys(TRANSITIONS, 0)
         old_nup = None
         bulk_updates = []
+        # resolve the rules for each zone just once
+        zona_rules = registry.by_zona_id()
 
         # Use iterator with chunking to avoid loading all records into memory
         for dominio in dominios.iterator(chunk_size=chunk_size):
@@ -67,7 +138,8 @@ class Command(BaseCommand):
             old_ptu = dominio.priority_to_update
 
             # Calculate priority without saving
-            dominio.calculate_priority(save=False)
+            rules = zona_rules.get(dominio.zona_id) or registry.for_zona(dominio.zona)
+            dominio.calculate_priority(save=False, rules=rules)
 
             # Add to bulk update list
             bulk_updates.append(dominio)
@@ -80,29 +152,13 @@ class Command(BaseCommand):
                     f"{old_ptu} => {dominio.priority_to_update}"
                 )
             )
-            if old_ptu == 0 and dominio.priority_to_update > 0:
-                from_0_to_any += 1
-            if old_ptu < 5_000_000:
-                if dominio.priority_to_update >= 10_000_000:
-                    from_low_to_10M += 1
-                elif dominio.priority_to_update >= 7_000_000:
-                    from_low_to_7M += 1
-                elif dominio.priority_to_update >= 5_000_000:
-                    from_low_to_5M += 1
-            elif old_ptu < 7_000_000:
-                if dominio.priority_to_update >= 10_000_000:
-                    from_5_to_10M += 1
-                elif dominio.priority_to_update >= 7_000_000:
-                    from_5_to_7M += 1
-            elif old_ptu < 10_000_000:
-                if dominio.priority_to_update >= 10_000_000:
-                    from_7_to_10M += 1
+            count_transition(stats, old_ptu, dominio.priority_to_update)
 
             # Bulk update when we reach bulk_size
             if len(bulk_updates) >= bulk_size:
                 Dominio.objects.bulk_update(
                     bulk_updates,
-                    ['priority_to_update', 'next_update_priority', 'extras']
+                    ['priority_to_update', 'next_update_priority', 'priority_transition_at']
                 )
                 self.stdout.write(f"Bulk updated {len(bulk_updates)} records")
                 bulk_updates = []
@@ -117,23 +173,47 @@ class Command(BaseCommand):
         if bulk_updates:
             Dominio.objects.bulk_update(
                 bulk_updates,
-                ['priority_to_update', 'next_update_priority', 'extras']
+                ['priority_to_update', 'next_update_priority', 'priority_transition_at']
             )
             self.stdout.write(f"Final bulk updated {len(bulk_updates)} records")
 
-        # move old_nup tofull datetime to YYY-MM-DD HH:MM:SS
-        if old_nup:
-            old_nup = old_nup.strftime('%Y-%m-%d %H:%M:%S')
+        return c, stats, old_nup
 
-        report = (
-            f"{c} processed, "
-            f"{from_0_to_any} from 0 to any. Latest NPU: {old_nup}\n"
-            f"0->5:{from_low_to_5M} "
-            f"0->7:{from_low_to_7M} "
-            f"0->10:{from_low_to_10M} "
-            f"5->7:{from_5_to_7M} "
-            f"5->10:{from_5_to_10M} "
-            f"7->10:{from_7_to_10M}"
-        )
+    def run_columnar(self, dominios, chunk_size, sleep_interval, sleep_time):
+        """ Calculate by chunks of plain columns, one UPDATE per chunk """
+        c = 0
+        stats = dict.fromkeys(TRANSITIONS, 0)
+        old_nup = None
+        zona_rules = registry.by_zona_id()
+        # fix the list of domains before we start to change the order field
+        ids = list(dominios.values_list('id', flat=True))
+        if ids:
+            old_nup = Dominio.objects.filter(id=ids[-1]).values_list('next_update_priority', flat=True).first()
+
+        for start in range(0, len(ids), chunk_size):
+            now = timezone.now()
+            results = recalculate_priorities(ids[start:start + chunk_size], zona_rules, now=now)
+            for dominio_id, old_ptu, new_ptu, new_nup in results:
+                count_transition(stats, old_ptu, new_ptu)
+            c += len(results)
+            self.stdout.write(f"Bulk updated {len(results)} records ({c}/{len(ids)})")
+
+            # sleep_interval is in records, chunks are the unit here
+            if sleep_interval and (c // sleep_interval) > ((c - len(results)) // sleep_interval):
+                time.sleep(sleep_time)
+                self.stdout.write(f"Processed {c} records, sleeping {sleep_time}s...")
+
+        return c, stats, old_nup
+
+    def run_sql(self, dominios):
+        """ One UPDATE for all the domains, no transition stats """
+        latest_nup = Dominio.objects.filter(id__in=dominios.values('id')).aggregate(
+            latest=Max('next_update_priority')
+        )['latest']
+        c = update_priorities_sql(dominios)
+        if latest_nup:
+            latest_nup = latest_nup.strftime('%Y-%m-%d %H:%M:%S')
+
+        report = f"{c} processed in SQL. Latest NPU: {latest_nup}"
         self.stdout.write(self.style.SUCCESS(report))
         News.objects.create(title='Update priority', description=report)
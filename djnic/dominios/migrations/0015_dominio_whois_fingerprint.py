@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0014_uids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dominio',
+            name='whois_fingerprint',
+            field=models.CharField(blank=True, help_text='Hash of the last whoare data applied to this domain', max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.26 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0015_dominio_whois_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dominio',
+            name='lease_token',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dominio',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, help_text='Handed out to a whoare node for update until this moment', null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0016_dominio_lease'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dominio',
+            index=models.Index(fields=['-priority_to_update'], name='dominio_priority_desc_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0017_dominio_priority_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dominio',
+            name='priority_transition_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Next time the priority rules change for this domain', null=True),
+        ),
+    ]
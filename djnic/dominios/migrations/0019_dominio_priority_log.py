@@ -0,0 +1,32 @@
+# Generated by Django 4.2.26 on 2026-10-18 19:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0018_dominio_priority_transition_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DominioPriorityLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('calc', 'Priority calculated'), ('picked', 'Picked for update'), ('whoare', 'Updated from whoare')], max_length=10)),
+                ('momento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('priority', models.IntegerField(blank=True, null=True)),
+                ('next_update_priority', models.DateTimeField(blank=True, null=True)),
+                ('expired_since', models.IntegerField(blank=True, null=True)),
+                ('readed_since', models.IntegerField(blank=True, null=True)),
+                ('updated_since', models.IntegerField(blank=True, null=True)),
+                ('dominio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='priority_logs', to='dominios.dominio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dominio', '-momento'], name='priority_log_dominio_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-18 20:01
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0019_dominio_priority_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhoareInbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(help_text='Full domain name, just for humans', max_length=240)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('error', 'Error')], default='pending', max_length=12)),
+                ('received', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed', models.DateTimeField(blank=True, null=True)),
+                ('claim_token', models.UUIDField(blank=True, null=True)),
+                ('processed', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='whoare_inbox_status_idx')],
+            },
+        ),
+    ]
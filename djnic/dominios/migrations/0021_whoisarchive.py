@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 20:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0020_whoareinbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhoisArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('momento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('kind', models.CharField(choices=[('raw', 'Raw whois response'), ('whoare', 'WhoAre dict')], max_length=10)),
+                ('fingerprint', models.CharField(help_text='whoare_fingerprint of the parsed data', max_length=40)),
+                ('data', models.BinaryField(help_text='zlib compressed')),
+                ('dominio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='whois_archive', to='dominios.dominio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dominio', '-momento'], name='whois_archive_dominio_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 20:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dominios', '0021_whoisarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplayCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('since', models.DateTimeField()),
+                ('until', models.DateTimeField()),
+                ('last_dominio_id', models.IntegerField(default=0, help_text='All the domains up to this id are done')),
+                ('dominios', models.IntegerField(default=0, help_text='Domains processed')),
+                ('cambios', models.IntegerField(default=0, help_text='CambiosDominio rebuilt')),
+                ('started', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -1,17 +1,25 @@
 from datetime import timedelta
+import hashlib
+import json
 import logging
-import pytz
+import random
 import uuid
-from django.db import models
+from django.conf import settings
+from django.db import connection, models, transaction
 from django.urls import reverse
 from django.utils import timezone
 from whoare.whoare import WhoAre
 from whoare.exceptions import TooManyQueriesError
 from cambios.models import CambiosDominio, CampoCambio
-from zonas.models import Zona
-from registrantes.models import Registrante
+from core.tz import get_tz
+from dominios.archive import KIND_RAW, KIND_WHOARE, compress, decompress, whoare_from_payload, whoare_payload
+from zonas.models import Zona  # noqa: F401
+from zonas.registry import split_domain, zones
+from registrantes.models import Registrante  # noqa: F401
+from registrantes.resolver import resolver as registrantes_resolver
 from dnss.models import DNS
 from subscriptions.events import register_events
+from subscriptions.models import Event
 
 
 STATUS_DISPONIBLE = 'disponible'
@@ -19,6 +27,35 @@ STATUS_NO_DISPONIBLE = 'no disponible'
 logger = logging.getLogger(__name__)
 
 
+def whoare_fingerprint(wa):
+    """ Hash of the normalized data of a WhoAre object.
+        Two reads with the same fingerprint will produce no changes """
+
+    def _date(value):
+        return '' if value is None else value.isoformat()
+
+    registrant = None
+    if wa.registrant is not None:
+        registrant = [
+            wa.registrant.name,
+            wa.registrant.legal_uid,
+            _date(wa.registrant.created),
+            _date(wa.registrant.changed),
+        ]
+
+    data = [
+        wa.domain.base_name,
+        wa.domain.zone,
+        wa.domain.is_free,
+        _date(wa.domain.registered),
+        _date(wa.domain.changed),
+        _date(wa.domain.expire),
+        registrant,
+        [ns.name for ns in wa.dnss],
+    ]
+    return hashlib.sha1(json.dumps(data).encode('utf-8')).hexdigest()
+
+
 class Dominio(models.Model):
     nombre = models.CharField(max_length=240, db_index=True, help_text='Nombre solo sin la zona')
     zona = models.ForeignKey(
@@ -39,7 +76,18 @@ class Dominio(models.Model):
 
     priority_to_update = models.IntegerField(default=0, help_text='How mamy important is to update this domain')
     next_update_priority = models.DateTimeField(default=timezone.now, help_text='Next time I need to update the "priority"')
+    priority_transition_at = models.DateTimeField(
+        null=True, blank=True, db_index=True,
+        help_text='Next time the priority rules change for this domain'
+    )
     extras = models.JSONField(null=True, blank=True)
+    leased_until = models.DateTimeField(
+        null=True, blank=True, help_text='Handed out to a whoare node for update until this moment'
+    )
+    lease_token = models.UUIDField(null=True, blank=True, editable=False)
+    whois_fingerprint = models.CharField(
+        max_length=40, null=True, blank=True, help_text='Hash of the last whoare data applied to this domain'
+    )
 
     # fields to be deleted
     uid_anterior = models.IntegerField(default=0, db_index=True, help_text="to be deleted after migration")
@@ -48,6 +96,10 @@ class Dominio(models.Model):
 
     class Meta:
         unique_together = (('nombre', 'zona'), )
+        indexes = [
+            # the queue of domains to update: top N by priority without sorting the table
+            models.Index(fields=['-priority_to_update'], name='dominio_priority_desc_idx'),
+        ]
 
     def update_extras(self, new_data, save=False):
         if self.extras is None:
@@ -71,8 +123,7 @@ class Dominio(models.Model):
         else:
             raise Exception('Bad field date')
 
-        logger.info(f'Transforming date {timefield} {self.zona.tz}')
-        return timezone.localtime(timefield, pytz.timezone(self.zona.tz))
+        return timezone.localtime(timefield, get_tz(self.zona.tz))
 
     def full_domain(self):
         nombre = self.nombre if self.nombre is not None else ''
@@ -81,14 +132,39 @@ class Dominio(models.Model):
 
     @classmethod
     def get_from_full_domain(cls, full_domain):
-        wa = WhoAre()
-        domain_name, zone = wa.detect_zone(full_domain)
-        zona, _ = Zona.objects.get_or_create(nombre=zone)
+        domain_name, zone = split_domain(full_domain)
+        zona = zones.get_or_create(zone)
         dominios = Dominio.objects.filter(nombre=domain_name, zona=zona)
         if dominios.count() > 0:
             return dominios[0]
         return None
 
+    @classmethod
+    def lease_for_update(cls, limit, lease_seconds):
+        """ Claim the next <limit> domains to update (by priority) for <lease_seconds>.
+            Leased domains are not handed out again until the lease expires
+            or the result arrives (update_from_wa_object releases it).
+            Uses SELECT ... FOR UPDATE SKIP LOCKED if the database supports it
+            and a compare-and-set UPDATE with a lease token for all of them """
+
+        now = timezone.now()
+        token = uuid.uuid4()
+        available = models.Q(leased_until__isnull=True) | models.Q(leased_until__lt=now)
+
+        with transaction.atomic():
+            candidates = cls.objects.filter(available).order_by('-priority_to_update')
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates.values_list('id', flat=True)[:limit])
+
+            cls.objects.filter(available, id__in=ids).update(
+                leased_until=now + timedelta(seconds=lease_seconds),
+                lease_token=token
+            )
+
+        leased = cls.objects.filter(id__in=ids, lease_token=token)
+        return leased.select_related('zona').order_by('-priority_to_update')
+
     def ultimo_cambio(self):
         return self.cambios.order_by('-momento').first()
 
@@ -103,8 +179,8 @@ class Dominio(models.Model):
 
         logger.info(f'Adding from WhoIs {domain}')
         wa = WhoAre()
-        domain_name, zone = wa.detect_zone(domain)
-        zona, _ = Zona.objects.get_or_create(nombre=zone)
+        domain_name, zone = split_domain(domain)
+        zona = zones.get_or_create(zone)
 
         if just_new:
             dominio = cls.get_from_full_domain(domain)
@@ -130,19 +206,37 @@ class Dominio(models.Model):
         # return the changes list
         return True, None, dominio.update_from_wa_object(wa, just_created=dominio_created)
 
-    def update_from_wa_object(self, wa, just_created):
+    def update_from_wa_object(self, wa, just_created, archive=True, notify=True):
         """ Update a domain from a WhoAre object
-            To use from external users and from local generation """
+            To use from external users and from local generation
+            archive=False to skip the WhoisArchive (e.g. replaying archived data)
+            notify=False to save the events as already processed (no notifications) """
 
+        self._dnss_rows = None  # read the stored DNSs just once
         self.data_readed = timezone.now()
+        # we got the result, release the lease (if any)
+        self.leased_until = None
+        self.lease_token = None
+
+        fingerprint = whoare_fingerprint(wa)
+        if not just_created and fingerprint == self.whois_fingerprint:
+            # Same data we already have: just register the read
+            return self.update_unchanged_read()
+
+        self.whois_fingerprint = fingerprint
         self.priority_to_update = 0  # will be recalculated later
         self.next_update_priority = timezone.now() + timedelta(days=15)
 
         cambios = []
+        # all the change records are saved together at the end
+        writes = ReadChanges()
+        if archive and settings.WHOIS_ARCHIVE_ENABLED:
+            # just the reads with new data (same fingerprint = same data)
+            writes.archive = WhoisArchive.from_whoare(self, wa, fingerprint)
+        old_registrante = self.registrante
         # if already exist analyze and register changes
         if not just_created:
-            cambios = self.apply_new_version(whoare_object=wa)
-            register_events(dominio=self, cambios=cambios)
+            cambios = self.apply_new_version(whoare_object=wa, writes=writes, momento=self.data_readed)
         else:
             self.data_updated = timezone.now()
             # El dominio esta pelado, solo nombre y zona
@@ -151,12 +245,13 @@ class Dominio(models.Model):
         self.estado = STATUS_DISPONIBLE if wa.domain.is_free else STATUS_NO_DISPONIBLE
 
         if wa.registrant is not None:
-            registrante, created = Registrante.objects.get_or_create(legal_uid=wa.registrant.legal_uid)
-            registrante.name = wa.registrant.name
-            registrante.legal_uid = wa.registrant.legal_uid
-            registrante.created = wa.registrant.created
-            registrante.changed = wa.registrant.changed
-            registrante.save()
+            # just write the registrant if something changed
+            registrante, created = registrantes_resolver.resolve(
+                legal_uid=wa.registrant.legal_uid,
+                name=wa.registrant.name,
+                created=wa.registrant.created,
+                changed=wa.registrant.changed,
+            )
             logger.info(f' - Registrante {registrante} Created: {created}')
 
             self.registrante = registrante
@@ -169,7 +264,16 @@ class Dominio(models.Model):
 
         self.save()
 
-        if just_created:
+        if not just_created:
+            # reuse the registrants we already have (old and new)
+            registrantes = (None, None)
+            if 'registrant_legal_uid' in [cambio['campo'] for cambio in cambios]:
+                registrantes = (old_registrante, self.registrante)
+            writes.events = register_events(
+                dominio=self, cambios=cambios, registrantes=registrantes,
+                current_registrante=old_registrante, save=False
+            )
+        else:
             # Ahora si podemos registrar el evento de nuevo dominio (nuevo para nuestra base)
             new_legal_uid = '' if wa.registrant is None else wa.registrant.legal_uid
             new_reg_name = '' if wa.registrant is None else wa.registrant.name
@@ -178,40 +282,82 @@ class Dominio(models.Model):
                 {"campo": "registrant_legal_uid", "anterior": "", "nuevo": new_legal_uid},
                 {"campo": "registrant_name", "anterior": "", "nuevo": new_reg_name},
             ]
-            register_events(dominio=self, cambios=cambios_tmp)
-
-        orden = 1
-        for ns in wa.dnss:
-            new_dns, dns_created = DNS.objects.get_or_create(dominio=ns.name)
+            writes.events = register_events(
+                dominio=self, cambios=cambios_tmp, registrantes=(None, self.registrante), save=False
+            )
 
-            # get previous DNS in this order
-            previous = DNSDominio.objects.filter(dominio=self, orden=orden)
-            if previous.count() > 0:
-
-                dns_found = False
-                for prev in previous:
-                    if prev.dns != new_dns:
-                        # delete
-                        prev.delete()
-                    else:
-                        dns_found = True
-                if not dns_found:
-                    DNSDominio.objects.create(dominio=self, dns=new_dns, orden=orden)
-
-            elif previous.count() == 0:
-                DNSDominio.objects.create(dominio=self, dns=new_dns, orden=orden)
-
-            orden += 1
-
-        # delete exceding DNSs from previous version
-        DNSDominio.objects.filter(dominio=self, orden__gt=len(wa.dnss)).delete()
+        if not notify:
+            for event in writes.events:
+                event.processed = True
+        writes.flush()
+        self.update_dnss([ns.name for ns in wa.dnss], current=[] if just_created else None)
 
         # volver a calcular su prioridad
         self.calculate_priority()
         return cambios
 
-    def apply_new_version(self, whoare_object):
-        """ Get a new version of domain, check differences and register changes """
+    def update_unchanged_read(self):
+        """ The whois data is the same we applied the last time.
+            Register the read and update the priority with a narrow UPDATE """
+        logger.info(f' - SIN CAMBIOS (fingerprint) {self}')
+        CambiosDominio.objects.create(dominio=self, momento=self.data_readed, have_changes=False)
+        self.calculate_priority(save=False)
+        self.save(update_fields=[
+            'data_readed', 'priority_to_update', 'next_update_priority', 'priority_transition_at',
+            'leased_until', 'lease_token'
+        ])
+        return []
+
+    def get_dnss_rows(self):
+        """ Ordered DNSDominio rows of this domain.
+            Cached to be reused at the same read (diff and DNS update) """
+        if getattr(self, '_dnss_rows', None) is None:
+            self._dnss_rows = list(self.dnss.select_related('dns').order_by('orden'))
+        return self._dnss_rows
+
+    def update_dnss(self, names, current=None):
+        """ Sync the ordered DNSs of this domain with a new ordered list of names.
+            It's a diff between the stored list and the new one:
+            no queries at all if nothing changed.
+            current: the already loaded DNSDominio rows (None to read them) """
+
+        if current is None:
+            current = self.get_dnss_rows()
+
+        by_orden = {}
+        for row in current:
+            by_orden.setdefault(row.orden, []).append(row)
+
+        to_delete = []
+        to_create = []  # (orden, name)
+        for orden, name in enumerate(names, start=1):
+            rows = by_orden.pop(orden, [])
+            to_delete += [row for row in rows if row.dns.dominio != name]
+            if not any(row.dns.dominio == name for row in rows):
+                to_create.append((orden, name))
+
+        # exceding DNSs from previous version
+        for rows in by_orden.values():
+            to_delete += rows
+
+        if to_delete:
+            DNSDominio.objects.filter(id__in=[row.id for row in to_delete]).delete()
+
+        if to_create:
+            dnss = DNS.get_or_create_many([name for _, name in to_create])
+            DNSDominio.objects.bulk_create([
+                DNSDominio(dominio=self, dns=dnss[name], orden=orden)
+                for orden, name in to_create
+            ])
+
+        if to_delete or to_create:
+            # force a fresh read next time
+            self._dnss_rows = None
+
+    def apply_new_version(self, whoare_object, writes=None, momento=None):
+        """ Get a new version of domain, check differences and register changes
+            writes: ReadChanges to save the change records later (None to save them now)
+            momento: when we read it (None for now). Same as the WhoisArchive of the read """
         wa = whoare_object
         logger.info(f'Apply new version {self} {wa}')
 
@@ -219,79 +365,26 @@ class Dominio(models.Model):
         assert self.nombre == wa.domain.base_name
         assert self.zona.nombre == wa.domain.zone
 
-        cambios = []
-        if self.estado == STATUS_NO_DISPONIBLE and wa.domain.is_free:
-            cambios.append({"campo": "estado", "anterior": STATUS_NO_DISPONIBLE, "nuevo": STATUS_DISPONIBLE})
-        elif self.estado == STATUS_DISPONIBLE and not wa.domain.is_free:
-            cambios.append({"campo": "estado", "anterior": STATUS_DISPONIBLE, "nuevo": STATUS_NO_DISPONIBLE})
-
-        r_val = '' if self.registered is None else self.get_zoned_date('registered').strftime("%Y-%m-%d %H:%M:%S")
-        w_val = '' if wa.domain.registered is None else wa.domain.registered.strftime("%Y-%m-%d %H:%M:%S")
-        if r_val != w_val:
-            cambios.append({"campo": "dominio_registered", "anterior": r_val, "nuevo": w_val})
-
-        r_val = '' if self.changed is None else self.get_zoned_date('changed').strftime("%Y-%m-%d %H:%M:%S")
-        w_val = '' if wa.domain.changed is None else wa.domain.changed.strftime("%Y-%m-%d %H:%M:%S")
-        if r_val != w_val:
-            cambios.append({"campo": "dominio_changed", "anterior": r_val, "nuevo": w_val})
-
-        r_val = '' if self.expire is None else self.get_zoned_date('expire').strftime("%Y-%m-%d %H:%M:%S")
-        w_val = '' if wa.domain.expire is None else wa.domain.expire.strftime("%Y-%m-%d %H:%M:%S")
-        if r_val != w_val:
-            cambios.append({"campo": "dominio_expire", "anterior": r_val, "nuevo": w_val})
-
-        if self.registrante is not None:
-            r_name = self.registrante.name
-            r_legal_uid = self.registrante.legal_uid
-            r_created = self.registrante.get_zoned_date('created', self.zona.tz).strftime("%Y-%m-%d %H:%M:%S")
-            r_changed = self.registrante.get_zoned_date('changed', self.zona.tz).strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            r_name, r_legal_uid, r_created, r_changed = ('', '', '', '')
-
-        if wa.registrant is not None:
-            w_name = wa.registrant.name
-            w_legal_uid = wa.registrant.legal_uid
-            w_created = wa.registrant.created.strftime("%Y-%m-%d %H:%M:%S")
-            w_changed = wa.registrant.changed.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            w_name, w_legal_uid, w_created, w_changed = ('', '', '', '')
-
-        if r_name.lower() != w_name.lower():
-            cambios.append({"campo": "registrant_name", "anterior": r_name, "nuevo": w_name})
-
-        if r_legal_uid != w_legal_uid:
-            cambios.append({"campo": "registrant_legal_uid", "anterior": r_legal_uid, "nuevo": w_legal_uid})
-
-        if r_created != w_created:
-            cambios.append({"campo": "registrant_created", "anterior": r_created, "nuevo": w_created})
-
-        if r_changed != w_changed:
-            cambios.append({"campo": "registrant_changed", "anterior": r_changed, "nuevo": w_changed})
-
-        r_dnss = [d.dns.dominio for d in self.dnss.all().order_by('orden')]
-        w_dnss = [d.name for d in wa.dnss]
-
-        max_len = max(len(r_dnss), len(w_dnss))
-        for n in range(max_len):
-            r_val = '' if (n+1) > len(r_dnss) else r_dnss[n]
-            w_val = '' if (n+1) > len(w_dnss) else w_dnss[n]
+        from dominios.diff import diff_whoare
+        cambios = diff_whoare(self, wa)
 
-            if r_val != w_val:
-                cambios.append({"campo": f"DNS{n+1}", "anterior": r_val, "nuevo": w_val})
+        flush = writes is None
+        if flush:
+            writes = ReadChanges()
 
         have_changes = len(cambios) > 0
-        main_change = CambiosDominio.objects.create(dominio=self, momento=timezone.now(), have_changes=have_changes)
+        momento = timezone.now() if momento is None else momento
+        writes.cambio = CambiosDominio(dominio=self, momento=momento, have_changes=have_changes)
 
         if have_changes:
 
             for cambio in cambios:
                 logger.info(f" - CAMBIO {cambio['campo']} FROM {cambio['anterior']} TO {cambio['nuevo']}")
 
-                CampoCambio.objects.create(
-                    cambio=main_change,
+                writes.campos.append(CampoCambio(
                     campo=cambio['campo'],
                     anterior=cambio['anterior'],
-                    nuevo=cambio['nuevo'])
+                    nuevo=cambio['nuevo']))
 
             self.data_updated = timezone.now()
             self.next_update_priority = timezone.now() + timedelta(days=45)
@@ -299,13 +392,17 @@ class Dominio(models.Model):
         else:
             logger.info(f' - SIN CAMBIOS {self}')
 
+        if flush:
+            writes.flush()
         return cambios
 
-    def calculate_priority(self, save=True):
+    def calculate_priority(self, save=True, log=True, rules=None):
         """ We need a way to know how to use resources
             We can't update all domains every day.
 
             Define a priority value and a next_update date for this domain
+            log: save a sampled DominioPriorityLog
+            rules: PriorityRules to use (None to find the rules for the zone)
             """
         logger.info(f'Calculating priority for {self}')
         day_seconds = 86400
@@ -315,31 +412,213 @@ class Dominio(models.Model):
         readed_since = 0 if self.data_readed is None else int((timezone.now() - self.data_readed).total_seconds() / day_seconds)
         expired_since = 0 if self.expire is None else int((timezone.now() - self.expire).total_seconds() / day_seconds)
 
-        if self.zona.nombre == 'ar' or self.zona.nombre.endswith('.ar'):
-            from dominios.priority.ar import calculate_priority
-            priority, next_update_priority = calculate_priority(expired_since, readed_since, updated_since, self.estado)
-        else:
-            raise Exception('Unknown domain')
+        if rules is None:
+            from dominios.priority import registry
+            rules = registry.for_zona(self.zona)
+        priority, next_update_priority = rules.calculate_priority(expired_since, readed_since, updated_since, self.estado)
+        self.priority_transition_at = rules.transition_at(timezone.now(), self.expire, self.data_readed, self.estado)
 
         self.priority_to_update = priority
         self.next_update_priority = next_update_priority
 
-        data = {
-            'last_priority_calc': {
-                'now': timezone.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'update_since': updated_since,
-                'readed_since': readed_since,
-                'expired_since': expired_since,
-                'calculated_priority': priority,
-                'next_update_priority': next_update_priority.strftime("%Y-%m-%d %H:%M:%S"),
-            }
-        }
-        self.update_extras(data, save=False)
+        if log and DominioPriorityLog.sampled():
+            DominioPriorityLog.objects.create(
+                dominio=self,
+                source=DominioPriorityLog.SOURCE_CALC,
+                priority=priority,
+                next_update_priority=next_update_priority,
+                expired_since=expired_since,
+                readed_since=readed_since,
+                updated_since=updated_since,
+            )
         if save:
             self.save()
         return self
 
 
+class DominioPriorityLog(models.Model):
+    """ Sampled, append only history of priority calculations and picks.
+        Just for debugging, it replaces the old diagnostics at Dominio.extras """
+    SOURCE_CALC = 'calc'
+    SOURCE_PICKED = 'picked'
+    SOURCE_WHOARE = 'whoare'
+    SOURCE_CHOICES = [
+        (SOURCE_CALC, 'Priority calculated'),
+        (SOURCE_PICKED, 'Picked for update'),
+        (SOURCE_WHOARE, 'Updated from whoare'),
+    ]
+
+    dominio = models.ForeignKey(Dominio, on_delete=models.CASCADE, related_name='priority_logs')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    momento = models.DateTimeField(default=timezone.now)
+    priority = models.IntegerField(null=True, blank=True)
+    next_update_priority = models.DateTimeField(null=True, blank=True)
+    expired_since = models.IntegerField(null=True, blank=True)
+    readed_since = models.IntegerField(null=True, blank=True)
+    updated_since = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dominio', '-momento'], name='priority_log_dominio_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.dominio_id} {self.source} {self.priority}'
+
+    @staticmethod
+    def sampled():
+        """ Should we save this one? """
+        rate = settings.PRIORITY_LOG_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+
+class WhoareInbox(models.Model):
+    """ Validated whoare results waiting to be ingested (async mode).
+        The API just appends here, the drain_whoare_inbox command does the hard work """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_ERROR = 'error'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_ERROR, 'Error'),
+    ]
+
+    domain = models.CharField(max_length=240, help_text='Full domain name, just for humans')
+    payload = models.JSONField()
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    received = models.DateTimeField(default=timezone.now)
+    claimed = models.DateTimeField(null=True, blank=True)
+    claim_token = models.UUIDField(null=True, blank=True)
+    processed = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    # created and number of changes for done items
+    result = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='whoare_inbox_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.id} {self.domain} {self.status}'
+
+    @classmethod
+    def claim(cls, limit):
+        """ Take the next <limit> pending items (in arrival order) for processing.
+            Uses SELECT ... FOR UPDATE SKIP LOCKED if the database supports it
+            and a compare-and-set UPDATE with a claim token so many drainers
+            don't take the same items """
+        now = timezone.now()
+        token = uuid.uuid4()
+        with transaction.atomic():
+            pending = cls.objects.filter(status=cls.STATUS_PENDING).order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                pending = pending.select_for_update(skip_locked=True)
+            ids = list(pending.values_list('id', flat=True)[:limit])
+            cls.objects.filter(id__in=ids, status=cls.STATUS_PENDING).update(
+                status=cls.STATUS_PROCESSING,
+                claimed=now,
+                claim_token=token,
+                attempts=models.F('attempts') + 1,
+            )
+        return list(cls.objects.filter(id__in=ids, claim_token=token).order_by('id'))
+
+    @classmethod
+    def requeue_stale(cls, seconds, max_attempts):
+        """ Items claimed by a drainer that died are pending again.
+            The ones with max_attempts are failed, they could be the ones killing it.
+            Returns the number of items requeued and failed """
+        now = timezone.now()
+        stale = cls.objects.filter(status=cls.STATUS_PROCESSING, claimed__lt=now - timedelta(seconds=seconds))
+        failed = stale.filter(attempts__gte=max_attempts).update(
+            status=cls.STATUS_ERROR,
+            processed=now,
+            error='Claimed and not finished too many times',
+        )
+        requeued = stale.update(status=cls.STATUS_PENDING)
+        return requeued, failed
+
+
+class WhoisArchive(models.Model):
+    """ Compressed whois data of the reads that changed a domain.
+        Allows re-parsing (reparse_whois command) without querying whois again """
+    KIND_CHOICES = [
+        (KIND_RAW, 'Raw whois response'),
+        (KIND_WHOARE, 'WhoAre dict'),
+    ]
+
+    dominio = models.ForeignKey(Dominio, on_delete=models.CASCADE, related_name='whois_archive')
+    momento = models.DateTimeField(default=timezone.now)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    fingerprint = models.CharField(max_length=40, help_text='whoare_fingerprint of the parsed data')
+    data = models.BinaryField(help_text='zlib compressed')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dominio', '-momento'], name='whois_archive_dominio_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.dominio_id} {self.kind} {self.momento}'
+
+    @classmethod
+    def from_whoare(cls, dominio, wa, fingerprint):
+        """ Unsaved archive for a WhoAre object """
+        kind, text = whoare_payload(wa)
+        return cls(dominio=dominio, momento=dominio.data_readed, kind=kind, fingerprint=fingerprint, data=compress(text))
+
+    def get_text(self):
+        return decompress(self.data)
+
+    def get_whoare(self):
+        """ Parse the archived data again (no network access) """
+        return whoare_from_payload(self.dominio.full_domain(), self.kind, self.get_text())
+
+
+class ReplayCheckpoint(models.Model):
+    """ Progress of a replay_changes run (domains are processed by id), to resume it """
+    name = models.CharField(max_length=100, unique=True)
+    since = models.DateTimeField()
+    until = models.DateTimeField()
+    last_dominio_id = models.IntegerField(default=0, help_text='All the domains up to this id are done')
+    dominios = models.IntegerField(default=0, help_text='Domains processed')
+    cambios = models.IntegerField(default=0, help_text='CambiosDominio rebuilt')
+    started = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(auto_now=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.name} {self.last_dominio_id}'
+
+
+class ReadChanges:
+    """ Change records from a whois read (CambiosDominio, its CampoCambio
+        rows, the subscription events and the archived whois data),
+        saved with one bulk_create per model """
+
+    def __init__(self):
+        self.cambio = None
+        self.campos = []
+        self.events = []
+        self.archive = None
+
+    def flush(self):
+        if self.archive is not None:
+            self.archive.save()
+        if self.cambio is not None:
+            CambiosDominio.objects.bulk_create([self.cambio])
+            for campo in self.campos:
+                campo.cambio = self.cambio
+            if self.campos:
+                CampoCambio.objects.bulk_create(self.campos)
+        if self.events:
+            Event.objects.bulk_create(self.events)
+
+
 class DNSDominio(models.Model):
     uid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     dominio = models.ForeignKey(Dominio, on_delete=models.RESTRICT, related_name='dnss')
@@ -374,9 +653,8 @@ class PreDominio(models.Model):
              - Some error if is not valid raw domain -> False
         """
 
-        wa = WhoAre()
         try:
-            domain_name, zone_str = wa.detect_zone(dominio)
+            domain_name, zone_str = split_domain(dominio)
         except Exception as e:
             logger.error(f'Bad domain {dominio}: {e}')
             return False
@@ -385,9 +663,8 @@ class PreDominio(models.Model):
         if not domain_name or not zone_str:
             return False
 
-        try:
-            zone = Zona.objects.get(nombre=zone_str)
-        except Zona.DoesNotExist:
+        zone = zones.get(zone_str)
+        if zone is None:
             return False
 
         dominio = Dominio.objects.filter(nombre=domain_name, zona=zone).first()
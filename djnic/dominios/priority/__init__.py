@@ -0,0 +1,112 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+
+
+DAY_SECONDS = 86400
+# priority_transition_at for domains without a next rules change.
+# NULL means "not calculated yet" and it is picked by `update_priority --transitions`
+TRANSITION_NEVER = datetime(9999, 1, 1, tzinfo=timezone.utc)
+
+
+def days_since(now, value):
+    """ Same day measure used by Dominio.calculate_priority """
+    return 0 if value is None else int((now - value).total_seconds() / DAY_SECONDS)
+
+
+def day_reached(origin, days):
+    """ First moment when days_since(moment, origin) >= days.
+        Days are truncated toward zero, so negative values are reached
+        just after one more day """
+    if days > 0:
+        return origin + timedelta(days=days)
+    return origin + timedelta(days=days - 1, microseconds=1)
+
+
+class PriorityRegistry:
+    """ Priority rules by zone.
+        A zone uses (in order) the rules registered for its name, for
+        the longest matching suffix, for one of its groups (GrupoZona)
+        or the default rules """
+
+    def __init__(self):
+        self.by_zone = {}
+        self.by_suffix = {}
+        self.by_group = {}
+        self.default = None
+        # for_zona cache: zona_id -> rules, same life than zonas.registry
+        # (ZONES_CACHE_SECONDS, invalidated on Zona/ZonaEnGrupo changes)
+        self._zona_rules = {}
+        self._loaded = 0
+        self.lock = threading.Lock()
+
+    def register(self, rules, zones=(), suffixes=(), groups=()):
+        for zone in zones:
+            self.by_zone[zone] = rules
+        for suffix in suffixes:
+            self.by_suffix[suffix] = rules
+        for group in groups:
+            self.by_group[group] = rules
+        self.invalidate()
+
+    def invalidate(self):
+        with self.lock:
+            self._zona_rules = {}
+            self._loaded = time.monotonic()
+
+    def for_zone_name(self, nombre, grupos=()):
+        """ Rules for a zone name and its group names """
+        if nombre in self.by_zone:
+            return self.by_zone[nombre]
+        matches = [suffix for suffix in self.by_suffix if nombre.endswith(suffix)]
+        if matches:
+            return self.by_suffix[max(matches, key=len)]
+        for grupo in grupos:
+            if grupo in self.by_group:
+                return self.by_group[grupo]
+        return self.default
+
+    def for_zona(self, zona):
+        """ Rules for a Zona object (query the groups just if needed,
+            once per zone while cached) """
+        rules = self.for_zone_name(zona.nombre)
+        if rules is not self.default or not self.by_group:
+            return rules
+
+        if time.monotonic() - self._loaded >= settings.ZONES_CACHE_SECONDS:
+            self.invalidate()
+        rules = self._zona_rules.get(zona.id)
+        if rules is None:
+            grupos = zona.grupos.values_list('grupo__nombre', flat=True)
+            rules = self.for_zone_name(zona.nombre, grupos)
+            with self.lock:
+                # don't change the dict other threads could be reading
+                self._zona_rules = {**self._zona_rules, zona.id: rules}
+        return rules
+
+    def by_zona_id(self):
+        """ Resolve all the zones at once: dict zona_id -> rules.
+            To be used once per batch """
+        from zonas.models import Zona, ZonaEnGrupo
+
+        grupos = {}
+        for zona_id, grupo in ZonaEnGrupo.objects.values_list('zona_id', 'grupo__nombre'):
+            grupos.setdefault(zona_id, []).append(grupo)
+        return {
+            zona_id: self.for_zone_name(nombre, grupos.get(zona_id, []))
+            for zona_id, nombre in Zona.objects.values_list('id', 'nombre')
+        }
+
+
+registry = PriorityRegistry()
+
+
+def register_default_rules():
+    from dominios.priority import ar, default
+
+    registry.default = default.RULES
+    registry.register(ar.RULES, zones=['ar'], suffixes=['.ar'], groups=['Argentina'])
+
+
+register_default_rules()
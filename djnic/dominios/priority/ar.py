@@ -1,4 +1,51 @@
-from django.utils import timezone
+from dominios.priority.rules import Bucket, PriorityRules
+
+
+# si lo lei hace poco, darle baja prioridad, estamos leyendo algunas cosas muy seguido
+RECENT_READED_DAYS = 3
+RECENT_READED_PRIORITY = -4
+RECENT_READED_NEXT_DAYS = 1
+
+# Registered domains (estado = no disponible)
+REGISTERED_BUCKETS = [
+    # en Argentina los dominios caen 45 dias despues de vencidos
+    Bucket(46, 94, 11_500_000, 10, 6, 2_000_000, 5, 1, 3),
+    # Este es el momento de renovacion, es importante tambien
+    Bucket(0, 45, 5_200_000, 2, 10, 400_000, 5, 1, 3),
+    Bucket(-31, -1, 5_100_000, 2, 10, 500_000, 5, 1, 4),
+    # Demoras nuestras probablemente
+    Bucket(95, 364, 7_000_000, 5, 30, 200_000, 5, 1, 7),
+    Bucket(365, 1529, 5_000_000, 2, 50, 100_000, 5, 1, 15),
+    # probablemente judicializados y cosas sin sentido
+    Bucket(1530, None, 3_000_000, 2, 300, 50_000, 5, 1, 25),
+    # evitar los que expiran en 100 años, no usar (o limitar expire_days) aqui
+    Bucket(-60, -32, 150_000, 0, None, 0, 1_000, 0, 5),
+    Bucket(None, -61, 50_000, 0, None, 0, 1_000, 0, 15),
+]
+
+# non expected, a gap in the selecion
+GAP_PRIORITY = -2
+GAP_NEXT_DAYS = 15
+
+# Si el dominio cayo hace poco, darle alguna oportunidad
+# En generar los capturamos con los registros de todos los dias
+FREE_BUCKET = Bucket(None, None, 0, 0, None, 0, 100, 1, 90)
+
+RULES = PriorityRules(
+    name='ar',
+    registered_buckets=REGISTERED_BUCKETS,
+    free_bucket=FREE_BUCKET,
+    recent_readed_days=RECENT_READED_DAYS,
+    recent_readed_priority=RECENT_READED_PRIORITY,
+    recent_readed_next_days=RECENT_READED_NEXT_DAYS,
+    gap_priority=GAP_PRIORITY,
+    gap_next_days=GAP_NEXT_DAYS,
+)
+
+find_bucket = RULES.find_bucket
+get_priority = RULES.get_priority
+calculate_priorities = RULES.calculate_priorities
+transition_at = RULES.transition_at
 
 
 def calculate_priority(expire_days, readed_days, updated_days, estado):
@@ -8,67 +55,4 @@ def calculate_priority(expire_days, readed_days, updated_days, estado):
         updated_days: days since this domain was updated (readed and having changes)
 
         Priority for Argentina """
-
-    from dominios.models import STATUS_NO_DISPONIBLE
-
-    priority = 0
-    next_update_priority = timezone.now() + timezone.timedelta(days=15)
-
-    if readed_days <= 3:
-        # si lo lei hace poco, darle baja prioridad, estamos leyendo algunas cosas muy seguido
-        priority = -4
-        next_update_priority = timezone.now() + timezone.timedelta(days=1)
-        return priority, next_update_priority
-
-    # si ya lo leí hace poco, al fondo
-    if estado == STATUS_NO_DISPONIBLE:
-
-        # en Argentina los dominios caen 45 dias despues de vencidos
-        if expire_days >= 46 and expire_days < 95:
-            readed_days_pond = (readed_days - 6) * 2_000_000 if readed_days <= 6 else readed_days * 5
-            priority = 11_500_000 + (expire_days*10) + readed_days_pond + updated_days
-            next_update_priority = timezone.now() + timezone.timedelta(days=3)
-        elif expire_days >= 0 and expire_days < 46:
-            # Este es el momento de renovacion, es importante tambien
-            readed_days_pond = (readed_days - 10) * 400_000 if readed_days <= 10 else readed_days * 5
-            priority = 5_200_000 + (expire_days*2) + readed_days_pond + updated_days
-            next_update_priority = timezone.now() + timezone.timedelta(days=3)
-        elif expire_days >= -31 and expire_days < 0:
-            # Este es el momento de renovacion, es importante tambien
-            readed_days_pond = (readed_days - 10) * 500_000 if readed_days <= 10 else readed_days * 5
-            priority = 5_100_000 + (expire_days*2) + readed_days_pond + updated_days
-            next_update_priority = timezone.now() + timezone.timedelta(days=4)
-        elif expire_days > 94 and expire_days < 365:
-            # Demoras nuestras probablemente
-            readed_days_pond = (readed_days - 30) * 200_000 if readed_days <= 30 else readed_days * 5
-            priority = 7_000_000 + (expire_days*5) + readed_days_pond + updated_days
-            next_update_priority = timezone.now() + timezone.timedelta(days=7)
-        elif expire_days > 364 and expire_days < 1530:
-            # Demoras nuestras probablemente
-            readed_days_pond = (readed_days - 50) * 100_000 if readed_days <= 50 else readed_days * 5
-            priority = 5_000_000 + (expire_days*2) + readed_days_pond + updated_days
-            next_update_priority = timezone.now() + timezone.timedelta(days=15)
-        elif expire_days > 1529:
-            # probablemente judicializados y cosas sin sentido
-            readed_days_pond = (readed_days - 300) * 50_000 if readed_days <= 300 else readed_days * 5
-            priority = 3_000_000 + (expire_days*2) + readed_days_pond + updated_days
-            next_update_priority = timezone.now() + timezone.timedelta(days=25)
-        elif expire_days < -31 and expire_days >= -60:
-            # evitar los que expiran en 100 años, no usar (o limitar expire_days) aqui
-            priority = 150_000 + (readed_days * 1_000)
-            next_update_priority = timezone.now() + timezone.timedelta(days=5)
-        elif expire_days < -60:
-            # evitar los que expiran en 100 años, no usar (o limitar expire_days) aqui
-            priority = 50_000 + (readed_days * 1_000)
-            next_update_priority = timezone.now() + timezone.timedelta(days=15)
-        else:
-            # non expected, a gap in the selecion
-            priority = -2
-
-    else:
-        # Si el dominio cayo hace poco, darle alguna oportunidad
-        # En generar los capturamos con los registros de todos los dias
-        priority = (readed_days * 100) + updated_days
-        next_update_priority = timezone.now() + timezone.timedelta(days=90)
-
-    return priority, next_update_priority
+    return RULES.calculate_priority(expire_days, readed_days, updated_days, estado)
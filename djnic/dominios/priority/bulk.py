@@ -0,0 +1,106 @@
+""" Recalculate domain priorities in bulk.
+    Read just the needed columns (no Dominio objects), calculate
+    by columns and write back with a single UPDATE per chunk """
+from django.db import connection
+from django.utils import timezone
+from dominios.models import Dominio, DominioPriorityLog
+from dominios.priority import days_since, registry
+
+
+def recalculate_priorities(ids, zona_rules, now=None):
+    """ Recalculate and save the priority for a chunk of domains
+        ids: Dominio ids
+        zona_rules: dict zona_id -> PriorityRules (see registry.by_zona_id)
+        Returns a list of (id, old priority, new priority, new next_update_priority) """
+
+    if now is None:
+        now = timezone.now()
+
+    rows = Dominio.objects.filter(id__in=ids).values_list(
+        'id', 'expire', 'data_readed', 'data_updated', 'estado', 'zona_id', 'priority_to_update'
+    )
+    if not rows:
+        return []
+    dominio_ids, expires, readeds, updateds, estados, zona_ids, old_priorities = zip(*rows)
+
+    expire_days = [days_since(now, expire) for expire in expires]
+    readed_days = [days_since(now, readed) for readed in readeds]
+    updated_days = [days_since(now, updated) for updated in updateds]
+
+    # calculate by columns for each group of domains sharing the rules
+    by_rules = {}
+    for n, zona_id in enumerate(zona_ids):
+        by_rules.setdefault(zona_rules.get(zona_id, registry.default), []).append(n)
+
+    priorities = [None] * len(dominio_ids)
+    next_updates = [None] * len(dominio_ids)
+    transitions = [None] * len(dominio_ids)
+    for rules, positions in by_rules.items():
+        group_priorities, group_next_updates = rules.calculate_priorities(
+            expire_days=[expire_days[n] for n in positions],
+            readed_days=[readed_days[n] for n in positions],
+            updated_days=[updated_days[n] for n in positions],
+            estados=[estados[n] for n in positions],
+            now=now
+        )
+        for n, priority, next_update in zip(positions, group_priorities, group_next_updates):
+            priorities[n] = priority
+            next_updates[n] = next_update
+            transitions[n] = rules.transition_at(now, expires[n], readeds[n], estados[n])
+
+    write_priorities(dominio_ids, priorities, next_updates, transitions)
+
+    logs = [
+        DominioPriorityLog(
+            dominio_id=dominio_ids[n],
+            source=DominioPriorityLog.SOURCE_CALC,
+            momento=now,
+            priority=priorities[n],
+            next_update_priority=next_updates[n],
+            expired_since=expire_days[n],
+            readed_since=readed_days[n],
+            updated_since=updated_days[n],
+        )
+        for n in range(len(dominio_ids)) if DominioPriorityLog.sampled()
+    ]
+    if logs:
+        DominioPriorityLog.objects.bulk_create(logs)
+    return list(zip(dominio_ids, old_priorities, priorities, next_updates))
+
+
+def write_priorities(ids, priorities, next_updates, transitions):
+    """ Save priority_to_update, next_update_priority and
+        priority_transition_at with one UPDATE """
+
+    if connection.vendor == 'postgresql':
+        sql, params = values_update_sql(ids, priorities, next_updates, transitions)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    else:
+        # Django sends a single UPDATE ... CASE WHEN for each batch
+        dominios = [
+            Dominio(
+                id=dominio_id, priority_to_update=priority,
+                next_update_priority=next_update, priority_transition_at=transition
+            )
+            for dominio_id, priority, next_update, transition in zip(ids, priorities, next_updates, transitions)
+        ]
+        Dominio.objects.bulk_update(
+            dominios, ['priority_to_update', 'next_update_priority', 'priority_transition_at']
+        )
+
+
+def values_update_sql(ids, priorities, next_updates, transitions):
+    """ PostgreSQL UPDATE ... FROM (VALUES ...) for write_priorities """
+    values = ', '.join(['(%s::integer, %s::integer, %s::timestamptz, %s::timestamptz)'] * len(ids))
+    sql = (
+        f'UPDATE {Dominio._meta.db_table} AS d '
+        'SET priority_to_update = v.priority, next_update_priority = v.next_update, '
+        'priority_transition_at = v.transition '
+        f'FROM (VALUES {values}) AS v(id, priority, next_update, transition) '
+        'WHERE d.id = v.id'
+    )
+    params = []
+    for row in zip(ids, priorities, next_updates, transitions):
+        params.extend(row)
+    return sql, params
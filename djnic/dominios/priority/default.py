@@ -0,0 +1,20 @@
+""" Rules for zones without their own rules.
+    We don't know the expiration policies, so the priority
+    depends mostly on how old is our data """
+from dominios.priority.rules import Bucket, PriorityRules
+
+
+RULES = PriorityRules(
+    name='default',
+    registered_buckets=[
+        # cerca del vencimiento (sin conocer el periodo de gracia de la zona)
+        Bucket(-30, 60, 2_000_000, 2, 10, 100_000, 5, 1, 7),
+        Bucket(None, None, 1_000_000, 0, 30, 50_000, 5, 1, 15),
+    ],
+    free_bucket=Bucket(None, None, 0, 0, None, 0, 100, 1, 90),
+    recent_readed_days=3,
+    recent_readed_priority=-4,
+    recent_readed_next_days=1,
+    gap_priority=-2,
+    gap_next_days=15,
+)
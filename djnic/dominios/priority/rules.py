@@ -0,0 +1,138 @@
+from collections import namedtuple
+from django.utils import timezone
+from dominios.models import STATUS_NO_DISPONIBLE
+from dominios.priority import TRANSITION_NEVER, day_reached, days_since
+
+
+# Priority = base + (expire_days * expire_weight) + readed_days_pond + (updated_days * updated_weight)
+# readed_days_pond = (readed_days - readed_limit) * readed_penalty if readed_days <= readed_limit
+#                    else readed_days * readed_weight
+# expire_from/expire_to are inclusive days since expire (None = no limit)
+# readed_limit None means readed_days_pond is always readed_days * readed_weight
+Bucket = namedtuple('Bucket', [
+    'expire_from', 'expire_to', 'base', 'expire_weight',
+    'readed_limit', 'readed_penalty', 'readed_weight', 'updated_weight',
+    'next_days'
+])
+
+
+class PriorityRules:
+    """ A compiled table of priority rules for some zones.
+        Used by all the engines (python, columnar and SQL) """
+
+    def __init__(self, name, registered_buckets, free_bucket,
+                 recent_readed_days, recent_readed_priority, recent_readed_next_days,
+                 gap_priority, gap_next_days):
+        self.name = name
+        # registered domains (estado = no disponible), first match wins
+        self.registered_buckets = list(registered_buckets)
+        self.free_bucket = free_bucket
+        # recently readed domains get a fixed (low) priority
+        self.recent_readed_days = recent_readed_days
+        self.recent_readed_priority = recent_readed_priority
+        self.recent_readed_next_days = recent_readed_next_days
+        # registered domains out of all the buckets
+        self.gap_priority = gap_priority
+        self.gap_next_days = gap_next_days
+
+        # days since expire where the registered bucket changes
+        self.expire_edges = sorted(
+            {b.expire_from for b in self.registered_buckets if b.expire_from is not None} |
+            {b.expire_to + 1 for b in self.registered_buckets if b.expire_to is not None}
+        )
+
+    def __repr__(self):
+        return f'<PriorityRules {self.name}>'
+
+    def find_bucket(self, expire_days, estado):
+        """ Bucket for a domain (None if we are in a gap) """
+        if estado != STATUS_NO_DISPONIBLE:
+            return self.free_bucket
+
+        for bucket in self.registered_buckets:
+            if bucket.expire_from is not None and expire_days < bucket.expire_from:
+                continue
+            if bucket.expire_to is not None and expire_days > bucket.expire_to:
+                continue
+            return bucket
+        return None
+
+    @staticmethod
+    def bucket_priority(bucket, expire_days, readed_days, updated_days):
+        if bucket.readed_limit is not None and readed_days <= bucket.readed_limit:
+            readed_days_pond = (readed_days - bucket.readed_limit) * bucket.readed_penalty
+        else:
+            readed_days_pond = readed_days * bucket.readed_weight
+        return (
+            bucket.base + (expire_days * bucket.expire_weight) +
+            readed_days_pond + (updated_days * bucket.updated_weight)
+        )
+
+    def get_priority(self, expire_days, readed_days, updated_days, estado):
+        """ Priority and days to the next priority update """
+
+        if readed_days <= self.recent_readed_days:
+            return self.recent_readed_priority, self.recent_readed_next_days
+
+        bucket = self.find_bucket(expire_days, estado)
+        if bucket is None:
+            return self.gap_priority, self.gap_next_days
+
+        return self.bucket_priority(bucket, expire_days, readed_days, updated_days), bucket.next_days
+
+    def calculate_priority(self, expire_days, readed_days, updated_days, estado):
+        """ Priority and the next_update_priority datetime """
+        priority, next_days = self.get_priority(expire_days, readed_days, updated_days, estado)
+        return priority, timezone.now() + timezone.timedelta(days=next_days)
+
+    def calculate_priorities(self, expire_days, readed_days, updated_days, estados, now=None):
+        """ Columnar version of calculate_priority.
+            Get one list per column (same length) and returns the list of
+            priorities and the list of next_update_priority """
+
+        if now is None:
+            now = timezone.now()
+
+        # just one datetime for each possible "next days" value
+        next_dates = {}
+        priorities = []
+        next_updates = []
+        for expire, readed, updated, estado in zip(expire_days, readed_days, updated_days, estados):
+            priority, next_days = self.get_priority(expire, readed, updated, estado)
+            priorities.append(priority)
+            if next_days not in next_dates:
+                next_dates[next_days] = now + timezone.timedelta(days=next_days)
+            next_updates.append(next_dates[next_days])
+
+        return priorities, next_updates
+
+    def next_edges(self, expire_days, readed_days, estado):
+        """ Next values of the day counters where the rules for this domain change.
+            Returns (expire edge, readed edge), None if the rules will not change.
+            Between edges the priority just moves linearly with the days """
+
+        expire_edge = None
+        if estado == STATUS_NO_DISPONIBLE:
+            expire_edge = next((edge for edge in self.expire_edges if edge > expire_days), None)
+
+        readed_edges = []
+        if readed_days <= self.recent_readed_days:
+            readed_edges.append(self.recent_readed_days + 1)
+        bucket = self.find_bucket(expire_days, estado)
+        if bucket is not None and bucket.readed_limit is not None and readed_days <= bucket.readed_limit:
+            readed_edges.append(bucket.readed_limit + 1)
+
+        return expire_edge, min(readed_edges, default=None)
+
+    def transition_at(self, now, expire, readed, estado):
+        """ Moment of the next rules change for a domain (TRANSITION_NEVER if none)
+            expire and readed are the datetimes from the domain """
+
+        expire_edge, readed_edge = self.next_edges(days_since(now, expire), days_since(now, readed), estado)
+        moments = []
+        # missing dates are always 0 days
+        if expire is not None and expire_edge is not None:
+            moments.append(day_reached(expire, expire_edge))
+        if readed is not None and readed_edge is not None:
+            moments.append(day_reached(readed, readed_edge))
+        return min(moments, default=TRANSITION_NEVER)
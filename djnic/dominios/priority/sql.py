@@ -0,0 +1,182 @@
+""" Recalculate domain priorities inside the database.
+    The Argentina bucket table is translated to CASE expressions
+    and applied with a single UPDATE.
+    The next rules transition is not calculated here: priority_transition_at
+    is cleared so the next `update_priority --transitions` run calculates it """
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Expression, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThanOrEqual
+from django.utils import timezone
+from dominios.models import Dominio, DominioPriorityLog
+from dominios.priority import days_since, registry
+
+
+# max ids in each UPDATE when the domains are a fixed list (SQLite variables limit)
+IDS_CHUNK_SIZE = 20000
+
+
+class DaysSince(Expression):
+    """ Days since a datetime column truncated toward zero, like
+        int((now - column).total_seconds() / 86400) in Python.
+        SQLite only has millisecond precision here """
+    output_field = IntegerField()
+
+    def __init__(self, field, now):
+        super().__init__()
+        self.now = Value(now, output_field=DateTimeField())
+        self.column = F(field)
+
+    def get_source_expressions(self):
+        return [self.now, self.column]
+
+    def set_source_expressions(self, exprs):
+        self.now, self.column = exprs
+
+    def as_sql(self, compiler, connection):
+        now_sql, now_params = compiler.compile(self.now)
+        field_sql, field_params = compiler.compile(self.column)
+        sql = f'TRUNC(EXTRACT(EPOCH FROM ({now_sql} - {field_sql})) / 86400)::integer'
+        return sql, now_params + field_params
+
+    def as_sqlite(self, compiler, connection):
+        now_sql, now_params = compiler.compile(self.now)
+        field_sql, field_params = compiler.compile(self.column)
+        # integer division truncates toward zero
+        sql = f'(CAST(ROUND((julianday({now_sql}) - julianday({field_sql})) * 86400000) AS INTEGER) / 86400000)'
+        return sql, now_params + field_params
+
+
+def between(days, expire_from, expire_to):
+    """ Q-like condition for expire_from <= days <= expire_to (None = no limit) """
+    conditions = []
+    if expire_from is not None:
+        conditions.append(LessThanOrEqual(Value(expire_from), days))
+    if expire_to is not None:
+        conditions.append(LessThanOrEqual(days, Value(expire_to)))
+    q = Q()
+    for condition in conditions:
+        q &= Q(condition)
+    return q
+
+
+def bucket_priority_expression(bucket, expire_days, readed_days, updated_days):
+    """ SQL version of PriorityRules.bucket_priority """
+    readed_days_pond = readed_days * Value(bucket.readed_weight)
+    if bucket.readed_limit is not None:
+        readed_days_pond = Case(
+            When(
+                LessThanOrEqual(readed_days, Value(bucket.readed_limit)),
+                then=(readed_days - Value(bucket.readed_limit)) * Value(bucket.readed_penalty)
+            ),
+            default=readed_days_pond,
+            output_field=IntegerField(),
+        )
+    return (
+        Value(bucket.base) + expire_days * Value(bucket.expire_weight) +
+        readed_days_pond + updated_days * Value(bucket.updated_weight)
+    )
+
+
+def priority_expressions(rules, now):
+    """ CASE expressions for priority_to_update and next_update_priority """
+    from dominios.models import STATUS_NO_DISPONIBLE
+
+    expire_days = Coalesce(DaysSince('expire', now), 0)
+    readed_days = Coalesce(DaysSince('data_readed', now), 0)
+    updated_days = Coalesce(DaysSince('data_updated', now), 0)
+
+    def next_date(days):
+        return Value(now + timezone.timedelta(days=days), output_field=DateTimeField())
+
+    recent = Q(LessThanOrEqual(readed_days, Value(rules.recent_readed_days)))
+    priority_whens = [When(recent, then=Value(rules.recent_readed_priority))]
+    next_whens = [When(recent, then=next_date(rules.recent_readed_next_days))]
+
+    registered = Q(estado=STATUS_NO_DISPONIBLE)
+    for bucket in rules.registered_buckets:
+        condition = registered & between(expire_days, bucket.expire_from, bucket.expire_to)
+        priority_whens.append(
+            When(condition, then=bucket_priority_expression(bucket, expire_days, readed_days, updated_days))
+        )
+        next_whens.append(When(condition, then=next_date(bucket.next_days)))
+
+    priority_whens.append(When(registered, then=Value(rules.gap_priority)))
+    next_whens.append(When(registered, then=next_date(rules.gap_next_days)))
+
+    priority = Case(
+        *priority_whens,
+        default=bucket_priority_expression(rules.free_bucket, expire_days, readed_days, updated_days),
+        output_field=IntegerField(),
+    )
+    next_update = Case(
+        *next_whens,
+        default=next_date(rules.free_bucket.next_days),
+        output_field=DateTimeField(),
+    )
+    return priority, next_update
+
+
+def update_priorities_sql(dominios, now=None):
+    """ Recalculate the priority of all the domains in the queryset.
+        One UPDATE for each set of rules in use.
+        The queryset can be ordered and sliced.
+        Returns the number of updated domains """
+    if now is None:
+        now = timezone.now()
+
+    zonas_by_rules = {}
+    for zona_id, rules in registry.by_zona_id().items():
+        zonas_by_rules.setdefault(rules, []).append(zona_id)
+
+    if dominios.query.is_sliced:
+        # each UPDATE changes next_update_priority (the usual order), fix
+        # the selected domains before the first one or the next groups
+        # will see a different slice
+        ids = list(dominios.values_list('id', flat=True))
+        id_groups = [ids[start:start + IDS_CHUNK_SIZE] for start in range(0, len(ids), IDS_CHUNK_SIZE)]
+    else:
+        # without a slice the subquery is stable: each UPDATE touches other zones
+        ids = dominios.values('id')
+        id_groups = [ids]
+
+    # choose the sampled domains before the UPDATE moves them out of the queryset
+    sampled_ids = []
+    if settings.PRIORITY_LOG_SAMPLE_RATE > 0:
+        source = ids if isinstance(ids, list) else dominios.values_list('id', flat=True).iterator()
+        sampled_ids = [dominio_id for dominio_id in source if DominioPriorityLog.sampled()]
+
+    updated = 0
+    for rules, zona_ids in zonas_by_rules.items():
+        priority, next_update = priority_expressions(rules, now)
+        for group in id_groups:
+            updated += Dominio.objects.filter(zona_id__in=zona_ids, id__in=group).update(
+                priority_to_update=priority,
+                next_update_priority=next_update,
+                priority_transition_at=None,
+            )
+
+    log_priorities(sampled_ids, now)
+    return updated
+
+
+def log_priorities(ids, now):
+    """ DominioPriorityLog for these (already sampled) domains, like the other engines """
+    logs = []
+    for start in range(0, len(ids), IDS_CHUNK_SIZE):
+        rows = Dominio.objects.filter(id__in=ids[start:start + IDS_CHUNK_SIZE]).values_list(
+            'id', 'priority_to_update', 'next_update_priority', 'expire', 'data_readed', 'data_updated'
+        )
+        for dominio_id, priority, next_update, expire, readed, updated in rows:
+            logs.append(DominioPriorityLog(
+                dominio_id=dominio_id,
+                source=DominioPriorityLog.SOURCE_CALC,
+                momento=now,
+                priority=priority,
+                next_update_priority=next_update,
+                expired_since=days_since(now, expire),
+                readed_since=days_since(now, readed),
+                updated_since=days_since(now, updated),
+            ))
+    if logs:
+        DominioPriorityLog.objects.bulk_create(logs)
@@ -0,0 +1,106 @@
+""" Rebuild the change history (CambiosDominio/CampoCambio) from the
+    archived whois reads (WhoisArchive).
+    Each archived read is compared with the previous one using the current
+    diff (fixed bugs and new tracked fields included) """
+from itertools import groupby
+import logging
+from django.db import connections, transaction
+from django.db.models import Q
+from cambios.models import CambiosDominio, CampoCambio
+from dnss.models import DNS
+from dominios.diff import diff_whoare
+from dominios.models import DNSDominio, Dominio, WhoisArchive, STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE
+from registrantes.models import Registrante
+
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_domain(dominio, wa):
+    """ Unsaved copy of a domain as it was after a whois read (no queries) """
+    snapshot = Dominio(
+        id=dominio.id, nombre=dominio.nombre, zona=dominio.zona,
+        estado=STATUS_DISPONIBLE if wa.domain.is_free else STATUS_NO_DISPONIBLE,
+        registered=wa.domain.registered, changed=wa.domain.changed, expire=wa.domain.expire,
+    )
+    if wa.registrant is not None:
+        snapshot.registrante = Registrante(
+            name=wa.registrant.name, legal_uid=wa.registrant.legal_uid,
+            created=wa.registrant.created, changed=wa.registrant.changed,
+        )
+    snapshot._dnss_rows = [
+        DNSDominio(dns=DNS(dominio=ns.name), orden=n + 1) for n, ns in enumerate(wa.dnss)
+    ]
+    return snapshot
+
+
+def replay_domain(dominio, archives, since):
+    """ Changes of each archived read since <since> against the previous read.
+        archives: all the archives of the domain until the end of the period, by momento.
+        The last read before <since> is the baseline (or the first read if none).
+        Returns a list of (momento, cambios) """
+    start = 0
+    for n, archive in enumerate(archives):
+        if archive.momento < since:
+            start = n
+
+    baseline = None
+    results = []
+    for archive in archives[start:]:
+        wa = archive.get_whoare()
+        if baseline is not None and archive.momento >= since:
+            results.append((archive.momento, diff_whoare(baseline, wa)))
+        baseline = snapshot_domain(dominio, wa)
+    return results
+
+
+def replay_chunk(dominio_ids, since, until):
+    """ Rebuild the change records of these domains for the period [since, until).
+        Runs at the worker processes.
+        Returns (domains, CambiosDominio, errors) """
+    archives = WhoisArchive.objects.filter(
+        dominio_id__in=dominio_ids, momento__lt=until
+    ).select_related('dominio__zona').order_by('dominio_id', 'momento', 'id')
+
+    domains = errors = 0
+    replaced = Q()
+    cambios = []
+    campos = []
+    for _, domain_archives in groupby(archives, key=lambda archive: archive.dominio_id):
+        domain_archives = list(domain_archives)
+        dominio = domain_archives[0].dominio
+        domains += 1
+        try:
+            results = replay_domain(dominio, domain_archives, since)
+        except Exception as e:
+            logger.error(f'Error replaying {dominio}: {e}')
+            errors += 1
+            continue
+
+        momentos = [momento for momento, _ in results]
+        if not momentos:
+            continue
+        # the records of the same reads (same momento) are replaced
+        replaced |= Q(dominio_id=dominio.id, momento__in=momentos)
+        for momento, diff in results:
+            cambio = CambiosDominio(dominio_id=dominio.id, momento=momento, have_changes=len(diff) > 0)
+            cambios.append(cambio)
+            campos.extend(
+                (cambio, CampoCambio(campo=c['campo'], anterior=c['anterior'], nuevo=c['nuevo']))
+                for c in diff
+            )
+
+    if cambios:
+        with transaction.atomic():
+            CambiosDominio.objects.filter(replaced).delete()
+            CambiosDominio.objects.bulk_create(cambios)
+            for cambio, campo in campos:
+                campo.cambio = cambio
+            CampoCambio.objects.bulk_create([campo for _, campo in campos])
+
+    return domains, len(cambios), errors
+
+
+def close_connections():
+    # each process needs its own database connection
+    connections.close_all()
@@ -0,0 +1,114 @@
+import json
+from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
+from django.contrib.auth.models import User
+from django.test import TestCase
+from dominios.models import Dominio, PreDominio, STATUS_NO_DISPONIBLE
+from zonas.models import Zona
+
+
+def whoare_dict(base_name, zone='com.ar', legal_uid='98798798798', dnss=None, expire='2030-03-19 09:11:29.00000 -0300'):
+    return {
+        "whoare_version": '0.2.4',
+        "domain": {
+            "base_name": base_name,
+            "zone": zone,
+            "is_free": False,
+            "registered": "2020-03-19 09:11:31.00000 -0300",
+            "changed": "2020-03-19 09:11:30.00000 -0300",
+            "expire": expire
+        },
+        "registrant": {
+            "name": "Jhon Perez",
+            "legal_uid": legal_uid,
+            "created": "2020-03-19 09:11:28.00000 -0300",
+            "changed": "2020-03-19 09:11:27.00000 -0300"
+        },
+        "dnss": dnss or ['ns1.sedoparking.com', 'ns2.sedoparking.com']
+    }
+
+
+class APIDominioBulkTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('john', 'jhon@lala.com', 'john')
+        cls.regular_user_token = Token.objects.create(user=cls.user)
+        cls.admin_user = User.objects.create_user('admin', 'admin@lala.com', 'admin', is_staff=True, is_superuser=True)
+        cls.admin_user_token = Token.objects.create(user=cls.admin_user)
+        cls.zona = Zona.objects.create(nombre='com.ar')
+
+    def setUp(self):
+        self.ep = '/api/v1/dominios/dominio/update_from_whoare_bulk/'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.admin_user_token.key)
+
+    def test_permissions(self):
+        anon = APIClient()
+        resp = anon.post(self.ep, {'domains': [whoare_dict('fernet')]}, format='json')
+        self.assertEqual(resp.status_code, 401)
+
+        regular = APIClient()
+        regular.credentials(HTTP_AUTHORIZATION='Token ' + self.regular_user_token.key)
+        resp = regular.post(self.ep, {'domains': [whoare_dict('fernet')]}, format='json')
+        self.assertEqual(resp.status_code, 403)
+
+    def test_bad_request(self):
+        resp = self.client.post(self.ep, {'domains': []}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post(self.ep, {'domains': 'not json'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bulk_create_and_update(self):
+        PreDominio.objects.create(dominio='fernet.com.ar')
+        domains = [whoare_dict('fernet'), whoare_dict('vino'), whoare_dict('mate', zone='net.ar')]
+        resp = self.client.post(self.ep, {'domains': domains}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['errors'], 0)
+        self.assertEqual([r['created'] for r in data['results']], [True, True, True])
+
+        self.assertEqual(PreDominio.objects.count(), 0)
+        self.assertEqual(Dominio.objects.filter(estado=STATUS_NO_DISPONIBLE).count(), 3)
+        self.assertTrue(Zona.objects.filter(nombre='net.ar').exists())
+        fernet = Dominio.objects.get(nombre='fernet', zona=self.zona)
+        self.assertEqual(fernet.dnss.count(), 2)
+
+        # second read with a renewal, form-encoded like whoare-serve nodes
+        domains = [json.dumps(whoare_dict('fernet', expire='2031-03-19 09:11:29.00000 -0300'))]
+        resp = self.client.post(self.ep, {'domains': json.dumps(domains)})
+        self.assertEqual(resp.status_code, 200)
+        result = resp.json()['results'][0]
+        self.assertFalse(result['created'])
+        self.assertEqual([c['campo'] for c in result['cambios']], ['dominio_expire'])
+
+    def test_bad_items_do_not_fail_the_batch(self):
+        bad_version = whoare_dict('malbec')
+        bad_version['whoare_version'] = '0.0.1'
+        broken = whoare_dict('torrontes')
+        del broken['domain']['registered']
+        free = {"whoare_version": '0.2.4', "domain": {"base_name": 'libre', "zone": 'com.ar', "is_free": True}}
+
+        domains = [whoare_dict('fernet'), bad_version, 'not-a-json', broken, free, whoare_dict('vino')]
+        resp = self.client.post(self.ep, {'domains': domains}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()['results']
+        self.assertEqual([r['ok'] for r in results], [True, False, False, False, False, True])
+        self.assertEqual(results[1]['error'], 'Unexpected WhoAre version')
+        self.assertEqual(results[4]['error'], 'We expect a REGISTERED domain')
+        self.assertEqual(
+            set(Dominio.objects.values_list('nombre', flat=True)),
+            {'fernet', 'vino'}
+        )
+
+    def test_free_domain_does_not_create_the_zone(self):
+        free = {"whoare_version": '0.2.4', "domain": {"base_name": 'libre', "zone": 'tur.ar', "is_free": True}}
+        resp = self.client.post(self.ep, {'domains': [free]}, format='json')
+        self.assertEqual(resp.json()['results'][0]['error'], 'We expect a REGISTERED domain')
+
+        resp = self.client.post(
+            '/api/v1/dominios/dominio/update_from_whoare/', {'domain': json.dumps(free)}, format='json'
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Zona.objects.filter(nombre='tur.ar').exists())
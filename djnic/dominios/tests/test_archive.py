@@ -0,0 +1,124 @@
+import json
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from dominios.archive import KIND_RAW, KIND_WHOARE, whoare_from_raw
+from dominios.ingest import ingest_whoare_object, load_whoare_payload
+from dominios.models import Dominio, WhoisArchive, whoare_fingerprint
+from dominios.tests.test_api_bulk import whoare_dict
+from subscriptions.models import Event
+from zonas.models import Zona
+
+
+SAMPLE = 'djnic/whosamples/sample_fernet.txt'
+
+
+def read_sample(path=SAMPLE):
+    with open(path) as f:
+        return f.read()
+
+
+class WhoisArchiveTestCase(TestCase):
+
+    def setUp(self):
+        self.zona = Zona.objects.create(nombre='com.ar')
+
+    def ingest(self, payload):
+        dominio = Dominio.objects.filter(nombre=payload['domain']['base_name']).first()
+        return ingest_whoare_object(load_whoare_payload(payload), zona=self.zona, dominio=dominio)[0]
+
+    def test_archive_whoare_dict(self):
+        payload = whoare_dict('fernet')
+        dominio = self.ingest(payload)
+        archive = dominio.whois_archive.get()
+        self.assertEqual(archive.kind, KIND_WHOARE)
+        self.assertEqual(archive.fingerprint, dominio.whois_fingerprint)
+        self.assertLess(len(archive.data), len(json.dumps(payload)))
+        self.assertEqual(json.loads(archive.get_text())['registrant']['legal_uid'], payload['registrant']['legal_uid'])
+        self.assertEqual(whoare_fingerprint(archive.get_whoare()), dominio.whois_fingerprint)
+
+    def test_deduplicated(self):
+        self.ingest(whoare_dict('fernet'))
+        # same data, nothing to archive
+        dominio = self.ingest(whoare_dict('fernet'))
+        self.assertEqual(dominio.whois_archive.count(), 1)
+        # new data
+        dominio = self.ingest(whoare_dict('fernet', expire='2031-03-19 09:11:29.00000 -0300'))
+        self.assertEqual(dominio.whois_archive.count(), 2)
+
+    def test_archive_raw(self):
+        wa = whoare_from_raw('fernet.com.ar', read_sample())
+        dominio = Dominio.objects.create(nombre='fernet', zona=self.zona)
+        dominio.update_from_wa_object(wa, just_created=True)
+        archive = dominio.whois_archive.get()
+        self.assertEqual(archive.kind, KIND_RAW)
+        self.assertEqual(archive.get_text(), read_sample())
+        self.assertEqual(archive.get_whoare().domain.expire, wa.domain.expire)
+
+    def test_archive_pushed_raw_data(self):
+        payload = whoare_dict('fernet')
+        payload['raw_data'] = read_sample()
+        archive = self.ingest(payload).whois_archive.get()
+        self.assertEqual(archive.kind, KIND_RAW)
+        self.assertEqual(archive.get_text(), read_sample())
+
+    @override_settings(WHOIS_ARCHIVE_ENABLED=False)
+    def test_disabled(self):
+        dominio = self.ingest(whoare_dict('fernet'))
+        self.assertEqual(dominio.whois_archive.count(), 0)
+
+
+class ReparseWhoisTestCase(TestCase):
+
+    def setUp(self):
+        zona = Zona.objects.create(nombre='com.ar')
+        self.dominio = Dominio.objects.create(nombre='fernet', zona=zona)
+        # a read with a buggy parser: everything OK but the expire date
+        wa = whoare_from_raw('fernet.com.ar', read_sample())
+        self.expire = wa.domain.expire
+        wa.domain.expire = wa.domain.expire.replace(year=2040)
+        wa.raw_data = read_sample()
+        self.dominio.update_from_wa_object(wa, just_created=True)
+        self.archive = self.dominio.whois_archive.get()
+
+    def reparse(self, *args):
+        out = StringIO()
+        call_command('reparse_whois', '--workers', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        out = self.reparse('--dry-run')
+        self.assertIn('changed 1', out)
+        self.dominio.refresh_from_db()
+        self.assertEqual(self.dominio.expire.year, 2040)
+
+    @override_settings(UNWATCHED_EVENTS='keep')
+    def test_reparse(self):
+        pending_events = Event.objects.filter(processed=False).count()
+        out = self.reparse('--zone', 'com.ar')
+        self.assertIn('1 processed. changed 1 cambios 1', out)
+        # the expire change is registered but nobody is notified
+        self.assertTrue(Event.objects.filter(processed=True).exists())
+        self.assertEqual(Event.objects.filter(processed=False).count(), pending_events)
+        self.dominio.refresh_from_db()
+        self.assertEqual(self.dominio.expire, self.expire)
+        # no new archive for replayed data
+        self.assertEqual(self.dominio.whois_archive.count(), 1)
+        self.archive.refresh_from_db()
+        self.assertEqual(self.archive.fingerprint, self.dominio.whois_fingerprint)
+
+        # nothing to do the second time
+        out = self.reparse('--domain', 'fernet.com.ar')
+        self.assertIn('changed 0', out)
+        self.assertIn('sin_cambios 1', out)
+
+    def test_outdated_archive(self):
+        Dominio.objects.filter(id=self.dominio.id).update(whois_fingerprint='other')
+        out = self.reparse()
+        self.assertIn('outdated 1', out)
+
+    def test_whoare_dicts_are_not_parsed_again(self):
+        WhoisArchive.objects.filter(id=self.archive.id).update(kind=KIND_WHOARE)
+        out = self.reparse()
+        self.assertIn('changed 0', out)
+        self.assertIn('not_raw 1', out)
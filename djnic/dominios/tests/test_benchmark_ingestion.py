@@ -0,0 +1,62 @@
+import random
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from dnss.models import DNS
+from dominios.management.commands.benchmark_ingestion import PayloadGenerator, load_templates, percentile
+from dominios.models import Dominio
+from registrantes.models import Registrante
+from zonas.models import Zona
+
+
+class PayloadGeneratorTestCase(TestCase):
+
+    def test_templates(self):
+        templates = load_templates()
+        self.assertGreater(len(templates), 0)
+        self.assertFalse(any(t['domain']['is_free'] for t in templates))
+
+    def test_rounds(self):
+        generator = PayloadGenerator(load_templates(), 200, 'bench.ar', random.Random(1), drop=0.1, renew=0.2)
+        rounds = list(generator.rounds(2))
+        self.assertEqual(len(rounds), 3)
+        self.assertEqual({p['domain']['zone'] for p in rounds[0]}, {'bench.ar'})
+        self.assertEqual(len({p['domain']['base_name'] for p in rounds[0]}), 200)
+        self.assertGreater(generator.mutations['drop'], 0)
+        self.assertGreater(generator.mutations['renew'], 0)
+        dropped = [p for p in rounds[2] if p['domain']['is_free']]
+        self.assertEqual(len(dropped), generator.mutations['drop'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 51)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 99), 0)
+
+
+class BenchmarkIngestionTestCase(TestCase):
+
+    def test_command(self):
+        out = StringIO()
+        DNS.objects.create(dominio='ns1.sedoparking.com')
+        call_command(
+            'benchmark_ingestion', '--domains', '10', '--rounds', '1', '--batch-size', '5', '--i-know-this-writes',
+            stdout=out
+        )
+        output = out.getvalue()
+        for mode in ['single', 'bulk', 'async', 'direct']:
+            self.assertIn(f'{mode}: 20 domains', output)
+        self.assertIn('errors 0', output)
+        self.assertIn('p99', output)
+        # nothing left
+        self.assertFalse(Dominio.objects.exists())
+        self.assertFalse(Registrante.objects.exists())
+        self.assertFalse(Zona.objects.exists())
+        # just the nameservers we already had
+        self.assertEqual(list(DNS.objects.values_list('dominio', flat=True)), ['ns1.sedoparking.com'])
+
+    def test_refuse_without_debug(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_ingestion', '--domains', '1', stdout=StringIO())
+        self.assertFalse(Zona.objects.exists())
@@ -0,0 +1,58 @@
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+from whoare.whoare import WhoAre
+from whoare.exceptions import TooManyQueriesError
+from dominios.crawler import WhoisCrawler
+from dominios.models import Dominio
+from zonas.models import Zona
+
+
+SAMPLE = 'djnic/whosamples/sample_fernet.txt'
+
+
+class WhoisCrawlerTestCase(TestCase):
+
+    def setUp(self):
+        zona = Zona.objects.create(nombre='com.ar')
+        self.dominio = Dominio.objects.create(nombre='fernet', zona=zona)
+
+    def test_crawler_command(self):
+        out = StringIO()
+        call_command('update_domains', workers=2, rate=100, mock_from_txt_file=SAMPLE, stdout=out)
+        self.assertIn('1 processed', out.getvalue())
+        self.assertIn('domains/s', out.getvalue())
+
+        dominio = Dominio.objects.get(nombre='fernet')
+        self.assertIsNotNone(dominio.data_readed)
+        self.assertEqual(dominio.dnss.count(), 2)
+
+    def test_retry_after_too_many_queries(self):
+        real_load = WhoAre.load
+        calls = []
+
+        def load(wa, domain, **kwargs):
+            calls.append(domain)
+            if len(calls) == 1:
+                raise TooManyQueriesError('slow down')
+            return real_load(wa, domain, **kwargs)
+
+        crawler = WhoisCrawler(workers=2, rate=100, backoff=0.01, mock_from_txt_file=SAMPLE)
+        with mock.patch.object(WhoAre, 'load', load):
+            stats = crawler.run([self.dominio])
+
+        self.assertEqual(calls, ['fernet.com.ar', 'fernet.com.ar'])
+        self.assertEqual(stats['too_many_queries'], 1)
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(stats['processed'], 1)
+        # the server was slowed down
+        limiter = list(crawler.limiters.values())[0]
+        self.assertLess(limiter.bucket.rate, 100)
+
+    def test_serial_mode(self):
+        out = StringIO()
+        call_command('update_domains', sleep=0, mock_from_txt_file=SAMPLE, stdout=out)
+        self.assertIn('1 processed', out.getvalue())
+        self.assertIsNotNone(Dominio.objects.get(nombre='fernet').expire)
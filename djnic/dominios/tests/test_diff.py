@@ -0,0 +1,44 @@
+from datetime import timedelta
+from django.test import TestCase
+from whoare.whoare import WhoAre
+from dominios.diff import diff_whoare
+from dominios.management.commands.benchmark_diff import build_stored_domain, legacy_diff
+from dominios.models import Dominio
+
+
+SAMPLES = 'djnic/whosamples/'
+
+
+def load(sample, domain='fernet.com.ar'):
+    wa = WhoAre()
+    wa.load(domain, mock_from_txt_file=SAMPLES + sample)
+    return wa
+
+
+class DiffTestCase(TestCase):
+
+    def test_same_results_as_legacy(self):
+        pairs = [
+            ('sample_fernet.txt', 'sample_fernet.txt'),
+            ('sample_fernet.txt', 'sample_fernet_updated.txt'),
+            ('sample_fernet_updated.txt', 'sample_fernet.txt'),
+        ]
+        for stored, readed in pairs:
+            dominio = build_stored_domain(load(stored))
+            wa = load(readed)
+            self.assertEqual(diff_whoare(dominio, wa), legacy_diff(dominio, wa))
+
+        # seconds and microseconds at the stored dates
+        dominio = build_stored_domain(load('sample_fernet.txt'))
+        dominio.expire += timedelta(microseconds=999)
+        dominio.changed += timedelta(seconds=1)
+        wa = load('sample_fernet.txt')
+        cambios = diff_whoare(dominio, wa)
+        self.assertEqual(cambios, legacy_diff(dominio, wa))
+        self.assertEqual([c['campo'] for c in cambios], ['dominio_changed', 'DNS1', 'DNS2'])
+
+    def test_apply_new_version(self):
+        Dominio.add_from_whois('fernet.com.ar', mock_from_txt_file=SAMPLES + 'sample_fernet.txt')
+        dominio = Dominio.objects.get(nombre='fernet')
+        cambios = dominio.apply_new_version(load('sample_fernet_updated.txt'))
+        self.assertEqual(len(cambios), 8)
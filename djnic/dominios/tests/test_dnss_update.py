@@ -0,0 +1,47 @@
+from django.test import TestCase
+from dnss.models import DNS, Empresa, EmpresaRegexDomain
+from dominios.models import Dominio, DNSDominio, STATUS_NO_DISPONIBLE
+from zonas.models import Zona
+
+
+class UpdateDNSsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar')
+        empresa = Empresa.objects.create(nombre='Sedo')
+        cls.regex = EmpresaRegexDomain.objects.create(empresa=empresa, regex_dns=r'(.*).sedoparking.com$')
+
+    def setUp(self):
+        self.dominio = Dominio.objects.create(nombre='fernet', zona=self.zona, estado=STATUS_NO_DISPONIBLE)
+
+    def names(self):
+        return [d.dns.dominio for d in self.dominio.dnss.order_by('orden')]
+
+    def test_new_dnss(self):
+        DNS.objects.create(dominio='ns1.sedoparking.com')
+        self.dominio.update_dnss(['ns1.sedoparking.com', 'ns2.sedoparking.com'], current=[])
+        self.assertEqual(self.names(), ['ns1.sedoparking.com', 'ns2.sedoparking.com'])
+        self.assertEqual(DNS.objects.count(), 2)
+        # the empresa is assigned as with DNS.save()
+        self.assertEqual(DNS.objects.get(dominio='ns2.sedoparking.com').empresa_regex, self.regex)
+
+    def test_unchanged_list_without_queries(self):
+        self.dominio.update_dnss(['ns1.sedoparking.com', 'ns2.sedoparking.com'], current=[])
+        current = list(self.dominio.dnss.select_related('dns').order_by('orden'))
+        with self.assertNumQueries(0):
+            self.dominio.update_dnss(['ns1.sedoparking.com', 'ns2.sedoparking.com'], current=current)
+
+    def test_changes(self):
+        self.dominio.update_dnss(['ns1.a.com', 'ns2.a.com', 'ns3.a.com'], current=[])
+        keep = DNSDominio.objects.get(dominio=self.dominio, orden=1)
+
+        self.dominio.update_dnss(['ns1.a.com', 'ns2.b.com'])
+        self.assertEqual(self.names(), ['ns1.a.com', 'ns2.b.com'])
+        self.assertEqual(DNSDominio.objects.get(dominio=self.dominio, orden=1).id, keep.id)
+
+        self.dominio.update_dnss(['ns2.b.com', 'ns1.a.com', 'ns9.c.com'])
+        self.assertEqual(self.names(), ['ns2.b.com', 'ns1.a.com', 'ns9.c.com'])
+
+        self.dominio.update_dnss([])
+        self.assertEqual(self.names(), [])
@@ -0,0 +1,42 @@
+from django.test import TestCase
+from whoare.whoare import WhoAre
+from cambios.models import CambiosDominio
+from dominios.models import Dominio
+
+
+class UnchangedReadTestCase(TestCase):
+
+    def test_same_whois_skip_writes(self):
+        Dominio.add_from_whois('fernet.com.ar', mock_from_txt_file='djnic/whosamples/sample_fernet.txt')
+        dominio = Dominio.objects.get(nombre='fernet', zona__nombre='com.ar')
+        self.assertIsNotNone(dominio.whois_fingerprint)
+        first_read = dominio.data_readed
+        registrante_modified = dominio.registrante.object_modified
+
+        res, error, cambios = Dominio.add_from_whois('fernet.com.ar', mock_from_txt_file='djnic/whosamples/sample_fernet.txt')
+        self.assertEqual(cambios, [])
+
+        dominio = Dominio.objects.get(nombre='fernet', zona__nombre='com.ar')
+        self.assertGreater(dominio.data_readed, first_read)
+        # the read is registered without changes
+        self.assertEqual(dominio.cambios.count(), 1)
+        self.assertFalse(CambiosDominio.objects.get(dominio=dominio).have_changes)
+        # the registrant was not rewritten
+        self.assertEqual(dominio.registrante.object_modified, registrante_modified)
+        self.assertEqual(dominio.dnss.count(), 2)
+
+        # new data uses the full path again
+        res, error, cambios = Dominio.add_from_whois('fernet.com.ar', mock_from_txt_file='djnic/whosamples/sample_fernet_updated.txt')
+        self.assertEqual(len(cambios), 8)
+        dominio = Dominio.objects.get(nombre='fernet', zona__nombre='com.ar')
+        self.assertEqual(dominio.cambios.filter(have_changes=True).count(), 1)
+
+    def test_unchanged_read_is_a_narrow_update(self):
+        Dominio.add_from_whois('fernet.com.ar', mock_from_txt_file='djnic/whosamples/sample_fernet.txt')
+        dominio = Dominio.objects.select_related('zona').get(nombre='fernet', zona__nombre='com.ar')
+
+        wa = WhoAre()
+        wa.load('fernet.com.ar', mock_from_txt_file='djnic/whosamples/sample_fernet.txt')
+        # one INSERT for the read record and one UPDATE for the domain
+        with self.assertNumQueries(2):
+            dominio.update_from_wa_object(wa, just_created=False)
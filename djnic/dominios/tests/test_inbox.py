@@ -0,0 +1,167 @@
+import json
+from io import StringIO
+from unittest import mock
+from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from dominios.ingest import drain_whoare_inbox, INBOX_MAX_ATTEMPTS
+from dominios.models import Dominio, WhoareInbox
+from dominios.tests.test_api_bulk import whoare_dict
+from zonas.models import Zona
+
+
+@override_settings(WHOARE_INGEST_ASYNC=True)
+class WhoareInboxAPITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user('admin', 'admin@lala.com', 'admin', is_staff=True, is_superuser=True)
+        cls.admin_user_token = Token.objects.create(user=cls.admin_user)
+        cls.zona = Zona.objects.create(nombre='com.ar')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.admin_user_token.key)
+
+    def test_single_queued(self):
+        ep = '/api/v1/dominios/dominio/update_from_whoare/'
+        resp = self.client.post(ep, {'domain': json.dumps(whoare_dict('fernet'))}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        data = resp.json()
+        self.assertTrue(data['ok'])
+        self.assertEqual(data['domain'], 'fernet.com.ar')
+
+        item = WhoareInbox.objects.get(id=data['queued'])
+        self.assertEqual(item.status, WhoareInbox.STATUS_PENDING)
+        self.assertEqual(item.payload['domain']['base_name'], 'fernet')
+        # nothing ingested yet
+        self.assertFalse(Dominio.objects.filter(nombre='fernet').exists())
+
+    def test_single_invalid(self):
+        ep = '/api/v1/dominios/dominio/update_from_whoare/'
+        payload = whoare_dict('fernet')
+        payload['whoare_version'] = '0.0.1'
+        resp = self.client.post(ep, {'domain': json.dumps(payload)}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(WhoareInbox.objects.count(), 0)
+
+    def test_bulk_queued(self):
+        ep = '/api/v1/dominios/dominio/update_from_whoare_bulk/'
+        domains = [whoare_dict('fernet'), {'bad': 'payload'}, whoare_dict('cafe')]
+        resp = self.client.post(ep, {'domains': domains}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        data = resp.json()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['errors'], 1)
+        self.assertFalse(data['results'][1]['ok'])
+        self.assertEqual(
+            list(WhoareInbox.objects.order_by('id').values_list('domain', flat=True)),
+            ['fernet.com.ar', 'cafe.com.ar']
+        )
+
+
+class WhoareInboxDrainTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar')
+
+    def queue(self, payload):
+        return WhoareInbox.objects.create(domain='x', payload=payload)
+
+    def test_drain(self):
+        ok = self.queue(whoare_dict('fernet'))
+        free = whoare_dict('nuevo')
+        free['domain']['is_free'] = True
+        error = self.queue(free)
+
+        processed, errors = drain_whoare_inbox(batch_size=10)
+        self.assertEqual((processed, errors), (2, 1))
+
+        ok.refresh_from_db()
+        self.assertEqual(ok.status, WhoareInbox.STATUS_DONE)
+        self.assertEqual(ok.attempts, 1)
+        self.assertEqual(ok.result['created'], True)
+        self.assertIsNotNone(ok.processed)
+        self.assertTrue(Dominio.objects.filter(nombre='fernet').exists())
+
+        error.refresh_from_db()
+        self.assertEqual(error.status, WhoareInbox.STATUS_ERROR)
+        self.assertEqual(error.error, 'We expect a REGISTERED domain')
+
+        self.assertEqual(drain_whoare_inbox(batch_size=10), (0, 0))
+
+    def test_arrival_order(self):
+        self.queue(whoare_dict('fernet', expire='2030-03-19 09:11:29.00000 -0300'))
+        self.queue(whoare_dict('fernet', expire='2031-03-19 09:11:29.00000 -0300'))
+        drain_whoare_inbox(batch_size=1)
+        drain_whoare_inbox(batch_size=1)
+        dominio = Dominio.objects.get(nombre='fernet')
+        self.assertEqual(dominio.expire.year, 2031)
+
+    def test_claimed_items_not_taken_again(self):
+        self.queue(whoare_dict('fernet'))
+        self.queue(whoare_dict('cafe'))
+        first = WhoareInbox.claim(1)
+        second = WhoareInbox.claim(10)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first[0].id, second[0].id)
+        self.assertEqual(WhoareInbox.claim(10), [])
+
+    def test_requeue_stale(self):
+        self.queue(whoare_dict('fernet'))
+        WhoareInbox.claim(10)
+        self.assertEqual(WhoareInbox.requeue_stale(600, INBOX_MAX_ATTEMPTS), (0, 0))
+        self.assertEqual(WhoareInbox.requeue_stale(-1, INBOX_MAX_ATTEMPTS), (1, 0))
+        self.assertEqual(len(WhoareInbox.claim(10)), 1)
+
+    def test_requeue_stale_max_attempts(self):
+        """ An item killing the drainer is not requeued forever """
+        item = self.queue(whoare_dict('fernet'))
+        self.queue(whoare_dict('cafe'))
+        for _ in range(INBOX_MAX_ATTEMPTS):
+            WhoareInbox.claim(10)
+            requeued, failed = WhoareInbox.requeue_stale(-1, INBOX_MAX_ATTEMPTS)
+        self.assertEqual((requeued, failed), (0, 2))
+        item.refresh_from_db()
+        self.assertEqual(item.status, WhoareInbox.STATUS_ERROR)
+        self.assertIsNotNone(item.processed)
+        self.assertEqual(WhoareInbox.claim(10), [])
+
+    def test_failed_batch_retried(self):
+        item = self.queue(whoare_dict('fernet'))
+        with mock.patch('dominios.ingest.ingest_whoare_batch', side_effect=Exception('DB down')):
+            for _ in range(INBOX_MAX_ATTEMPTS):
+                self.assertEqual(drain_whoare_inbox(), (0, 1))
+                item.refresh_from_db()
+        self.assertEqual(item.status, WhoareInbox.STATUS_ERROR)
+        self.assertEqual(item.error, 'DB down')
+        self.assertEqual(item.attempts, INBOX_MAX_ATTEMPTS)
+
+    def test_command_failed_batch(self):
+        item = self.queue(whoare_dict('fernet'))
+        out = StringIO()
+        with mock.patch('dominios.ingest.ingest_whoare_batch', side_effect=Exception('DB down')):
+            # without --loop it stops, the next run will try again
+            call_command('drain_whoare_inbox', stdout=out)
+            item.refresh_from_db()
+            self.assertEqual(item.attempts, 1)
+            self.assertEqual(item.status, WhoareInbox.STATUS_PENDING)
+
+            # --loop waits longer after each failure
+            with mock.patch('dominios.management.commands.drain_whoare_inbox.time.sleep') as sleep, \
+                    mock.patch('dominios.ingest.INBOX_MAX_ATTEMPTS', 10):
+                call_command('drain_whoare_inbox', '--loop', '--max-batches', '3', '--sleep-time', '1', stdout=out)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+        self.assertIn('Batch 1 failed: 1 items', out.getvalue())
+
+    def test_command(self):
+        self.queue(whoare_dict('fernet'))
+        self.queue(whoare_dict('cafe'))
+        out = StringIO()
+        call_command('drain_whoare_inbox', '--batch-size', '1', stdout=out)
+        self.assertIn('2 processed, 0 errors, 0 pending', out.getvalue())
+        self.assertEqual(WhoareInbox.objects.filter(status=WhoareInbox.STATUS_DONE).count(), 2)
@@ -0,0 +1,68 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from whoare.whoare import WhoAre
+from dominios.models import Dominio, STATUS_NO_DISPONIBLE
+from zonas.models import Zona
+
+
+class LeaseTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar')
+        for n in range(10):
+            Dominio.objects.create(
+                nombre=f'dom{n}', zona=cls.zona, estado=STATUS_NO_DISPONIBLE, priority_to_update=n * 1000
+            )
+        cls.user = User.objects.create_user('john', 'jhon@lala.com', 'john')
+        cls.regular_user_token = Token.objects.create(user=cls.user)
+        cls.admin_user = User.objects.create_user('admin', 'admin@lala.com', 'admin', is_staff=True, is_superuser=True)
+        cls.admin_user_token = Token.objects.create(user=cls.admin_user)
+
+    def test_lease_by_priority_without_duplicates(self):
+        first = list(Dominio.lease_for_update(limit=3, lease_seconds=60))
+        self.assertEqual([d.nombre for d in first], ['dom9', 'dom8', 'dom7'])
+        self.assertTrue(all(d.leased_until > timezone.now() for d in first))
+
+        second = list(Dominio.lease_for_update(limit=3, lease_seconds=60))
+        self.assertEqual([d.nombre for d in second], ['dom6', 'dom5', 'dom4'])
+
+    def test_expired_lease_is_available_again(self):
+        Dominio.lease_for_update(limit=2, lease_seconds=60)
+        Dominio.objects.filter(nombre='dom9').update(leased_until=timezone.now() - timedelta(seconds=1))
+        leased = list(Dominio.lease_for_update(limit=1, lease_seconds=60))
+        self.assertEqual([d.nombre for d in leased], ['dom9'])
+
+    def test_result_releases_the_lease(self):
+        Dominio.lease_for_update(limit=1, lease_seconds=60)
+        dominio = Dominio.objects.get(nombre='dom9')
+        self.assertIsNotNone(dominio.leased_until)
+
+        wa = WhoAre()
+        wa.from_dict({"domain": {"base_name": 'dom9', "zone": 'com.ar', "is_free": True}})
+        dominio.update_from_wa_object(wa, just_created=False)
+
+        dominio = Dominio.objects.get(nombre='dom9')
+        self.assertIsNone(dominio.leased_until)
+        self.assertIsNone(dominio.lease_token)
+
+    def test_api_lease(self):
+        ep = '/api/v1/dominios/next-priority/lease/'
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.regular_user_token.key)
+        resp = client.post(ep, {'limit': 2}, format='json')
+        self.assertEqual(resp.status_code, 403)
+
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.admin_user_token.key)
+        resp = client.post(ep, {'limit': 2}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()['results']
+        self.assertEqual([r['domain'] for r in results], ['dom9.com.ar', 'dom8.com.ar'])
+        self.assertIsNotNone(results[0]['leased_until'])
+
+        resp = client.post(ep, {'limit': 'many'}, format='json')
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,39 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from dominios.models import Dominio, STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE
+from zonas.models import Zona
+
+
+class ColumnarPriorityTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        zona = Zona.objects.create(nombre='com.ar')
+        now = timezone.now()
+        n = 0
+        for expire in [None, -400, -61, -45, -10, 0, 30, 50, 100, 400, 2000]:
+            for readed in [None, 2, 8, 40, 400]:
+                for estado in [STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE]:
+                    n += 1
+                    Dominio.objects.create(
+                        nombre=f'dom{n}', zona=zona, estado=estado,
+                        expire=None if expire is None else now - timedelta(days=expire, hours=1),
+                        data_readed=None if readed is None else now - timedelta(days=readed, hours=1),
+                        data_updated=now - timedelta(days=90),
+                    )
+
+    def get_priorities(self, engine):
+        self.past = timezone.now() - timedelta(days=1)
+        Dominio.objects.update(priority_to_update=0, next_update_priority=self.past)
+        call_command('update_priority', all=True, limit=0, sleep_time=0, chunk_size=7, engine=engine, stdout=StringIO())
+        return dict(Dominio.objects.values_list('nombre', 'priority_to_update'))
+
+    def test_same_results_as_python(self):
+        python = self.get_priorities('python')
+        columnar = self.get_priorities('columnar')
+        self.assertEqual(python, columnar)
+        self.assertTrue(any(p > 10_000_000 for p in columnar.values()))
+        self.assertFalse(Dominio.objects.filter(next_update_priority__lte=self.past).exists())
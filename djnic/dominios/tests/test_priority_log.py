@@ -0,0 +1,51 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from dominios.api.v1.views import NextPriorityDomainViewSet
+from dominios.models import Dominio, DominioPriorityLog, STATUS_NO_DISPONIBLE
+from zonas.models import Zona
+
+
+class PriorityLogTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar')
+        now = timezone.now()
+        for n in range(5):
+            Dominio.objects.create(
+                nombre=f'dom{n}', zona=cls.zona, estado=STATUS_NO_DISPONIBLE,
+                expire=now - timedelta(days=50), data_readed=now - timedelta(days=20),
+            )
+
+    @override_settings(PRIORITY_LOG_SAMPLE_RATE=1)
+    def test_calculate_priority_log(self):
+        dominio = Dominio.objects.get(nombre='dom0')
+        dominio.calculate_priority()
+        dominio.refresh_from_db()
+        self.assertIsNone(dominio.extras)
+
+        log = dominio.priority_logs.get()
+        self.assertEqual(log.source, DominioPriorityLog.SOURCE_CALC)
+        self.assertEqual(log.priority, dominio.priority_to_update)
+        self.assertEqual(log.expired_since, 50)
+        self.assertEqual(log.readed_since, 20)
+
+    @override_settings(PRIORITY_LOG_SAMPLE_RATE=1)
+    def test_columnar_and_picked_logs(self):
+        call_command('update_priority', all=True, limit=0, sleep_time=0, engine='columnar', stdout=StringIO())
+        self.assertEqual(DominioPriorityLog.objects.filter(source=DominioPriorityLog.SOURCE_CALC).count(), 5)
+
+        dominio = NextPriorityDomainViewSet().get_from_domain().get()
+        log = DominioPriorityLog.objects.get(source=DominioPriorityLog.SOURCE_PICKED)
+        self.assertEqual(log.dominio, dominio)
+        self.assertEqual(log.priority, dominio.priority_to_update)
+        self.assertIsNone(dominio.extras)
+
+    def test_not_sampled(self):
+        call_command('update_priority', all=True, limit=0, sleep_time=0, stdout=StringIO())
+        NextPriorityDomainViewSet().get_from_domain()
+        self.assertFalse(DominioPriorityLog.objects.exists())
+        self.assertFalse(Dominio.objects.filter(extras__isnull=False).exists())
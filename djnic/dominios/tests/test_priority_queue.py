@@ -0,0 +1,43 @@
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+from dominios.api.v1.views import NextPriorityDomainViewSet
+from dominios.models import Dominio, STATUS_NO_DISPONIBLE
+from zonas.models import Zona
+
+
+class PriorityQueueTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar')
+        for n in range(300):
+            Dominio.objects.create(
+                nombre=f'dom{n}', zona=cls.zona, estado=STATUS_NO_DISPONIBLE, priority_to_update=n
+            )
+
+    def test_top_priority_uses_the_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan check written for SQLite')
+        available = Q(leased_until__isnull=True) | Q(leased_until__lt=timezone.now())
+        query = Dominio.objects.filter(available).order_by('-priority_to_update')
+        plan = query.values_list('id', flat=True)[:200].explain()
+        self.assertIn('dominio_priority_desc_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_get_from_domain_from_top(self):
+        view = NextPriorityDomainViewSet()
+        for _ in range(5):
+            dominio = view.get_from_domain().get()
+            self.assertGreaterEqual(dominio.priority_to_update, 100)
+
+    def test_get_from_domain_skip_leased(self):
+        Dominio.objects.filter(priority_to_update__gt=0).update(
+            leased_until=timezone.now() + timezone.timedelta(minutes=5)
+        )
+        view = NextPriorityDomainViewSet()
+        self.assertEqual(view.get_from_domain().get().nombre, 'dom0')
+
+        Dominio.objects.update(leased_until=timezone.now() + timezone.timedelta(minutes=5))
+        self.assertEqual(view.get_from_domain().count(), 0)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from dominios.models import Dominio, STATUS_NO_DISPONIBLE
+from dominios.priority import ar, default, registry
+from zonas.models import GrupoZona, Zona, ZonaEnGrupo
+
+
+class PriorityRegistryTestCase(TestCase):
+
+    def test_rules_by_zone(self):
+        self.assertIs(registry.for_zone_name('ar'), ar.RULES)
+        self.assertIs(registry.for_zone_name('gob.ar'), ar.RULES)
+        self.assertIs(registry.for_zone_name('com.uy'), default.RULES)
+        # suffix means a full label
+        self.assertIs(registry.for_zone_name('star'), default.RULES)
+
+    def test_rules_by_group(self):
+        zona = Zona.objects.create(nombre='tur')
+        grupo = GrupoZona.objects.create(nombre='Argentina')
+        self.assertIs(registry.for_zona(zona), default.RULES)
+        ZonaEnGrupo.objects.create(grupo=grupo, zona=zona)
+        self.assertIs(registry.for_zona(zona), ar.RULES)
+        self.assertIs(registry.by_zona_id()[zona.id], ar.RULES)
+
+    @override_settings(ZONES_CACHE_SECONDS=300)
+    def test_group_rules_cached(self):
+        """ The groups of a non .ar zone are not queried on each calculation """
+        zona = Zona.objects.create(nombre='com.uy')
+        Dominio.objects.create(nombre='fernet', zona=zona)
+        dominio = Dominio.objects.select_related('zona').get(nombre='fernet')
+        self.assertIs(registry.for_zona(zona), default.RULES)
+        with self.assertNumQueries(0):
+            self.assertIs(registry.for_zona(zona), default.RULES)
+            dominio.calculate_priority(save=False, log=False)
+
+        # new groups are seen
+        grupo = GrupoZona.objects.create(nombre='Argentina')
+        ZonaEnGrupo.objects.create(grupo=grupo, zona=zona)
+        self.assertIs(registry.for_zona(zona), ar.RULES)
+
+    def test_unknown_zones_dont_break_the_batch(self):
+        now = timezone.now()
+        for nombre in ['com.ar', 'com.uy']:
+            zona = Zona.objects.create(nombre=nombre)
+            Dominio.objects.create(
+                nombre='fernet', zona=zona, estado=STATUS_NO_DISPONIBLE,
+                expire=now - timedelta(days=50), data_readed=now - timedelta(days=20),
+            )
+
+        for engine in ['python', 'columnar', 'sql']:
+            Dominio.objects.update(priority_to_update=0)
+            call_command('update_priority', all=True, limit=0, sleep_time=0, engine=engine, stdout=StringIO())
+            priorities = dict(Dominio.objects.values_list('zona__nombre', 'priority_to_update'))
+            self.assertEqual(priorities['com.ar'], ar.get_priority(50, 20, 0, STATUS_NO_DISPONIBLE)[0])
+            self.assertEqual(priorities['com.uy'], default.RULES.get_priority(50, 20, 0, STATUS_NO_DISPONIBLE)[0])
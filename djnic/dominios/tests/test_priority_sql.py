@@ -0,0 +1,150 @@
+import random
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from dominios.models import Dominio, DominioPriorityLog, STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE
+from dominios.priority import ar, days_since, default
+from dominios.priority.bulk import values_update_sql
+from dominios.priority.sql import DaysSince, priority_expressions, update_priorities_sql
+from zonas.models import Zona
+
+
+def boundaries():
+    """ All the day values where the Argentina rules change """
+    expire = set()
+    for bucket in ar.REGISTERED_BUCKETS:
+        for edge in (bucket.expire_from, bucket.expire_to):
+            if edge is not None:
+                expire.update([edge - 1, edge, edge + 1])
+    readed = {ar.RECENT_READED_DAYS, ar.RECENT_READED_DAYS + 1}
+    for bucket in ar.REGISTERED_BUCKETS + [ar.FREE_BUCKET]:
+        if bucket.readed_limit is not None:
+            readed.update([bucket.readed_limit, bucket.readed_limit + 1])
+    return sorted(expire), sorted(readed)
+
+
+class SQLPriorityParityTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar')
+        cls.now = timezone.now().replace(microsecond=0)
+        rnd = random.Random(20)
+        expire_edges, readed_edges = boundaries()
+
+        def around(days):
+            # a few milliseconds around the day edge, both sides
+            return cls.now - timedelta(days=days, milliseconds=rnd.randint(-2000, 2000))
+
+        dominios = []
+        for n in range(600):
+            expire = around(rnd.choice(expire_edges)) if rnd.random() > 0.05 else None
+            readed = around(rnd.choice(readed_edges)) if rnd.random() > 0.05 else None
+            updated = around(rnd.randint(-5, 2000)) if rnd.random() > 0.05 else None
+            estado = rnd.choice([STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE, STATUS_NO_DISPONIBLE, None])
+            dominios.append(Dominio(
+                nombre=f'dom{n}', zona=cls.zona, estado=estado,
+                expire=expire, data_readed=readed, data_updated=updated,
+            ))
+        Dominio.objects.bulk_create(dominios)
+
+    def test_parity_with_python(self):
+        updated = update_priorities_sql(Dominio.objects.all(), now=self.now)
+        self.assertEqual(updated, 600)
+
+        for dominio in Dominio.objects.all():
+            priority, next_days = ar.get_priority(
+                days_since(self.now, dominio.expire),
+                days_since(self.now, dominio.data_readed),
+                days_since(self.now, dominio.data_updated),
+                dominio.estado,
+            )
+            self.assertEqual(dominio.priority_to_update, priority, dominio.nombre)
+            self.assertEqual(dominio.next_update_priority, self.now + timedelta(days=next_days), dominio.nombre)
+
+    def test_other_zones_use_default_rules(self):
+        zona = Zona.objects.create(nombre='com')
+        dominio = Dominio.objects.create(
+            nombre='other', zona=zona, estado=STATUS_NO_DISPONIBLE, data_readed=self.now - timedelta(days=40)
+        )
+        update_priorities_sql(Dominio.objects.filter(id=dominio.id), now=self.now)
+        priority, _ = default.RULES.get_priority(0, 40, 0, STATUS_NO_DISPONIBLE)
+        self.assertEqual(Dominio.objects.get(nombre='other').priority_to_update, priority)
+
+    def test_command_with_limit(self):
+        Dominio.objects.update(priority_to_update=0)
+        call_command('update_priority', all=True, limit=10, engine='sql', stdout=StringIO())
+        self.assertEqual(Dominio.objects.exclude(priority_to_update=0).count(), 10)
+
+    def test_slice_is_fixed_before_the_updates(self):
+        # the default rules (zone "com") update first and move its domains
+        # to the end of the order, the ar rules must not see a new slice
+        zona = Zona.objects.create(nombre='com')
+        Dominio.objects.update(next_update_priority=self.now - timedelta(days=10))
+        Dominio.objects.bulk_create([
+            Dominio(nombre=f'other{n}', zona=zona, next_update_priority=self.now - timedelta(days=20))
+            for n in range(10)
+        ])
+        dominios = Dominio.objects.order_by('next_update_priority', 'id')[:15]
+        self.assertEqual(update_priorities_sql(dominios, now=self.now), 15)
+        self.assertEqual(
+            Dominio.objects.filter(zona=self.zona, next_update_priority__gt=self.now - timedelta(days=10)).count(), 5
+        )
+
+    @override_settings(PRIORITY_LOG_SAMPLE_RATE=1)
+    def test_sampled_logs_and_transitions(self):
+        Dominio.objects.update(priority_transition_at=self.now)
+        update_priorities_sql(Dominio.objects.order_by('id')[:20], now=self.now)
+        self.assertEqual(Dominio.objects.filter(priority_transition_at__isnull=True).count(), 20)
+
+        logs = DominioPriorityLog.objects.select_related('dominio')
+        self.assertEqual(len(logs), 20)
+        for log in logs:
+            self.assertEqual(log.source, DominioPriorityLog.SOURCE_CALC)
+            self.assertEqual(log.priority, log.dominio.priority_to_update)
+            self.assertEqual(log.readed_since, days_since(self.now, log.dominio.data_readed))
+
+
+class PostgreSQLPrioritySQLTestCase(SimpleTestCase):
+    """ The tests run on SQLite, check the PostgreSQL SQL without a server.
+        The other tests here run it for real when the suite runs on PostgreSQL """
+
+    def setUp(self):
+        self.pg = DatabaseWrapper(
+            dict(connection.settings_dict, ENGINE='django.db.backends.postgresql', NAME='offline'),
+            alias='pg-offline'
+        )
+        self.now = timezone.now()
+
+    def compile(self, queryset):
+        return queryset.query.get_compiler(connection=self.pg).as_sql()
+
+    def test_days_since(self):
+        sql, params = self.compile(Dominio.objects.annotate(days=DaysSince('expire', self.now)).values('days'))
+        self.assertIn('TRUNC(EXTRACT(EPOCH FROM (%s - "dominios_dominio"."expire")) / 86400)::integer', sql)
+        self.assertEqual(params, (self.now, ))
+
+    def test_priority_update(self):
+        priority, next_update = priority_expressions(ar.RULES, self.now)
+        queryset = Dominio.objects.annotate(priority=priority, next_update=next_update).values('priority', 'next_update')
+        sql, params = self.compile(queryset)
+        self.assertEqual(sql.count('%s'), len(params))
+        self.assertNotIn('julianday', sql)
+
+    def test_values_update(self):
+        transition = self.now + timedelta(days=3)
+        sql, params = values_update_sql(
+            [1, 2], [10, 20], [self.now, self.now], [transition, None]
+        )
+        self.assertTrue(sql.startswith('UPDATE dominios_dominio AS d SET priority_to_update = v.priority'))
+        self.assertIn(
+            'FROM (VALUES (%s::integer, %s::integer, %s::timestamptz, %s::timestamptz), '
+            '(%s::integer, %s::integer, %s::timestamptz, %s::timestamptz)) '
+            'AS v(id, priority, next_update, transition) WHERE d.id = v.id',
+            sql
+        )
+        self.assertEqual(params, [1, 10, self.now, transition, 2, 20, self.now, None])
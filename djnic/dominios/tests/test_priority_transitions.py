@@ -0,0 +1,98 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from dominios.models import Dominio, STATUS_DISPONIBLE, STATUS_NO_DISPONIBLE
+from dominios.priority import TRANSITION_NEVER, days_since
+from dominios.priority.ar import find_bucket, transition_at
+from zonas.models import Zona
+
+
+class PriorityTransitionTestCase(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_expire_edges(self):
+        # expired 40 days ago, it will be in the next bucket at 46 days
+        expire = self.now - timedelta(days=40, hours=3)
+        readed = self.now - timedelta(days=20)
+        moment = transition_at(self.now, expire, readed, STATUS_NO_DISPONIBLE)
+        self.assertEqual(moment, expire + timedelta(days=46))
+        self.assertEqual(days_since(moment, expire), 46)
+
+        # will expire in 40 days, negative days are truncated toward zero
+        expire = self.now + timedelta(days=40)
+        moment = transition_at(self.now, expire, readed, STATUS_NO_DISPONIBLE)
+        self.assertEqual(days_since(moment, expire), -31)
+        self.assertEqual(days_since(moment - timedelta(microseconds=1), expire), -32)
+        self.assertNotEqual(
+            find_bucket(-31, STATUS_NO_DISPONIBLE), find_bucket(-32, STATUS_NO_DISPONIBLE)
+        )
+
+    def test_readed_edges(self):
+        expire = self.now - timedelta(days=2000)
+        readed = self.now - timedelta(days=1)
+        # first, leave the recently readed state
+        moment = transition_at(self.now, expire, readed, STATUS_NO_DISPONIBLE)
+        self.assertEqual(moment, readed + timedelta(days=4))
+        # then the readed limit for this bucket (300 days)
+        moment = transition_at(moment, expire, readed, STATUS_NO_DISPONIBLE)
+        self.assertEqual(moment, readed + timedelta(days=301))
+        self.assertEqual(transition_at(moment, expire, readed, STATUS_NO_DISPONIBLE), TRANSITION_NEVER)
+
+    def test_free_domains_just_leave_the_recent_state(self):
+        readed = self.now - timedelta(days=10)
+        self.assertEqual(transition_at(self.now, None, readed, STATUS_DISPONIBLE), TRANSITION_NEVER)
+
+
+class TransitionsSchedulerTestCase(TestCase):
+
+    def test_just_passed_transitions(self):
+        zona = Zona.objects.create(nombre='com.ar')
+        now = timezone.now()
+        for nombre in ['due', 'future', 'new']:
+            Dominio.objects.create(
+                nombre=nombre, zona=zona, estado=STATUS_NO_DISPONIBLE,
+                expire=now - timedelta(days=50), data_readed=now - timedelta(days=20),
+            )
+        Dominio.objects.filter(nombre='due').update(priority_transition_at=now - timedelta(hours=1))
+        Dominio.objects.filter(nombre='future').update(priority_transition_at=now + timedelta(days=1))
+
+        call_command('update_priority', transitions=True, sleep_time=0, stdout=StringIO())
+
+        priorities = dict(Dominio.objects.values_list('nombre', 'priority_to_update'))
+        self.assertGreater(priorities['due'], 0)
+        self.assertGreater(priorities['new'], 0)
+        self.assertEqual(priorities['future'], 0)
+        # the next transition is at 95 days since expire
+        dominio = Dominio.objects.get(nombre='due')
+        self.assertEqual(dominio.priority_transition_at, dominio.expire + timedelta(days=95))
+
+    def test_domains_without_transitions_are_picked_once(self):
+        zona = Zona.objects.create(nombre='com.ar')
+        now = timezone.now()
+        Dominio.objects.create(
+            nombre='libre', zona=zona, estado=STATUS_DISPONIBLE, data_readed=now - timedelta(days=10)
+        )
+        Dominio.objects.create(
+            nombre='viejo', zona=zona, estado=STATUS_NO_DISPONIBLE,
+            expire=now - timedelta(days=2000), data_readed=now - timedelta(days=400),
+        )
+
+        out = StringIO()
+        call_command('update_priority', transitions=True, engine='columnar', sleep_time=0, stdout=out)
+        self.assertIn('2 processed', out.getvalue())
+        self.assertEqual(
+            set(Dominio.objects.values_list('priority_transition_at', flat=True)), {TRANSITION_NEVER}
+        )
+
+        out = StringIO()
+        call_command('update_priority', transitions=True, sleep_time=0, stdout=out)
+        self.assertIn('0 processed', out.getvalue())
+
+    def test_sql_engine_does_not_calculate_transitions(self):
+        with self.assertRaises(CommandError):
+            call_command('update_priority', transitions=True, engine='sql', stdout=StringIO())
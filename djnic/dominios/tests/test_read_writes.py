@@ -0,0 +1,32 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from cambios.models import CampoCambio
+from dominios.models import Dominio
+from subscriptions.models import Event
+
+
+class ReadWritesTestCase(TestCase):
+
+    def test_changes_saved_in_bulk(self):
+        Dominio.add_from_whois('fernet.com.ar', mock_from_txt_file='djnic/whosamples/sample_fernet.txt')
+        Event.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as ctx:
+            res, error, cambios = Dominio.add_from_whois(
+                'fernet.com.ar', mock_from_txt_file='djnic/whosamples/sample_fernet_updated.txt'
+            )
+        self.assertEqual(len(cambios), 8)
+
+        inserts = {}
+        for query in ctx.captured_queries:
+            if query['sql'].startswith('INSERT INTO'):
+                table = query['sql'].split()[2]
+                inserts[table] = inserts.get(table, 0) + 1
+        self.assertEqual(inserts['"cambios_cambiosdominio"'], 1)
+        self.assertEqual(inserts['"cambios_campocambio"'], 1)
+        self.assertEqual(inserts['"subscriptions_event"'], 1)
+
+        dominio = Dominio.objects.get(nombre='fernet')
+        self.assertEqual(CampoCambio.objects.filter(cambio__dominio=dominio).count(), 8)
+        self.assertTrue(Event.objects.filter(object_id=dominio.id).exists())
@@ -0,0 +1,92 @@
+from datetime import datetime
+import json
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from cambios.models import CambiosDominio, CampoCambio
+from dominios.archive import KIND_WHOARE, compress
+from dominios.ingest import ingest_whoare_object, load_whoare_payload
+from dominios.models import Dominio, ReplayCheckpoint, WhoisArchive, whoare_fingerprint
+from dominios.tests.test_api_bulk import whoare_dict
+from zonas.models import Zona
+
+
+def aware(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class ReplayChangesTestCase(TestCase):
+
+    def setUp(self):
+        zona = Zona.objects.create(nombre='com.ar')
+        self.dominio = Dominio.objects.create(nombre='fernet', zona=zona)
+        self.archive(aware(2023, 1, 1), whoare_dict('fernet'))
+        self.archive(aware(2023, 2, 1), whoare_dict('fernet', expire='2031-03-19 09:11:29.00000 -0300'))
+        self.archive(aware(2023, 3, 1), whoare_dict('fernet', legal_uid='111', expire='2031-03-19 09:11:29.00000 -0300'))
+
+        # a wrong record for the february read
+        wrong = CambiosDominio.objects.create(dominio=self.dominio, momento=aware(2023, 2, 1))
+        CampoCambio.objects.create(cambio=wrong, campo='registrant_created', anterior='a', nuevo='b')
+        # a read without changes
+        self.unchanged = CambiosDominio.objects.create(dominio=self.dominio, momento=aware(2023, 2, 15), have_changes=False)
+
+    def archive(self, momento, payload):
+        wa = load_whoare_payload(payload)
+        WhoisArchive.objects.create(
+            dominio=self.dominio, momento=momento, kind=KIND_WHOARE,
+            fingerprint=whoare_fingerprint(wa), data=compress(json.dumps(payload))
+        )
+
+    def replay(self, *args):
+        out = StringIO()
+        call_command('replay_changes', '--workers', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def campos(self, momento):
+        cambio = self.dominio.cambios.get(momento=momento)
+        return sorted(campo.campo for campo in cambio.campos.all())
+
+    def test_replay(self):
+        out = self.replay('--since', '2023-01-15', '--until', '2023-04-01')
+        self.assertIn('1 domains, 2 changes rebuilt', out)
+
+        self.assertEqual(self.campos(aware(2023, 2, 1)), ['dominio_expire'])
+        self.assertEqual(self.campos(aware(2023, 3, 1)), ['registrant_legal_uid'])
+        # not archived reads are not touched
+        self.assertTrue(CambiosDominio.objects.filter(id=self.unchanged.id).exists())
+        self.assertEqual(self.dominio.cambios.count(), 3)
+
+        checkpoint = ReplayCheckpoint.objects.get(name='replay-2023-01-15-2023-04-01')
+        self.assertIsNotNone(checkpoint.finished)
+        self.assertEqual(checkpoint.last_dominio_id, self.dominio.id)
+
+    def test_period(self):
+        self.replay('--since', '2023-02-15', '--until', '2023-04-01')
+        # out of the period
+        self.assertEqual(self.campos(aware(2023, 2, 1)), ['registrant_created'])
+        self.assertEqual(self.campos(aware(2023, 3, 1)), ['registrant_legal_uid'])
+
+    def test_resume(self):
+        ReplayCheckpoint.objects.create(
+            name='fix', since=aware(2023, 1, 15), until=aware(2023, 4, 1), last_dominio_id=self.dominio.id
+        )
+        out = self.replay('--since', '2023-01-15', '--name', 'fix')
+        self.assertIn('Resuming fix', out)
+        self.assertIn('0 domains, 0 changes rebuilt', out)
+        self.assertEqual(self.campos(aware(2023, 2, 1)), ['registrant_created'])
+
+        out = self.replay('--since', '2023-01-15', '--name', 'fix', '--restart')
+        self.assertIn('1 domains, 2 changes rebuilt', out)
+
+
+class ReadMomentoTestCase(TestCase):
+
+    def test_same_momento(self):
+        """ the change records and the archive of a read share the momento """
+        zona = Zona.objects.create(nombre='com.ar')
+        dominio, _ = ingest_whoare_object(load_whoare_payload(whoare_dict('fernet')), zona=zona)
+        payload = whoare_dict('fernet', expire='2031-03-19 09:11:29.00000 -0300')
+        ingest_whoare_object(load_whoare_payload(payload), zona=zona, dominio=dominio)
+        archive = dominio.whois_archive.order_by('-momento').first()
+        self.assertTrue(dominio.cambios.filter(momento=archive.momento, have_changes=True).exists())
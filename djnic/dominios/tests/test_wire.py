@@ -0,0 +1,107 @@
+import gzip
+import json
+from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from dominios.ingest import load_whoare_payload
+from dominios.models import Dominio
+from dominios.tests.test_api_bulk import whoare_dict
+from dominios.wire import decode_body, decode_ndjson, encode_whoare_batch, WireFormatError
+from zonas.models import Zona
+
+
+class WireFormatTestCase(TestCase):
+
+    def test_roundtrip(self):
+        payloads = [whoare_dict('fernet'), whoare_dict('cafe')]
+        body, headers = encode_whoare_batch(payloads)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertLess(len(body), len(json.dumps(payloads)))
+        self.assertEqual(decode_ndjson(decode_body(body, headers['Content-Encoding'])), payloads)
+
+    def test_whoare_objects(self):
+        wa = load_whoare_payload(whoare_dict('fernet'))
+        body, headers = encode_whoare_batch([wa], compress=False)
+        payload = decode_ndjson(body)[0]
+        self.assertIn('whoare_version', payload)
+        self.assertEqual(payload['domain']['base_name'], 'fernet')
+
+    def test_bad_lines(self):
+        self.assertEqual(decode_ndjson(b'{"a": 1}\n\nnot json\n'), [{'a': 1}, 'not json'])
+
+    def test_decode_errors(self):
+        with self.assertRaises(WireFormatError):
+            decode_body(b'not gzip', 'gzip')
+        with self.assertRaises(WireFormatError):
+            decode_body(b'data', 'br')
+        with self.assertRaises(WireFormatError):
+            decode_body(gzip.compress(b'x' * 1000), 'gzip', max_size=100)
+
+
+class WireFormatAPITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_user('admin', 'admin@lala.com', 'admin', is_staff=True, is_superuser=True)
+        cls.admin_user_token = Token.objects.create(user=cls.admin_user)
+        cls.zona = Zona.objects.create(nombre='com.ar')
+
+    def setUp(self):
+        self.bulk_ep = '/api/v1/dominios/dominio/update_from_whoare_bulk/'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.admin_user_token.key)
+
+    def post(self, ep, body, headers):
+        extra = {}
+        if 'Content-Encoding' in headers:
+            extra['HTTP_CONTENT_ENCODING'] = headers['Content-Encoding']
+        return self.client.generic('POST', ep, body, content_type=headers['Content-Type'], **extra)
+
+    def test_gzip_ndjson(self):
+        body, headers = encode_whoare_batch([whoare_dict('fernet'), whoare_dict('cafe')])
+        resp = self.post(self.bulk_ep, body, headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['errors'], 0)
+        self.assertEqual(Dominio.objects.count(), 2)
+
+    def test_ndjson_bad_line(self):
+        body, headers = encode_whoare_batch([whoare_dict('fernet')], compress=False)
+        resp = self.post(self.bulk_ep, body + b'\n{bad', headers)
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['errors'], 1)
+
+    def test_gzip_json(self):
+        body = gzip.compress(json.dumps({'domains': [whoare_dict('fernet')]}).encode('utf-8'))
+        resp = self.post(self.bulk_ep, body, {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(Dominio.objects.filter(nombre='fernet').exists())
+
+        # the single endpoint too, with a dict (not a JSON string)
+        ep = '/api/v1/dominios/dominio/update_from_whoare/'
+        body = gzip.compress(json.dumps({'domain': whoare_dict('cafe')}).encode('utf-8'))
+        resp = self.post(ep, body, {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.json()['created'])
+
+    def test_bad_gzip(self):
+        resp = self.post(self.bulk_ep, b'not gzip', {'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 400)
+
+    @override_settings(WHOARE_WIRE_MAX_BYTES=100)
+    def test_too_large(self):
+        body, headers = encode_whoare_batch([whoare_dict('fernet')])
+        resp = self.post(self.bulk_ep, body, headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_payload_log(self):
+        body, headers = encode_whoare_batch([whoare_dict('fernet')])
+        with self.assertLogs('dominios.api.v1.views', level='INFO') as logs:
+            self.post(self.bulk_ep, body, headers)
+        self.assertFalse(any('fernet' in line for line in logs.output))
+        with self.settings(WHOARE_PAYLOAD_LOG_SAMPLE_RATE=1):
+            with self.assertLogs('dominios.api.v1.views', level='INFO') as logs:
+                self.post(self.bulk_ep, body, headers)
+        self.assertTrue(any('fernet' in line for line in logs.output))
@@ -0,0 +1,73 @@
+""" Compact wire format for whoare results: gzip compressed NDJSON
+    (one whoare dict per line).
+    Just the standard library here, crawler nodes can copy this file """
+import gzip
+import io
+import json
+
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+GZIP_LEVEL = 6
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+def encode_whoare_batch(payloads, compress=True):
+    """ Body and headers to POST a list of whoare dicts (or WhoAre objects)
+        to the update_from_whoare_bulk endpoint """
+    lines = []
+    for payload in payloads:
+        if hasattr(payload, 'as_dict'):
+            payload = payload.as_dict()
+            payload.setdefault('whoare_version', _whoare_version())
+        lines.append(json.dumps(payload, separators=(',', ':')))
+    body = '\n'.join(lines).encode('utf-8')
+
+    headers = {'Content-Type': NDJSON_CONTENT_TYPE}
+    if compress:
+        body = gzip.compress(body, GZIP_LEVEL)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+def decode_body(body, encoding=None, max_size=None):
+    """ Uncompress a request body (Content-Encoding) """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return body
+    if encoding != 'gzip':
+        raise WireFormatError(f'Unsupported Content-Encoding {encoding}')
+
+    try:
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+            # read one byte more than allowed to detect huge payloads
+            data = f.read(-1 if max_size is None else max_size + 1)
+    except (OSError, EOFError) as e:
+        raise WireFormatError(f'Bad gzip data: {e}')
+    if max_size is not None and len(data) > max_size:
+        raise WireFormatError(f'Uncompressed body larger than {max_size} bytes')
+    return data
+
+
+def decode_ndjson(data):
+    """ List of whoare dicts from NDJSON bytes.
+        Lines that are not valid JSON are returned as strings
+        (the ingestion reports the error for each one) """
+    payloads = []
+    for line in data.decode('utf-8').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            payloads.append(json.loads(line))
+        except ValueError:
+            payloads.append(line)
+    return payloads
+
+
+def _whoare_version():
+    from whoare import __version__
+    return __version__
+
@@ -1,8 +1,8 @@
-import pytz
 import uuid
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
+from core.tz import get_tz
 
 
 class Registrante(models.Model):
@@ -32,7 +32,7 @@ class Registrante(models.Model):
         else:
             raise Exception('Bad field date')
 
-        return timezone.localtime(timefield, pytz.timezone(zona))
+        return timezone.localtime(timefield, get_tz(zona))
 
     def __str__(self):
         return f'{self.name} [{self.zone}-{self.legal_uid}]'
@@ -0,0 +1,110 @@
+""" Resolve registrants from whois data with a process wide cache.
+    Big registrants own thousands of domains, only write them when
+    something really changed """
+from collections import OrderedDict
+import copy
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from registrantes.models import Registrante
+
+
+logger = logging.getLogger(__name__)
+
+# fields we get from whois
+WHOIS_FIELDS = ['name', 'created', 'changed']
+
+
+class RegistranteResolver:
+    """ LRU + TTL cache of Registrante objects by legal_uid.
+        Cached objects are shared between callers (and threads): read only """
+
+    def __init__(self, max_size=20000):
+        self.max_size = max_size
+        self.cache = OrderedDict()  # key -> (registrante, expires)
+        self.lock = threading.Lock()
+
+    def get_cached(self, key):
+        with self.lock:
+            item = self.cache.get(key)
+            if item is None:
+                return None
+            registrante, expires = item
+            if expires < time.monotonic():
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return registrante
+
+    def put(self, registrante):
+        ttl = settings.REGISTRANTES_CACHE_SECONDS
+        if ttl <= 0:
+            return
+        key = registrante.legal_uid
+        with self.lock:
+            self.cache[key] = (registrante, time.monotonic() + ttl)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+    def put_after_commit(self, registrante):
+        """ Written objects are cached just if the write is not rolled back """
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self.put(registrante))
+        else:
+            self.put(registrante)
+
+    def evict(self, key):
+        with self.lock:
+            self.cache.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def prefetch(self, legal_uids):
+        """ Load all the (not cached) registrants with one query """
+        missing = {uid for uid in legal_uids if self.get_cached(uid) is None}
+        if not missing:
+            return
+        registrantes = {}
+        for registrante in Registrante.objects.filter(legal_uid__in=missing):
+            # same legal_uid at many zones: leave it to resolve (get_or_create)
+            registrantes[registrante.legal_uid] = None if registrante.legal_uid in registrantes else registrante
+        for registrante in registrantes.values():
+            if registrante is not None:
+                self.put(registrante)
+
+    def resolve(self, legal_uid, name, created, changed):
+        """ Registrante object with this whois data, created if needed.
+            Returns (registrante, created) """
+        key = legal_uid
+        data = {'name': name, 'created': created, 'changed': changed}
+
+        registrante = self.get_cached(key)
+        if registrante is None:
+            registrante, was_created = Registrante.objects.get_or_create(legal_uid=legal_uid, defaults=data)
+            if was_created:
+                self.put_after_commit(registrante)
+                return registrante, True
+
+        dirty = [field for field in WHOIS_FIELDS if getattr(registrante, field) != data[field]]
+        if dirty:
+            # don't keep the old values if this write is rolled back
+            self.evict(key)
+            # don't change the object other callers could be using
+            registrante = copy.copy(registrante)
+            for field in dirty:
+                setattr(registrante, field, data[field])
+            registrante.save(update_fields=dirty + ['object_modified'])
+            logger.info(f' - Registrante {registrante} updated: {dirty}')
+            self.put_after_commit(registrante)
+        else:
+            self.put(registrante)
+
+        return registrante, False
+
+
+resolver = RegistranteResolver()
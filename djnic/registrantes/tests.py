@@ -1,3 +1,125 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from dominios.ingest import ingest_whoare_batch
+from dominios.tests.test_api_bulk import whoare_dict
+from registrantes.models import Registrante
+from registrantes.resolver import resolver
+from zonas.models import Zona
 
-# Create your tests here.
+
+ART = dt_timezone(timedelta(hours=-3))
+
+
+@override_settings(REGISTRANTES_CACHE_SECONDS=300)
+class RegistranteResolverTest(TestCase):
+
+    def setUp(self):
+        resolver.clear()
+        self.addCleanup(resolver.clear)
+        self.created = timezone.make_aware(datetime(2015, 3, 1, 10, 0))
+        self.changed = timezone.make_aware(datetime(2020, 6, 1, 10, 0))
+
+    def resolve(self, name='Juan Perez', changed=None):
+        # written objects are cached after the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return resolver.resolve('20111111111', name, self.created, changed or self.changed)
+
+    def test_create(self):
+        registrante, created = self.resolve()
+        self.assertTrue(created)
+        registrante.refresh_from_db()
+        self.assertEqual(registrante.name, 'Juan Perez')
+        self.assertEqual(registrante.zone, 'AR')
+        self.assertEqual(registrante.changed, self.changed)
+
+    def test_unchanged_is_not_written(self):
+        registrante, _ = self.resolve()
+        with self.assertNumQueries(0):
+            cached, created = self.resolve()
+        self.assertFalse(created)
+        self.assertIs(cached, registrante)
+
+    def test_unchanged_not_cached(self):
+        self.resolve()
+        resolver.clear()
+        # just the SELECT
+        with self.assertNumQueries(1):
+            self.resolve()
+
+    def test_only_dirty_fields_written(self):
+        self.resolve()
+        changed = timezone.make_aware(datetime(2021, 1, 1, 10, 0))
+        with CaptureQueriesContext(connection) as ctx:
+            registrante, created = self.resolve(changed=changed)
+        self.assertFalse(created)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        self.assertIn('"changed"', sql)
+        self.assertNotIn('"name"', sql)
+
+        registrante.refresh_from_db()
+        self.assertEqual(registrante.changed, changed)
+
+    def test_prefetch(self):
+        for n in range(5):
+            Registrante.objects.create(legal_uid=f'uid-{n}', name=f'Name {n}')
+        with self.assertNumQueries(1):
+            resolver.prefetch([f'uid-{n}' for n in range(5)])
+        with self.assertNumQueries(0):
+            resolver.prefetch([f'uid-{n}' for n in range(5)])
+            registrante, created = resolver.resolve('uid-3', 'Name 3', None, None)
+        self.assertFalse(created)
+        self.assertEqual(registrante.name, 'Name 3')
+
+    def test_cached_objects_are_not_changed(self):
+        registrante, _ = self.resolve()
+        updated, _ = self.resolve(name='Juan Perez SA')
+        self.assertIsNot(updated, registrante)
+        self.assertEqual(registrante.name, 'Juan Perez')
+        self.assertEqual(resolver.get_cached('20111111111').name, 'Juan Perez SA')
+
+    def test_other_zones_not_duplicated(self):
+        Registrante.objects.create(legal_uid='20111111111', zone='UY', name='Juan Perez')
+        registrante, created = self.resolve()
+        self.assertFalse(created)
+        self.assertEqual(registrante.zone, 'UY')
+        self.assertEqual(Registrante.objects.filter(legal_uid='20111111111').count(), 1)
+
+    def test_one_query_per_batch(self):
+        Zona.objects.create(nombre='com.ar')
+        for n in range(3):
+            Registrante.objects.create(
+                legal_uid=f'uid-{n}', name='jhon perez',
+                # same data from whoare_dict
+                created=datetime(2020, 3, 19, 9, 11, 28, tzinfo=ART),
+                changed=datetime(2020, 3, 19, 9, 11, 27, tzinfo=ART),
+            )
+        payloads = [whoare_dict(f'dom{n}', legal_uid=f'uid-{n % 3}') for n in range(12)]
+        with CaptureQueriesContext(connection) as ctx:
+            results = ingest_whoare_batch(payloads)
+        self.assertTrue(all(result['ok'] for result in results))
+        selects = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "registrantes_registrante"' in q['sql']
+        ]
+        self.assertEqual(len(selects), 1)
+        self.assertFalse(any(
+            q['sql'].startswith('UPDATE "registrantes_registrante"') for q in ctx.captured_queries
+        ))
+
+    def test_rolled_back_write_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            resolver.resolve('20111111111', 'Juan Perez', self.created, self.changed)
+        self.assertIsNone(resolver.get_cached('20111111111'))
+
+    def test_disabled_cache(self):
+        self.resolve()
+        with self.settings(REGISTRANTES_CACHE_SECONDS=0):
+            resolver.clear()
+            self.resolve()
+            with self.assertNumQueries(1):
+                self.resolve()
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class SubscriptionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'subscriptions'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from subscriptions.interest import interest
+        from subscriptions.models import SubscriptionTarget, UserSubscription
+
+        def invalidate_interest(sender, **kwargs):
+            interest.invalidate()
+
+        for model in [UserSubscription, SubscriptionTarget]:
+            name = model.__name__.lower()
+            post_save.connect(invalidate_interest, sender=model, dispatch_uid=f'invalidate_interest_save_{name}')
+            post_delete.connect(invalidate_interest, sender=model, dispatch_uid=f'invalidate_interest_delete_{name}')
@@ -0,0 +1,164 @@
+"""
+Daily and weekly digests.
+
+The subscriptions with delivery_mode 'daily' or 'weekly' don't get single
+notifications (see fanout.match_events). Once a period is over, all its
+events are loaded with one query (joined to the digest subscriptions) and
+grouped per user in one 'digest' UserNotification.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+import logging
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from subscriptions.models import (
+    Event, EVENT_TYPE_CHOICES, SubscriptionTarget, UserNotification, UserSubscription
+)
+
+
+logger = logging.getLogger(__name__)
+
+# days in each period
+PERIODS = {
+    'daily': 1,
+    'weekly': 7,
+}
+PERIOD_NAMES = {
+    'daily': 'diario',
+    'weekly': 'semanal',
+}
+# event descriptions listed at a digest, the rest are just counted
+DIGEST_MAX_LINES = 30
+
+
+def period_range(period, day):
+    """ (since, until) local datetimes of the period including the day.
+        Weekly periods start on monday """
+    if period == 'weekly':
+        day = day - timedelta(days=day.weekday())
+    tz = timezone.get_current_timezone()
+    since = timezone.make_aware(datetime.combine(day, time.min), tz)
+    until = timezone.make_aware(datetime.combine(day + timedelta(days=PERIODS[period]), time.min), tz)
+    return since, until
+
+
+def last_period(period, today=None):
+    """ (since, until) of the last complete period """
+    today = today or timezone.localdate()
+    return period_range(period, today - timedelta(days=PERIODS[period]))
+
+
+def collect_digests(period, since, until):
+    """
+    Events of the period for each user with a subscription in this
+    delivery mode: {user_id: (user, [events], {subscription ids})}.
+    """
+    subscriptions = UserSubscription.objects.filter(
+        delivery_mode=period, is_active=True
+    ).select_related('user', 'target')
+    by_target = defaultdict(list)
+    for subscription in subscriptions:
+        target = subscription.target
+        by_target[(target.content_type_id, target.object_id)].append(subscription)
+    if not by_target:
+        return {}
+
+    # one query for all the events, the targets as subqueries per content type
+    query = Q()
+    for content_type_id in {content_type_id for content_type_id, _ in by_target}:
+        targets = SubscriptionTarget.objects.filter(
+            content_type_id=content_type_id,
+            subscriptions__delivery_mode=period,
+            subscriptions__is_active=True,
+        ).values('object_id')
+        query |= Q(content_type_id=content_type_id, object_id__in=targets)
+    events = Event.objects.filter(
+        query, created_at__gte=since, created_at__lt=until
+    ).order_by('created_at', 'id')
+
+    digests = {}
+    for event in events:
+        for subscription in by_target.get((event.content_type_id, event.object_id), []):
+            if event.event_type not in subscription.event_types:
+                continue
+            user, user_events, subscription_ids = digests.setdefault(
+                subscription.user_id, (subscription.user, [], set())
+            )
+            user_events.append(event)
+            subscription_ids.add(subscription.id)
+    return digests
+
+
+def build_digest(user, period, since, until, events):
+    """
+    Unsaved digest UserNotification for a user.
+    """
+    counts = Counter(event.event_type for event in events)
+    labels = dict(EVENT_TYPE_CHOICES)
+    # same order than the event types
+    summary = ', '.join(
+        f'{label}: {counts[event_type]}'
+        for event_type, label in EVENT_TYPE_CHOICES if counts[event_type]
+    )
+
+    lines = [
+        (event.event_data or {}).get('description') or labels.get(event.event_type, event.event_type)
+        for event in events[:DIGEST_MAX_LINES]
+    ]
+    if len(events) > DIGEST_MAX_LINES:
+        lines.append(f'... y {len(events) - DIGEST_MAX_LINES} novedades más')
+
+    return UserNotification(
+        user=user,
+        notification_type='digest',
+        title=f'Resumen {PERIOD_NAMES[period]}: {len(events)} novedades',
+        summary=summary,
+        event_data={
+            'period': period,
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'counts': dict(counts),
+            'description': '\n'.join(lines),
+        },
+        grouped_events=[event.id for event in events],
+        event_date=timezone.localtime(since).date(),
+        is_read=False,
+    )
+
+
+def build_digests(period, since, until, dry_run=False, now=None):
+    """
+    Create the digests of a period. Users that already have the digest
+    for this period are skipped, so it is safe to run again.
+    Returns the list of digests (saved unless dry_run).
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        digests = collect_digests(period, since, until)
+        done = set(UserNotification.objects.filter(
+            notification_type='digest',
+            event_date=timezone.localtime(since).date(),
+            event_data__period=period,
+            user_id__in=list(digests),
+        ).order_by().values_list('user_id', flat=True))
+
+        notifications = []
+        subscription_ids = set()
+        for user_id, (user, events, user_subscription_ids) in digests.items():
+            if user_id in done:
+                logger.info(f'{period} digest for {user.username} since {since} already created')
+                continue
+            notifications.append(build_digest(user, period, since, until, events))
+            subscription_ids |= user_subscription_ids
+
+        if dry_run or not notifications:
+            return notifications
+
+        UserNotification.objects.bulk_create(notifications)
+        UserSubscription.objects.filter(id__in=subscription_ids).update(last_notified_at=now)
+        SubscriptionTarget.objects.filter(subscriptions__id__in=subscription_ids).update(last_event_at=now)
+
+    logger.info(f'{len(notifications)} {period} digests created since {since}')
+    return notifications
@@ -12,7 +12,9 @@ Events are created for:
 2. The registrant(s) involved (so subscribers to registrants get notified)
 """
 import logging
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from subscriptions.interest import interest
 from subscriptions.models import (
     Event, EVENT_DROPPED, EVENT_REGISTERED, EVENT_RENEWED,
     EVENT_REGISTRANT_CHANGED, EVENT_DNS_CHANGED
@@ -22,22 +24,32 @@ from subscriptions.models import (
 logger = logging.getLogger(__name__)
 
 
-def register_events(dominio, cambios):
+def register_events(dominio, cambios, registrantes=None, current_registrante=None, save=True):
     """
     Main entry point to register all events from domain changes.
     Creates events for both the domain and related registrants.
+
+    registrantes: (old, new) Registrante objects if the caller already has them
+    current_registrante: defaults to dominio.registrante
+    save: False to get the unsaved Event objects (the caller saves them in bulk)
     """
     if not cambios:
         return []
 
-    old_registrante, new_registrante = get_related_registrantes_from_cambios(cambios)
+    if registrantes is None:
+        old_registrante, new_registrante = get_related_registrantes_from_cambios(cambios)
+    else:
+        old_registrante, new_registrante = registrantes
+    if current_registrante is None:
+        current_registrante = dominio.registrante
 
     # Create events for the domain
     domain_events = create_domain_events(
         dominio=dominio,
         cambios=cambios,
         old_registrante=old_registrante,
-        new_registrante=new_registrante
+        new_registrante=new_registrante,
+        save=False
     )
 
     # Create events for registrants
@@ -46,13 +58,34 @@ def register_events(dominio, cambios):
         cambios=cambios,
         old_registrante=old_registrante,
         new_registrante=new_registrante,
-        current_registrante=dominio.registrante
+        current_registrante=current_registrante,
+        save=False
     )
 
-    return domain_events + registrant_events
+    events = filter_unwatched(domain_events + registrant_events)
+    if save and events:
+        Event.objects.bulk_create(events)
+    return events
+
+
+def filter_unwatched(events):
+    """
+    Deal with the events nobody follows (settings.UNWATCHED_EVENTS):
+    'keep' them, save them already 'processed' or 'skip' them.
+    """
+    mode = settings.UNWATCHED_EVENTS
+    if mode == 'keep' or not events:
+        return events
+
+    watched, unwatched = interest.split(events)
+    if mode == 'skip':
+        return watched
+    for event in unwatched:
+        event.processed = True
+    return events
 
 
-def create_domain_events(dominio, cambios, old_registrante=None, new_registrante=None):
+def create_domain_events(dominio, cambios, old_registrante=None, new_registrante=None, save=True):
     """
     Create Event records for the domain itself.
     """
@@ -110,7 +143,7 @@ def create_domain_events(dominio, cambios, old_registrante=None, new_registrante
                 event_data['description'] = f'El dominio {dominio.full_domain()} cambió sus DNS'
 
         if event_type and event_type not in created_types:
-            event = Event.objects.create(
+            event = Event(
                 event_type=event_type,
                 content_type=ct_dominio,
                 object_id=dominio.id,
@@ -120,10 +153,12 @@ def create_domain_events(dominio, cambios, old_registrante=None, new_registrante
             created_types.add(event_type)
             logger.info(f'Created domain event {event_type} for {dominio.full_domain()}')
 
+    if save and created_events:
+        Event.objects.bulk_create(created_events)
     return created_events
 
 
-def create_registrant_events(dominio, cambios, old_registrante, new_registrante, current_registrante):
+def create_registrant_events(dominio, cambios, old_registrante, new_registrante, current_registrante, save=True):
     """
     Create Event records for registrants involved in domain changes.
 
@@ -248,6 +283,8 @@ def create_registrant_events(dominio, cambios, old_registrante, new_registrante,
                     }
                 )
 
+    if save and created_events:
+        Event.objects.bulk_create(created_events)
     return created_events
 
 
@@ -256,13 +293,13 @@ def _create_registrant_event(
         registrante, event_type, event_data
 ):
     """
-    Helper to create a registrant event, avoiding duplicates.
+    Helper to create a (not saved yet) registrant event, avoiding duplicates.
     """
     if registrante.id not in created_for_registrant:
         created_for_registrant[registrante.id] = set()
 
     if event_type not in created_for_registrant[registrante.id]:
-        event = Event.objects.create(
+        event = Event(
             event_type=event_type,
             content_type=ct_registrante,
             object_id=registrante.id,
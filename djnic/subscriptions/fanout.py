@@ -0,0 +1,132 @@
+"""
+Set-based fan-out of Events to UserNotifications.
+
+For a chunk of events, all the subscription targets and subscriptions are
+loaded with two queries and matched in memory. Notifications are saved with
+bulk_create and the processed / last_* fields with a few bulk UPDATEs.
+"""
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from subscriptions.models import (
+    Event, SubscriptionTarget, UserSubscription, UserNotification
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def build_notification(event, subscription):
+    """
+    Build notification data from an event.
+    """
+    event_data = event.event_data or {}
+
+    # Build title from event data
+    title = event_data.get('description', f'{event.get_event_type_display()}')
+
+    # Truncate title if too long
+    if len(title) > 200:
+        title = title[:197] + '...'
+
+    return {
+        'user': subscription.user,
+        'event': event,
+        'notification_type': 'single',
+        'title': title,
+        'summary': '',
+        'event_data': event_data,
+        'event_date': event.created_at.date(),
+        'is_read': False,
+    }
+
+
+def match_events(events):
+    """
+    List of (event, target, subscription) for the active 'immediate'
+    subscriptions including the event type (daily and weekly ones get
+    a digest, see subscriptions.digest). Two queries for all the events.
+    """
+    object_ids = defaultdict(set)
+    for event in events:
+        object_ids[event.content_type_id].add(event.object_id)
+    if not object_ids:
+        return []
+
+    query = Q()
+    for content_type_id, ids in object_ids.items():
+        query |= Q(content_type_id=content_type_id, object_id__in=ids)
+    targets = {
+        (target.content_type_id, target.object_id): target
+        for target in SubscriptionTarget.objects.filter(query)
+    }
+    if not targets:
+        return []
+
+    subscriptions = defaultdict(list)
+    active = UserSubscription.objects.filter(
+        target_id__in=[target.id for target in targets.values()],
+        is_active=True,
+        delivery_mode='immediate'
+    ).select_related('user').order_by('id')
+    for subscription in active:
+        subscriptions[subscription.target_id].append(subscription)
+
+    matches = []
+    for event in events:
+        target = targets.get((event.content_type_id, event.object_id))
+        if target is None:
+            continue
+        for subscription in subscriptions[target.id]:
+            if event.event_type in subscription.event_types:
+                matches.append((event, target, subscription))
+    return matches
+
+
+def fan_out_events(events, now=None):
+    """
+    Create the notifications for a chunk of events and mark them processed,
+    all in one transaction.
+    Returns the number of notifications created.
+    """
+    now = now or timezone.now()
+    matches = match_events(events)
+    notifications = [
+        UserNotification(**build_notification(event, subscription))
+        for event, _, subscription in matches
+    ]
+
+    with transaction.atomic():
+        UserNotification.objects.bulk_create(notifications)
+        if matches:
+            UserSubscription.objects.filter(
+                id__in={subscription.id for _, _, subscription in matches}
+            ).update(last_notified_at=now)
+            SubscriptionTarget.objects.filter(
+                id__in={target.id for _, target, _ in matches}
+            ).update(last_event_at=now)
+        Event.objects.filter(id__in=[event.id for event in events]).update(processed=True)
+
+    logger.info(f'{len(events)} events processed, {len(notifications)} notifications created')
+    return len(notifications)
+
+
+def process_pending_events(limit=1000, batch_size=500):
+    """
+    Fan out the oldest unprocessed events in chunks. A failed chunk is
+    logged and left unprocessed (retried next time).
+    Returns the number of events processed and notifications created.
+    """
+    events = list(Event.objects.filter(processed=False).order_by('created_at')[:limit])
+    events_processed = notifications_created = 0
+    for n in range(0, len(events), batch_size):
+        chunk = events[n:n + batch_size]
+        try:
+            notifications_created += fan_out_events(chunk)
+            events_processed += len(chunk)
+        except Exception:
+            logger.exception(f'Error processing events {chunk[0].id} to {chunk[-1].id}')
+    return events_processed, notifications_created
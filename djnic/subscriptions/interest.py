@@ -0,0 +1,70 @@
+"""
+In-process index of what users follow: (content_type_id, object_id) -> event types.
+
+Used by register_events to skip (or mark as processed) the events nobody
+will be notified about. It is invalidated by the UserSubscription and
+SubscriptionTarget signals (see SubscriptionsConfig.ready) and reloaded
+after SUBSCRIPTIONS_INTEREST_CACHE_SECONDS to see changes from other processes.
+"""
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+
+
+class InterestIndex:
+
+    def __init__(self):
+        self._index = None
+        self._loaded = 0
+        self.lock = threading.Lock()
+
+    def _get_index(self):
+        index = self._index
+        if index is None or time.monotonic() - self._loaded >= settings.SUBSCRIPTIONS_INTEREST_CACHE_SECONDS:
+            index = self.load()
+        return index
+
+    def load(self):
+        from subscriptions.models import UserSubscription
+
+        index = {}
+        rows = UserSubscription.objects.filter(is_active=True).values_list(
+            'target__content_type_id', 'target__object_id', 'event_types'
+        )
+        for content_type_id, object_id, event_types in rows:
+            index.setdefault((content_type_id, object_id), set()).update(event_types or [])
+        with self.lock:
+            self._index = index
+            self._loaded = time.monotonic()
+        return index
+
+    def invalidate(self):
+        with self.lock:
+            self._index = None
+        if connection.in_atomic_block:
+            # other requests could reload the old data before the commit
+            transaction.on_commit(self._clear)
+
+    def _clear(self):
+        with self.lock:
+            self._index = None
+
+    def is_watched(self, content_type_id, object_id, event_type):
+        event_types = self._get_index().get((content_type_id, object_id))
+        return event_types is not None and event_type in event_types
+
+    def split(self, events):
+        """ (watched, unwatched) lists of events """
+        index = self._get_index()
+        watched, unwatched = [], []
+        for event in events:
+            event_types = index.get((event.content_type_id, event.object_id))
+            if event_types is not None and event.event_type in event_types:
+                watched.append(event)
+            else:
+                unwatched.append(event)
+        return watched, unwatched
+
+
+interest = InterestIndex()
@@ -0,0 +1,73 @@
+"""
+Management command to create the daily / weekly digest notifications.
+
+For each user with 'daily' (or 'weekly') subscriptions, all the events of
+the period for the followed objects are grouped in one UserNotification
+(notification_type='digest'). Running it again for the same period does
+not duplicate the digests.
+
+Run via cron after the period ends, e.g.:
+    30 0 * * * cd /path/to/project && python manage.py build_digests --period daily
+    45 0 * * 1 cd /path/to/project && python manage.py build_digests --period weekly
+"""
+from datetime import datetime
+import logging
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from subscriptions.digest import PERIODS, build_digests, last_period, period_range
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Create the daily or weekly digest notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period',
+            type=str,
+            choices=list(PERIODS),
+            default='daily',
+            help='Digest period (default: daily)'
+        )
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=None,
+            help='YYYY-MM-DD, a day in the period (default: the last complete period)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be done without making changes'
+        )
+
+    def handle(self, *args, **options):
+        period = options['period']
+        dry_run = options['dry_run']
+
+        if options['date']:
+            day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            since, until = period_range(period, day)
+        else:
+            since, until = last_period(period)
+
+        if until > timezone.now():
+            # later events would be lost, the digest is created just once
+            self.stdout.write(self.style.ERROR(f'The {period} period since {since} is not over yet'))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
+
+        self.stdout.write(f'Building {period} digests from {since} to {until}...')
+        notifications = build_digests(period, since, until, dry_run=dry_run)
+        for notification in notifications:
+            verb = 'Would send' if dry_run else 'Created'
+            self.stdout.write(
+                f'  {verb} digest to {notification.user.username}: {notification.title}'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'{len(notifications)} digests'))
@@ -8,12 +8,22 @@ This command:
 4. Creates UserNotification for each matching subscription
 5. Marks the Event as processed
 
+Only 'immediate' subscriptions get single notifications, the daily and
+weekly ones are grouped by the build_digests command.
+
+Events are processed in chunks (--batch-size): targets and subscriptions
+for the whole chunk are loaded with two queries (see subscriptions.fanout).
+--one-by-one processes each event on its own.
+
 Run via cron, e.g.: */5 * * * * cd /path/to/project && python manage.py process_events
+or keep the notifications_worker command running (both can't run at the same time).
 """
 import logging
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
+from core.locks import InstanceLock, LockHeld
+from subscriptions.fanout import build_notification, fan_out_events, match_events
 from subscriptions.models import (
     Event, SubscriptionTarget, UserSubscription, UserNotification
 )
@@ -37,17 +47,38 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be done without making changes'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Events processed together (default: 500)'
+        )
+        parser.add_argument(
+            '--one-by-one',
+            action='store_true',
+            help='Process each event on its own (slow)'
+        )
 
     def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
+            self.process(**options)
+            return
+
+        try:
+            # the notifications worker (or another run) could be processing the same events
+            with InstanceLock('process_events'):
+                self.process(**options)
+        except LockHeld as e:
+            self.stdout.write(self.style.WARNING(str(e)))
+
+    def process(self, **options):
         limit = options['limit']
         dry_run = options['dry_run']
 
-        if dry_run:
-            self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
-
         # Get unprocessed events, oldest first
-        events = Event.objects.filter(processed=False).order_by('created_at')[:limit]
-        event_count = events.count()
+        events = list(Event.objects.filter(processed=False).order_by('created_at')[:limit])
+        event_count = len(events)
 
         if event_count == 0:
             self.stdout.write('No unprocessed events found')
@@ -55,6 +86,57 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Processing {event_count} events...')
 
+        if options['one_by_one']:
+            events_processed, notifications_created = self.process_one_by_one(events, dry_run)
+        else:
+            events_processed, notifications_created = self.process_in_batches(
+                events, options['batch_size'], dry_run
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Processed {events_processed} events, '
+                f'created {notifications_created} notifications'
+            )
+        )
+
+    def process_in_batches(self, events, batch_size, dry_run=False):
+        """
+        Process the events in chunks with set-based queries.
+        Returns the number of events processed and notifications created.
+        """
+        events_processed = 0
+        notifications_created = 0
+
+        for n in range(0, len(events), batch_size):
+            chunk = events[n:n + batch_size]
+            if dry_run:
+                for event, target, subscription in match_events(chunk):
+                    self.stdout.write(
+                        f'  Would notify {subscription.user.username} '
+                        f'about {event.event_type} on {target}'
+                    )
+                    notifications_created += 1
+                events_processed += len(chunk)
+                continue
+
+            try:
+                notifications_created += fan_out_events(chunk)
+                events_processed += len(chunk)
+            except Exception as e:
+                # nothing saved for this chunk, it will be retried next time
+                logger.exception(f'Error processing events {chunk[0].id} to {chunk[-1].id}')
+                self.stdout.write(
+                    self.style.ERROR(f'Error processing {len(chunk)} events: {e}')
+                )
+
+        return events_processed, notifications_created
+
+    def process_one_by_one(self, events, dry_run=False):
+        """
+        Process each event on its own.
+        Returns the number of events processed and notifications created.
+        """
         notifications_created = 0
         events_processed = 0
 
@@ -74,12 +156,7 @@ class Command(BaseCommand):
                     self.style.ERROR(f'Error processing event {event.id}: {e}')
                 )
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Processed {events_processed} events, '
-                f'created {notifications_created} notifications'
-            )
-        )
+        return events_processed, notifications_created
 
     def process_event(self, event, dry_run=False):
         """
@@ -99,10 +176,11 @@ class Command(BaseCommand):
             return 0
 
         # Find all active subscriptions for this target
-        # that include this event type
+        # that include this event type (daily and weekly go to the digests)
         subscriptions = UserSubscription.objects.filter(
             target=target,
-            is_active=True
+            is_active=True,
+            delivery_mode='immediate'
         )
 
         notifications_created = 0
@@ -145,22 +223,4 @@ class Command(BaseCommand):
         """
         Build notification data from an event.
         """
-        event_data = event.event_data or {}
-
-        # Build title from event data
-        title = event_data.get('description', f'{event.get_event_type_display()}')
-
-        # Truncate title if too long
-        if len(title) > 200:
-            title = title[:197] + '...'
-
-        return {
-            'user': subscription.user,
-            'event': event,
-            'notification_type': 'single',
-            'title': title,
-            'summary': '',
-            'event_data': event_data,
-            'event_date': event.created_at.date(),
-            'is_read': False,
-        }
+        return build_notification(event, subscription)
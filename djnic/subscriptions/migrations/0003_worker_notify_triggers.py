@@ -0,0 +1,51 @@
+from django.db import migrations
+
+
+# wake up the notifications worker (channels.worker) on new events and notifications
+# one NOTIFY per statement (bulk_create included), sent at commit
+CREATE_SQL = """
+CREATE OR REPLACE FUNCTION subscriptions_worker_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('djnic_worker', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS subscriptions_event_worker_notify ON subscriptions_event;
+CREATE TRIGGER subscriptions_event_worker_notify
+    AFTER INSERT ON subscriptions_event
+    FOR EACH STATEMENT EXECUTE PROCEDURE subscriptions_worker_notify();
+
+DROP TRIGGER IF EXISTS subscriptions_usernotification_worker_notify ON subscriptions_usernotification;
+CREATE TRIGGER subscriptions_usernotification_worker_notify
+    AFTER INSERT ON subscriptions_usernotification
+    FOR EACH STATEMENT EXECUTE PROCEDURE subscriptions_worker_notify();
+"""
+
+DROP_SQL = """
+DROP TRIGGER IF EXISTS subscriptions_event_worker_notify ON subscriptions_event;
+DROP TRIGGER IF EXISTS subscriptions_usernotification_worker_notify ON subscriptions_usernotification;
+DROP FUNCTION IF EXISTS subscriptions_worker_notify();
+"""
+
+
+def create_triggers(apps, schema_editor):
+    # other databases just poll
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0002_alter_event_event_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, reverse_code=drop_triggers),
+    ]
@@ -1,5 +1,7 @@
+from datetime import date, timedelta
 from io import StringIO
-from django.test import TestCase
+from unittest import mock
+from django.test import TestCase, override_settings
 from django.core.management import call_command
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
@@ -13,6 +15,8 @@ from subscriptions.models import (
     EVENT_DROPPED, EVENT_REGISTERED, EVENT_RENEWED,
     EVENT_REGISTRANT_CHANGED, EVENT_DNS_CHANGED
 )
+from subscriptions.digest import DIGEST_MAX_LINES, build_digests, last_period, period_range
+from subscriptions.interest import interest
 from subscriptions.events import (
     register_events,
     get_related_registrantes_from_cambios
@@ -895,3 +899,261 @@ class ProcessEventsCommandTestCase(TestCase):
 
         unprocessed_count = Event.objects.filter(processed=False).count()
         self.assertEqual(unprocessed_count, 3)
+
+
+class ProcessEventsBatchTestCase(TestCase):
+    """Tests for the set-based (batch) fan-out of process_events."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar', tz='America/Argentina/Buenos_Aires')
+        cls.ct = ContentType.objects.get_for_model(Dominio)
+        cls.users = [
+            User.objects.create_user(username=f'user{n}', email=f'user{n}@example.com', password='testpass123')
+            for n in range(3)
+        ]
+        cls.dominios = [
+            Dominio.objects.create(nombre=f'batch{n}', zona=cls.zona, estado=STATUS_NO_DISPONIBLE)
+            for n in range(10)
+        ]
+        # every user follows the first 5 domains (just drops for the last user)
+        for dominio in cls.dominios[:5]:
+            target = SubscriptionTarget.objects.create(content_type=cls.ct, object_id=dominio.id)
+            for user in cls.users:
+                event_types = [EVENT_DROPPED] if user == cls.users[-1] else [EVENT_DROPPED, EVENT_RENEWED]
+                UserSubscription.objects.create(user=user, target=target, event_types=event_types)
+
+    def create_events(self, event_type=EVENT_DROPPED):
+        return [
+            Event.objects.create(
+                event_type=event_type, content_type=self.ct, object_id=dominio.id,
+                event_data={'description': f'{dominio.nombre} {event_type}'}
+            )
+            for dominio in self.dominios
+        ]
+
+    def test_batch(self):
+        self.create_events(EVENT_DROPPED)
+        self.create_events(EVENT_RENEWED)
+        out = StringIO()
+        # events, targets, subscriptions, notifications, 3 UPDATEs (and the savepoints)
+        with self.assertNumQueries(9):
+            call_command('process_events', stdout=out)
+
+        self.assertIn('Processed 20 events, created 25 notifications', out.getvalue())
+        self.assertFalse(Event.objects.filter(processed=False).exists())
+        self.assertEqual(UserNotification.objects.filter(user=self.users[-1]).count(), 5)
+        self.assertEqual(UserNotification.objects.filter(user=self.users[0]).count(), 10)
+        self.assertFalse(UserSubscription.objects.filter(last_notified_at__isnull=True).exists())
+        self.assertEqual(SubscriptionTarget.objects.filter(last_event_at__isnull=False).count(), 5)
+
+    def test_same_result_one_by_one(self):
+        self.create_events(EVENT_DROPPED)
+        call_command('process_events', '--batch-size=3', stdout=StringIO())
+        batch = sorted(UserNotification.objects.values_list('user_id', 'event_id', 'title'))
+
+        UserNotification.objects.all().delete()
+        Event.objects.update(processed=False)
+        call_command('process_events', '--one-by-one', stdout=StringIO())
+        one_by_one = sorted(UserNotification.objects.values_list('user_id', 'event_id', 'title'))
+        self.assertEqual(batch, one_by_one)
+
+    def test_failed_chunk_not_processed(self):
+        self.create_events(EVENT_DROPPED)
+        out = StringIO()
+        with mock.patch('subscriptions.fanout.UserNotification.objects.bulk_create', side_effect=Exception('DB down')):
+            call_command('process_events', stdout=out)
+        self.assertIn('Error processing 10 events', out.getvalue())
+        self.assertEqual(Event.objects.filter(processed=False).count(), 10)
+
+
+class InterestIndexTestCase(TestCase):
+    """Tests for the index of followed objects and the unwatched events."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar', tz='America/Argentina/Buenos_Aires')
+        cls.user = User.objects.create_user(username='follower', email='f@example.com', password='testpass123')
+        cls.ct = ContentType.objects.get_for_model(Dominio)
+
+    def setUp(self):
+        interest.invalidate()
+        self.addCleanup(interest.invalidate)
+        self.watched = Dominio.objects.create(nombre='watched', zona=self.zona, estado=STATUS_NO_DISPONIBLE)
+        self.unwatched = Dominio.objects.create(nombre='unwatched', zona=self.zona, estado=STATUS_NO_DISPONIBLE)
+        target = SubscriptionTarget.objects.create(content_type=self.ct, object_id=self.watched.id)
+        self.subscription = UserSubscription.objects.create(user=self.user, target=target, event_types=[EVENT_DROPPED])
+        self.cambios = [
+            {"campo": "estado", "anterior": "no disponible", "nuevo": "disponible"},
+            {"campo": "DNS1", "anterior": "ns1.a.com", "nuevo": "ns1.b.com"},
+        ]
+
+    def processed(self, dominio):
+        events = Event.objects.filter(content_type=self.ct, object_id=dominio.id)
+        return dict(events.values_list('event_type', 'processed'))
+
+    def test_unwatched_processed(self):
+        register_events(self.watched, self.cambios)
+        register_events(self.unwatched, self.cambios)
+        self.assertEqual(self.processed(self.watched), {EVENT_DROPPED: False, EVENT_DNS_CHANGED: True})
+        self.assertEqual(self.processed(self.unwatched), {EVENT_DROPPED: True, EVENT_DNS_CHANGED: True})
+
+    @override_settings(UNWATCHED_EVENTS='skip')
+    def test_unwatched_skipped(self):
+        register_events(self.watched, self.cambios)
+        register_events(self.unwatched, self.cambios)
+        self.assertEqual(self.processed(self.watched), {EVENT_DROPPED: False})
+        self.assertEqual(self.processed(self.unwatched), {})
+
+    @override_settings(UNWATCHED_EVENTS='keep')
+    def test_unwatched_kept(self):
+        register_events(self.unwatched, self.cambios)
+        self.assertEqual(self.processed(self.unwatched), {EVENT_DROPPED: False, EVENT_DNS_CHANGED: False})
+
+    @override_settings(SUBSCRIPTIONS_INTEREST_CACHE_SECONDS=300)
+    def test_signals(self):
+        self.assertTrue(interest.is_watched(self.ct.id, self.watched.id, EVENT_DROPPED))
+        self.assertFalse(interest.is_watched(self.ct.id, self.watched.id, EVENT_RENEWED))
+        # cached
+        with self.assertNumQueries(0):
+            interest.is_watched(self.ct.id, self.unwatched.id, EVENT_DROPPED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscription.event_types = [EVENT_DROPPED, EVENT_RENEWED]
+            self.subscription.save()
+        self.assertTrue(interest.is_watched(self.ct.id, self.watched.id, EVENT_RENEWED))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscription.is_active = False
+            self.subscription.save()
+        self.assertFalse(interest.is_watched(self.ct.id, self.watched.id, EVENT_DROPPED))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            target = SubscriptionTarget.objects.create(content_type=self.ct, object_id=self.unwatched.id)
+            UserSubscription.objects.create(user=self.user, target=target, event_types=[EVENT_DROPPED])
+        self.assertTrue(interest.is_watched(self.ct.id, self.unwatched.id, EVENT_DROPPED))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            target.delete()
+        self.assertFalse(interest.is_watched(self.ct.id, self.unwatched.id, EVENT_DROPPED))
+
+    def test_process_events_skips_unwatched(self):
+        register_events(self.watched, self.cambios)
+        register_events(self.unwatched, self.cambios)
+        out = StringIO()
+        call_command('process_events', stdout=out)
+        self.assertIn('Processed 1 events, created 1 notifications', out.getvalue())
+
+
+class DigestTestCase(TestCase):
+    """Tests for the daily / weekly digests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.zona = Zona.objects.create(nombre='com.ar', tz='America/Argentina/Buenos_Aires')
+        cls.ct = ContentType.objects.get_for_model(Registrante)
+        cls.daily_user = User.objects.create_user(username='daily', email='d@example.com', password='testpass123')
+        cls.weekly_user = User.objects.create_user(username='weekly', email='w@example.com', password='testpass123')
+        cls.immediate_user = User.objects.create_user(username='now', email='n@example.com', password='testpass123')
+        cls.registrantes = [
+            Registrante.objects.create(name=f'Registrante {n}', legal_uid=f'20-{n}', created=timezone.now(), changed=timezone.now())
+            for n in range(40)
+        ]
+        for registrante in cls.registrantes:
+            target = SubscriptionTarget.objects.create(content_type=cls.ct, object_id=registrante.id)
+            UserSubscription.objects.create(
+                user=cls.daily_user, target=target, event_types=[EVENT_DROPPED], delivery_mode='daily'
+            )
+            UserSubscription.objects.create(
+                user=cls.weekly_user, target=target, event_types=[EVENT_DROPPED, EVENT_RENEWED], delivery_mode='weekly'
+            )
+        UserSubscription.objects.create(
+            user=cls.immediate_user, target=target, event_types=[EVENT_DROPPED], delivery_mode='immediate'
+        )
+
+    def setUp(self):
+        self.since, self.until = last_period('daily')
+
+    def create_event(self, registrante, event_type=EVENT_DROPPED, created_at=None):
+        event = Event.objects.create(
+            event_type=event_type, content_type=self.ct, object_id=registrante.id,
+            event_data={'description': f'{registrante.name} {event_type}'}
+        )
+        if created_at is not None:
+            Event.objects.filter(id=event.id).update(created_at=created_at)
+        return event
+
+    def digests(self, user):
+        return UserNotification.objects.filter(user=user, notification_type='digest')
+
+    def test_period_range(self):
+        since, until = period_range('weekly', date(2026, 10, 14))
+        self.assertEqual(timezone.localtime(since).date(), date(2026, 10, 12))
+        self.assertEqual(timezone.localtime(until).date(), date(2026, 10, 19))
+        since, until = last_period('daily', today=date(2026, 10, 14))
+        self.assertEqual(timezone.localtime(since).date(), date(2026, 10, 13))
+        self.assertEqual(until - since, timedelta(days=1))
+
+    def test_one_digest_per_user(self):
+        inside = self.since + timedelta(hours=1)
+        events = [self.create_event(registrante, created_at=inside) for registrante in self.registrantes]
+        # not followed by the daily user, before the period and today
+        self.create_event(self.registrantes[0], EVENT_RENEWED, created_at=inside)
+        self.create_event(self.registrantes[1], created_at=self.since - timedelta(seconds=1))
+        self.create_event(self.registrantes[2])
+
+        # no single notifications for the daily and weekly subscriptions
+        call_command('process_events', stdout=StringIO())
+        self.assertEqual(UserNotification.objects.filter(notification_type='single').count(), 1)
+        self.assertFalse(UserNotification.objects.filter(user__in=[self.daily_user, self.weekly_user]).exists())
+
+        with self.assertNumQueries(8):
+            notifications = build_digests('daily', self.since, self.until)
+        self.assertEqual(len(notifications), 1)
+
+        digest = self.digests(self.daily_user).get()
+        self.assertIsNone(digest.event)
+        self.assertEqual(digest.grouped_events, [event.id for event in events])
+        self.assertEqual(digest.title, 'Resumen diario: 40 novedades')
+        self.assertEqual(digest.summary, 'Dominio Caido: 40')
+        self.assertEqual(digest.event_data['counts'], {EVENT_DROPPED: 40})
+        self.assertEqual(digest.event_date, timezone.localtime(self.since).date())
+        lines = digest.event_data['description'].split('\n')
+        self.assertEqual(len(lines), DIGEST_MAX_LINES + 1)
+        self.assertEqual(lines[-1], '... y 10 novedades más')
+        self.assertIsNotNone(UserSubscription.objects.filter(user=self.daily_user).first().last_notified_at)
+        self.assertFalse(self.digests(self.weekly_user).exists())
+
+    def test_rerun(self):
+        self.create_event(self.registrantes[0], created_at=self.since + timedelta(hours=1))
+        out = StringIO()
+        call_command('build_digests', '--period', 'daily', stdout=out)
+        call_command('build_digests', '--period', 'daily', stdout=out)
+        self.assertEqual(self.digests(self.daily_user).count(), 1)
+        self.assertIn('1 digests', out.getvalue())
+        self.assertIn('0 digests', out.getvalue())
+
+    def test_weekly(self):
+        since, until = last_period('weekly')
+        self.create_event(self.registrantes[0], created_at=since)
+        self.create_event(self.registrantes[1], EVENT_RENEWED, created_at=until - timedelta(seconds=1))
+        self.create_event(self.registrantes[2], created_at=until)
+        call_command('build_digests', '--period', 'weekly', stdout=StringIO())
+        digest = self.digests(self.weekly_user).get()
+        self.assertEqual(digest.title, 'Resumen semanal: 2 novedades')
+        self.assertEqual(digest.summary, 'Dominio Renovado: 1, Dominio Caido: 1')
+        self.assertEqual(digest.event_data['period'], 'weekly')
+
+    def test_dry_run(self):
+        self.create_event(self.registrantes[0], created_at=self.since + timedelta(hours=1))
+        out = StringIO()
+        call_command('build_digests', '--dry-run', stdout=out)
+        self.assertIn('Would send digest to daily', out.getvalue())
+        self.assertFalse(self.digests(self.daily_user).exists())
+
+    def test_period_not_over(self):
+        self.create_event(self.registrantes[0])
+        out = StringIO()
+        call_command('build_digests', '--date', timezone.localdate().isoformat(), stdout=out)
+        self.assertIn('is not over yet', out.getvalue())
+        self.assertFalse(self.digests(self.daily_user).exists())
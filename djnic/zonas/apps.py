@@ -3,3 +3,14 @@ from django.apps import AppConfig
 
 class ZonasConfig(AppConfig):
     name = 'zonas'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from zonas.models import Zona
+        from zonas.registry import zones
+
+        def invalidate_zones(sender, **kwargs):
+            zones.invalidate()
+
+        post_save.connect(invalidate_zones, sender=Zona, dispatch_uid='invalidate_zones_save')
+        post_delete.connect(invalidate_zones, sender=Zona, dispatch_uid='invalidate_zones_delete')
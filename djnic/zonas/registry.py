@@ -0,0 +1,91 @@
+""" Process wide cache of the Zona table.
+    Zone detection and zone resolution for a full domain without queries """
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+
+
+def split_domain(domain):
+    """ Same as WhoAre.detect_zone: the first label is the domain name
+        and the rest is the zone """
+    parts = domain.lower().strip().split('.')
+    return parts[0], '.'.join(parts[1:])
+
+
+class ZoneRegistry:
+    """ Zona objects by name, loaded from the database just once.
+        Invalidated on Zona save/delete (see ZonasConfig.ready) """
+
+    def __init__(self):
+        self._zonas = None
+        self._loaded = 0
+        # negative cache: unknown zone name -> when it was looked up
+        self._missing = {}
+        self.lock = threading.Lock()
+
+    def _get_zonas(self):
+        zonas = self._zonas
+        # reload from time to time to see the changes from other processes
+        if zonas is None or time.monotonic() - self._loaded >= settings.ZONES_CACHE_SECONDS:
+            zonas = self.load()
+        return zonas
+
+    def load(self):
+        from zonas.models import Zona
+
+        zonas = {zona.nombre: zona for zona in Zona.objects.all()}
+        with self.lock:
+            self._zonas = zonas
+            self._loaded = time.monotonic()
+            self._missing = {}
+        return zonas
+
+    def invalidate(self):
+        with self.lock:
+            self._zonas = None
+            self._missing = {}
+
+    def add(self, zona):
+        if connection.in_atomic_block:
+            # it could be rolled back
+            transaction.on_commit(lambda: self.add(zona))
+            return
+        with self.lock:
+            self._missing.pop(zona.nombre, None)
+            if self._zonas is not None:
+                # don't change the dict other threads could be reading
+                self._zonas = dict(self._zonas, **{zona.nombre: zona})
+
+    def get(self, nombre):
+        """ Zona object or None if not exists """
+        zona = self._get_zonas().get(nombre)
+        if zona is None:
+            missed = self._missing.get(nombre)
+            if missed is not None and time.monotonic() - missed < settings.ZONES_CACHE_SECONDS:
+                return None
+            # maybe created by other process
+            from zonas.models import Zona
+            zona = Zona.objects.filter(nombre=nombre).first()
+            if zona is not None:
+                self.add(zona)
+            else:
+                with self.lock:
+                    self._missing[nombre] = time.monotonic()
+        return zona
+
+    def get_or_create(self, nombre):
+        zona = self._get_zonas().get(nombre)
+        if zona is None:
+            from zonas.models import Zona
+            zona, _ = Zona.objects.get_or_create(nombre=nombre)
+            self.add(zona)
+        return zona
+
+    def detect(self, domain):
+        """ Domain name and Zona object (None if the zone doesn't exist) """
+        domain_name, zone = split_domain(domain)
+        return domain_name, self.get(zone)
+
+
+zones = ZoneRegistry()
@@ -1,3 +1,46 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from dominios.models import Dominio, PreDominio
+from zonas.models import Zona
+from zonas.registry import split_domain, zones
 
-# Create your tests here.
+
+@override_settings(ZONES_CACHE_SECONDS=300)
+class ZoneRegistryTest(TestCase):
+
+    def setUp(self):
+        zones.invalidate()
+        self.addCleanup(zones.invalidate)
+        self.zona = Zona.objects.create(nombre='com.ar')
+
+    def test_split_like_whoare(self):
+        self.assertEqual(split_domain(' Fernet.COM.ar '), ('fernet', 'com.ar'))
+        self.assertEqual(split_domain('www.fernet.com.ar'), ('www', 'fernet.com.ar'))
+
+    def test_detect_without_queries(self):
+        zones.load()
+        with self.assertNumQueries(0):
+            self.assertEqual(zones.detect('fernet.com.ar'), ('fernet', self.zona))
+            self.assertEqual(zones.get_or_create('com.ar'), self.zona)
+
+    def test_invalidated_on_save(self):
+        zones.load()
+        nueva = Zona.objects.create(nombre='gob.ar')
+        with self.assertNumQueries(1):
+            self.assertEqual(zones.get('gob.ar'), nueva)
+            self.assertEqual(zones.get('com.ar'), self.zona)
+
+    def test_unknown_zones_cached(self):
+        zones.load()
+        with self.assertNumQueries(1):
+            self.assertIsNone(zones.get('com.uy'))
+            self.assertIsNone(zones.detect('fernet.com.uy')[1])
+        # Zona.save invalidates the cache
+        nueva = Zona.objects.create(nombre='com.uy')
+        self.assertEqual(zones.get('com.uy'), nueva)
+
+    def test_unknown_zones(self):
+        self.assertIsNone(zones.detect('fernet.com.uy')[1])
+        self.assertIs(PreDominio.get_domain('fernet.com.uy'), False)
+        self.assertIsNone(PreDominio.get_domain('fernet.com.ar'))
+        self.assertIsNone(Dominio.get_from_full_domain('fernet.net.ar'))
+        self.assertTrue(Zona.objects.filter(nombre='net.ar').exists())